@@ -0,0 +1,72 @@
+"""Benchmark: full RGB decode + LANCZOS resize vs the reduced-resolution grayscale decode path.
+
+Usage: python scripts/bench_decode.py [--repeat N] [--synthetic] [images...]
+"""
+import argparse
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from src.batch import collect_images  # noqa: E402
+from src.image_handler import decode_for_ocr, load_image, resize_image  # noqa: E402
+
+
+def legacy_decode(path: str) -> Image.Image:
+    return resize_image(load_image(path)).convert("L")
+
+
+def median_ms(fn, path: str, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(path)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+def synthetic_photo(directory: Path) -> Path:
+    """A 12 MP phone-camera sized JPEG with some text on it."""
+    img = Image.new("RGB", (4032, 3024), color=(235, 230, 220))
+    d = ImageDraw.Draw(img)
+    for i in range(40):
+        d.text((100, 60 + i * 70), f"Line {i}: service mesh sidecar proxy ingress gateway", fill=(20, 20, 20))
+    path = directory / "synthetic_12mp.jpg"
+    img.save(path, quality=90)
+    return path
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("images", nargs="*", default=[str(Path(__file__).resolve().parents[1] / "examples")])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--synthetic", action="store_true", help="also benchmark a generated 12 MP JPEG")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as td:
+        paths = collect_images(args.images)
+        if args.synthetic:
+            paths.append(synthetic_photo(Path(td)))
+
+        print(f"{'image':40} {'source':>11} {'decoded':>11} {'legacy':>10} {'reduced':>10} {'mem saved':>10}")
+        total_legacy = total_reduced = 0.0
+        for path in paths:
+            legacy = median_ms(legacy_decode, str(path), args.repeat)
+            reduced = median_ms(lambda p: decode_for_ocr(p), str(path), args.repeat)
+            _, stats = decode_for_ocr(str(path))
+            total_legacy += legacy
+            total_reduced += reduced
+            src = "x".join(map(str, stats["source_size"]))
+            dec = "x".join(map(str, stats["decoded_size"]))
+            print(f"{path.name[:40]:40} {src:>11} {dec:>11} {legacy:>8.1f}ms {reduced:>8.1f}ms {stats['memory_saved_bytes'] / 1e6:>8.1f}MB")
+
+        print(f"{'total':40} {'':>11} {'':>11} {total_legacy:>8.1f}ms {total_reduced:>8.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
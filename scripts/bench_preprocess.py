@@ -0,0 +1,68 @@
+"""Micro-benchmark: legacy PIL preprocessing chain vs the NumPy engine on examples/ images.
+
+Usage: python scripts/bench_preprocess.py [--repeat N] [images...]
+"""
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image, ImageEnhance, ImageOps
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from src.batch import collect_images  # noqa: E402
+from src.image_handler import resize_image  # noqa: E402
+from src.preprocess import preprocess  # noqa: E402
+
+
+def legacy_preprocess(img: Image.Image) -> Image.Image:
+    """The original multi-pass PIL chain, kept here as the reference."""
+    proc_img = img.convert("L")
+    proc_img = ImageEnhance.Contrast(proc_img).enhance(2.0)
+    proc_img = ImageOps.autocontrast(proc_img)
+    return proc_img.point(lambda x: 255 if x > 180 else 0, mode='1')
+
+
+def timeit(fn, img, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(img)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("images", nargs="*", default=[str(Path(__file__).resolve().parents[1] / "examples")])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    variants = {
+        "legacy_pil": legacy_preprocess,
+        "numpy_fixed": lambda im: preprocess(im, method="fixed"),
+        "numpy_sauvola": lambda im: preprocess(im, method="sauvola"),
+        "numpy_niblack": lambda im: preprocess(im, method="niblack"),
+    }
+    totals = {name: 0.0 for name in variants}
+
+    print(f"{'image':40} {'size':>11} " + " ".join(f"{n:>14}" for n in variants) + "  fixed==legacy")
+    for path in collect_images(args.images):
+        img = resize_image(Image.open(path).convert("RGB"))
+        row = {name: timeit(fn, img, args.repeat) for name, fn in variants.items()}
+        for name, ms in row.items():
+            totals[name] += ms
+        same = np.array_equal(np.asarray(legacy_preprocess(img)), np.asarray(preprocess(img, method="fixed")))
+        size = f"{img.size[0]}x{img.size[1]}"
+        print(f"{path.name[:40]:40} {size:>11} " + " ".join(f"{row[n]:>12.1f}ms" for n in variants) + f"  {same}")
+
+    print(f"{'total':40} {'':>11} " + " ".join(f"{totals[n]:>12.1f}ms" for n in variants))
+    if totals["numpy_fixed"] > 0:
+        print(f"speedup numpy_fixed vs legacy_pil: {totals['legacy_pil'] / totals['numpy_fixed']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
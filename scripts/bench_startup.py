@@ -0,0 +1,86 @@
+"""Startup-time benchmark for short CLI invocations.
+
+Runs `python -X importtime -m src.main ...` for a few cheap invocations (`--help`, a file
+rejected by `is_filename_in_desired_format`), reports wall time and cumulative import time
+per module, and fails when a budget is exceeded or a heavy backend module is imported.
+
+Usage: python scripts/bench_startup.py [--repeat N] [--budget-ms MS] [--help-budget-ms MS]
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+ROOT = Path(__file__).resolve().parents[1]
+
+# modules that short invocations must not import
+HEAVY_MODULES = ("openai", "PIL", "numpy", "pytesseract", "Vision", "src.image_handler", "src.llm_integration")
+# modules worth reporting even when they are cheap
+REPORT_PREFIXES = ("src", "typer", "rich", "click", "dotenv") + HEAVY_MODULES
+
+
+def parse_importtime(stderr: str) -> Dict[str, int]:
+    """Return cumulative import time in microseconds per imported module."""
+    out: Dict[str, int] = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        out[parts[2].strip()] = int(parts[1])
+    return out
+
+
+def run_once(args: List[str], importtime: bool = False) -> Tuple[float, Dict[str, int]]:
+    flags = ["-X", "importtime"] if importtime else []
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, *flags, "-m", "src.main", *args], cwd=ROOT, capture_output=True, text=True)
+    return time.perf_counter() - start, parse_importtime(proc.stderr)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=150.0, help="max median wall time of the early-exit invocation")
+    parser.add_argument("--help-budget-ms", type=float, default=400.0, help="max median wall time of --help (rich help rendering)")
+    args = parser.parse_args()
+
+    failed = False
+    with tempfile.TemporaryDirectory() as td:
+        done = Path(td) / "Service Mesh [mesh] - 20251115123045.png"
+        done.write_bytes(b"")
+        cases = [
+            ("--help", ["--help"], args.help_budget_ms),
+            ("analyze (already named)", ["analyze", str(done)], args.budget_ms),
+        ]
+        for label, cli_args, budget in cases:
+            # wall time without -X importtime, which adds its own overhead
+            walls = [run_once(cli_args)[0] for _ in range(args.repeat)]
+            _, modules = run_once(cli_args, importtime=True)
+            median_ms = statistics.median(walls) * 1000
+            print(f"{label}: median {median_ms:.1f} ms over {args.repeat} runs (budget {budget:.0f} ms)")
+            top = sorted(
+                ((name, us) for name, us in modules.items() if name.split(".")[0] in REPORT_PREFIXES),
+                key=lambda x: -x[1],
+            )[:10]
+            for name, us in top:
+                print(f"    {us / 1000:8.1f} ms  {name}")
+
+            heavy = sorted(m for m in modules if m in HEAVY_MODULES or m.split(".")[0] in HEAVY_MODULES)
+            if heavy:
+                print(f"  FAIL: heavy modules imported: {', '.join(heavy)}")
+                failed = True
+            if median_ms > budget:
+                print("  FAIL: over budget")
+                failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
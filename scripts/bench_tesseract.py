@@ -0,0 +1,91 @@
+"""Benchmark: per-call pytesseract vs the persistent / batched Tesseract engines.
+
+Images are decoded and preprocessed once; only the Tesseract call is timed. The
+per-call pytesseract path is the reference for the recognized text.
+
+Usage: python scripts/bench_tesseract.py [--repeat N] [--synthetic N] [images...]
+"""
+import argparse
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from src.batch import collect_images  # noqa: E402
+from src.image_handler import prepare_for_tesseract  # noqa: E402
+from src.tesseract_pool import _ENGINE_CLASSES, select_engine_name  # noqa: E402
+
+
+def synthetic_screenshots(directory: Path, count: int):
+    """Small screenshot-like images with a few lines of text each."""
+    paths = []
+    for i in range(count):
+        img = Image.new("RGB", (800, 240), color=(250, 250, 250))
+        d = ImageDraw.Draw(img)
+        for j in range(4):
+            d.text((20, 20 + j * 50), f"Screenshot {i} line {j}: ingress gateway sidecar", fill=(20, 20, 20))
+        path = directory / f"synthetic_{i}.png"
+        img.save(path)
+        paths.append(path)
+    return paths
+
+
+def timed(fn, repeat: int):
+    times = []
+    out = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), out
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("images", nargs="*", default=[str(Path(__file__).resolve().parents[1] / "examples")])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--synthetic", type=int, default=0, metavar="N", help="also benchmark N generated screenshots")
+    args = parser.parse_args()
+
+    # the per-call path first: it is the baseline for time and text
+    available = [name for name in ("pytesseract", "pipe", "tesserocr") if select_engine_name(name)]
+    if not available:
+        print("error: no Tesseract engine available (install tesseract or tesserocr)", file=sys.stderr)
+        return 2
+
+    with tempfile.TemporaryDirectory() as td:
+        paths = collect_images(args.images)
+        if args.synthetic:
+            paths += synthetic_screenshots(Path(td), args.synthetic)
+        images = [prepare_for_tesseract(str(p)) for p in paths]
+        print(f"{len(images)} images, engines: {', '.join(available)}")
+
+        reference = None
+        runs = []
+        for name in available:
+            engine = _ENGINE_CLASSES[name]()
+            engine.recognize(images[0])  # start-up (model loading) is not part of the per-image figures
+            runs.append((f"{name} (per image)", lambda e=engine: [e.recognize(img) for img in images]))
+            if engine.batches:
+                runs.append((f"{name} (batched)", lambda e=engine: e.recognize_many(images)))
+
+        print(f"{'engine':28} {'total':>10} {'per image':>10} {'speedup':>8} {'same text':>10}")
+        base = None
+        for label, fn in runs:
+            secs, texts = timed(fn, args.repeat)
+            texts = [t.strip() for t in texts]
+            if reference is None:
+                reference = texts
+                base = secs
+            same = sum(a == b for a, b in zip(texts, reference))
+            print(f"{label:28} {secs * 1000:>8.1f}ms {secs * 1000 / len(images):>8.1f}ms {base / secs:>7.2f}x {same:>5}/{len(images)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
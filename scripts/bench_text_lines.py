@@ -0,0 +1,80 @@
+"""Benchmark: original quadratic line grouping vs the sweep-line grouping on synthetic box sets.
+
+Usage: python scripts/bench_text_lines.py [--sizes 1000,10000,50000] [--legacy-max 20000]
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from src.text_lines import group_text_lines  # noqa: E402
+
+
+def legacy_merge_text_boxes(results, y_tolerance=0.02, max_dist=0.05):
+    """The original implementation, kept here as the reference."""
+    rows = []
+    for text, box in sorted(results, key=lambda x: x[1][0][0]):
+        line_merged = False
+        (bx, by), (bw, bh) = box
+        for r in rows:
+            _, ((rx, ry), (rw, rh)) = r[-1]
+            if abs(by - ry) < y_tolerance and (bx - (rx + rw)) < max_dist:
+                r.append((text, box))
+                line_merged = True
+                break
+        if not line_merged:
+            rows.append([(text, box)])
+    rows = sorted(rows, key=lambda x: x[0][1][0][1], reverse=True)
+    return [" ".join([t for t, _ in row]) for row in rows]
+
+
+def synthetic_boxes(n: int, columns: int = 4, seed: int = 0):
+    """A dense architecture-diagram-like layout: `columns` text columns, short fragments with jitter.
+    Returns boxes in normalized Vision coordinates and the expected number of lines."""
+    rng = random.Random(seed)
+    words_per_line = 5
+    lines_per_column = max(1, n // (columns * words_per_line))
+    line_h = 1.0 / (lines_per_column + 1)
+    col_w = 1.0 / columns
+    word_w = col_w / (words_per_line + 2)
+    boxes = []
+    for c in range(columns):
+        for li in range(lines_per_column):
+            y = 1.0 - (li + 1) * line_h
+            for wi in range(words_per_line):
+                x = c * col_w + wi * word_w * 1.1
+                jitter = rng.uniform(-0.1, 0.1) * line_h
+                boxes.append((f"w{c}_{li}_{wi}", ((x, y + jitter), (word_w, line_h * 0.6))))
+    rng.shuffle(boxes)
+    return boxes, columns * lines_per_column
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,50000")
+    parser.add_argument("--legacy-max", type=int, default=20000, help="skip the quadratic version above this size")
+    args = parser.parse_args()
+
+    print(f"{'boxes':>8} {'lines':>7} {'sweep':>10} {'legacy':>10} {'sweep lines':>12} {'legacy lines':>13}")
+    for n in (int(s) for s in args.sizes.split(",")):
+        boxes, expected = synthetic_boxes(n)
+        # scale the vertical tolerance with the line height of the synthetic layout;
+        # 0.02 is wider than the word gap and narrower than the column gap
+        tol = 0.3 / (expected / 4 + 1)
+        gap = 0.02
+        start = time.perf_counter()
+        lines = group_text_lines(boxes, y_tolerance=tol, max_dist=gap)
+        sweep = time.perf_counter() - start
+        legacy, legacy_lines = "skipped", "-"
+        if n <= args.legacy_max:
+            start = time.perf_counter()
+            legacy_lines = len(legacy_merge_text_boxes(boxes, y_tolerance=tol, max_dist=gap))
+            legacy = f"{(time.perf_counter() - start) * 1000:.0f}ms"
+        print(f"{len(boxes):>8} {expected:>7} {sweep * 1000:>8.0f}ms {legacy:>10} {len(lines):>12} {legacy_lines:>13}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""Reproducible benchmark of the offline pipeline and each of its stages, with baseline comparison.
+
+Runs every stage on its own (load_image, resize_image, decode_for_ocr, preprocess_for_ocr,
+OCR, merge_text_boxes, clean_ocr_text, build_final_filename) and the full offline pipeline
+(decode -> preprocess -> OCR -> cleanup -> heuristic naming -> filename; the LLM is left out,
+it is neither local nor reproducible) over the `examples/` images plus generated synthetic
+diagrams. Writes latency percentiles, throughput and peak RSS (per stage: the process peak
+once that stage has run) as JSON, and compares them with a stored baseline.
+
+Usage:
+    python scripts/benchmark.py [--repeat N] [--synthetic N] [--output results.json]
+    python scripts/benchmark.py --update-baseline          # store the current numbers
+    python scripts/benchmark.py --baseline benchmarks/baseline.json --tolerance 0.25
+
+Exits with 1 when a stage is slower (or memory higher) than the baseline beyond the tolerance.
+Baselines are machine specific: create one per machine/CI runner with --update-baseline.
+"""
+import argparse
+import json
+import platform
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+from PIL import Image, ImageDraw
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from src.batch import collect_images  # noqa: E402
+from src.image_handler import (  # noqa: E402
+    clean_ocr_text,
+    decode_for_ocr,
+    has_ocr_backend,
+    load_image,
+    merge_text_boxes,
+    prepare_for_tesseract,
+    preprocess_for_ocr,
+    resize_image,
+)
+from src.naming_engine import build_final_filename, heuristic_name  # noqa: E402
+from src.utils import percentile  # noqa: E402
+
+DEFAULT_BASELINE = ROOT / "benchmarks" / "baseline.json"
+SCHEMA_VERSION = 1
+
+LABELS = ["API Gateway", "Auth Service", "User DB", "Message Queue", "Worker Pool", "Object Storage",
+          "Load Balancer", "Cache Cluster", "Metrics", "Ingress", "Billing", "Search Index"]
+
+
+def synthetic_diagram(directory: Path, index: int, nodes: int = 12):
+    """A box-and-arrow architecture diagram with labels. Returns the image path and the
+    label boxes in normalized Vision coordinates (origin bottom-left), one per word."""
+    rng = random.Random(index)
+    # alternate screen-sized and oversized (resized before OCR) diagrams
+    w, h = size = (1600, 1000) if index % 2 == 0 else (3200, 2000)
+    img = Image.new("RGB", size, color=(248, 248, 245))
+    d = ImageDraw.Draw(img)
+    boxes = []
+    centers = []
+    for n in range(nodes):
+        bw, bh = rng.randint(160, 260), rng.randint(60, 90)
+        x, y = rng.randint(20, w - bw - 20), rng.randint(20, h - bh - 20)
+        d.rectangle((x, y, x + bw, y + bh), outline=(40, 60, 90), width=3, fill=(225, 235, 250))
+        label = f"{LABELS[(n + index) % len(LABELS)]} {n}"
+        tx, ty = x + 12, y + bh // 2 - 6
+        d.text((tx, ty), label, fill=(15, 15, 15))
+        for wi, word in enumerate(label.split()):
+            wx = tx + wi * 60
+            boxes.append((word, ((wx / w, 1 - (ty + 12) / h), (55 / w, 12 / h))))
+        centers.append((x + bw // 2, y + bh // 2))
+    for a, b in zip(centers, centers[1:]):
+        d.line((a, b), fill=(90, 90, 90), width=2)
+    path = directory / f"synthetic_diagram_{index}.png"
+    img.save(path)
+    return path, boxes
+
+
+def measure(fn: Callable[[Any], Any], inputs: List[Any], repeat: int) -> Dict[str, Any]:
+    """Time `fn` on every input `repeat` times; latency percentiles in ms and items per second."""
+    times = []
+    for _ in range(repeat):
+        for item in inputs:
+            start = time.perf_counter()
+            fn(item)
+            times.append(time.perf_counter() - start)
+    total = sum(times)
+    return {
+        "count": len(times),
+        "p50_ms": round(percentile(times, 50) * 1000, 3),
+        "p95_ms": round(percentile(times, 95) * 1000, 3),
+        "p99_ms": round(percentile(times, 99) * 1000, 3),
+        "mean_ms": round(statistics.mean(times) * 1000, 3) if times else 0.0,
+        "throughput_per_s": round(len(times) / total, 2) if total > 0 else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far (ru_maxrss is KB on Linux, bytes on macOS)."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def ocr_engine_name() -> Any:
+    if not has_ocr_backend(True):
+        return None
+    from src.tesseract_pool import get_engine
+    return get_engine().name
+
+
+def full_pipeline(path: str, ocr=None) -> str:
+    """Decode -> preprocess -> OCR (when an engine is installed) -> cleanup -> naming -> filename."""
+    img = prepare_for_tesseract(path)
+    text = clean_ocr_text(ocr.recognize(img) if ocr is not None else "")
+    result = heuristic_name(path, text)
+    return build_final_filename(result.get("title"), result.get("keywords"), Path(path).suffix)
+
+
+def run_benchmark(image_paths: List[Path], box_sets: List[list], repeat: int) -> Dict[str, Any]:
+    paths = [str(p) for p in image_paths]
+    engine = ocr_engine_name()
+    stages: Dict[str, Dict[str, Any]] = {}
+
+    # Image.open is lazy: force the decode so the stage measures it
+    stages["load_image"] = measure(lambda p: load_image(p).load(), paths, repeat)
+    loaded = [load_image(p) for p in paths]
+    for img in loaded:
+        img.load()
+    stages["resize_image"] = measure(resize_image, loaded, repeat)
+    stages["decode_for_ocr"] = measure(decode_for_ocr, paths, repeat)
+    decoded = [decode_for_ocr(p)[0] for p in paths]
+    stages["preprocess_for_ocr"] = measure(preprocess_for_ocr, decoded, repeat)
+    prepared = [preprocess_for_ocr(img) for img in decoded]
+    del loaded, decoded
+
+    ocr = None
+    if engine is not None:
+        from src.tesseract_pool import get_engine
+        ocr = get_engine()
+        stages["ocr"] = measure(ocr.recognize, prepared, repeat)
+        texts = [ocr.recognize(img) for img in prepared]
+    else:
+        # no Tesseract here: clean up the synthetic diagrams' labels instead
+        texts = ["\n".join(f"{word} | {word.lower()}  ©" for word, _ in boxes) for boxes in box_sets]
+
+    stages["merge_text_boxes"] = measure(merge_text_boxes, box_sets, repeat * 10)
+    stages["clean_ocr_text"] = measure(clean_ocr_text, texts, repeat * 10)
+    names = [heuristic_name(p, clean_ocr_text(t)) for p, t in zip(paths, texts)] or [{"title": "Service Mesh", "keywords": ["mesh"]}]
+    stages["build_final_filename"] = measure(
+        lambda r: build_final_filename(r.get("title"), r.get("keywords"), ".png"), names, repeat * 10)
+    stages["full_pipeline"] = measure(lambda p: full_pipeline(p, ocr), paths, repeat)
+
+    return {
+        "schema": SCHEMA_VERSION,
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "images": len(paths),
+            "repeat": repeat,
+            "ocr_engine": engine,
+        },
+        "stages": stages,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float, min_ms: float) -> List[str]:
+    """Return one message per regression of `current` against `baseline`."""
+    problems = []
+    for key in ("images", "ocr_engine"):
+        if current["meta"].get(key) != baseline["meta"].get(key):
+            print(f"warning: {key} differs from the baseline ({baseline['meta'].get(key)} -> {current['meta'].get(key)})", file=sys.stderr)
+    for name, base in baseline["stages"].items():
+        cur = current["stages"].get(name)
+        if cur is None:
+            continue
+        for metric in ("p50_ms", "p95_ms"):
+            # relative and absolute slack, so sub-millisecond stages do not flap on noise
+            if cur[metric] > base[metric] * (1 + tolerance) and cur[metric] - base[metric] > min_ms:
+                problems.append(f"{name}.{metric}: {base[metric]:.3f} -> {cur[metric]:.3f} ms")
+    if current["peak_rss_mb"] > baseline["peak_rss_mb"] * (1 + tolerance):
+        problems.append(f"peak_rss_mb: {baseline['peak_rss_mb']} -> {current['peak_rss_mb']}")
+    return problems
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("images", nargs="*", default=[str(ROOT / "examples")])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--synthetic", type=int, default=4, metavar="N", help="number of generated diagrams to add")
+    parser.add_argument("--output", type=Path, help="write the results JSON here (default: stdout)")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative slowdown per stage")
+    parser.add_argument("--min-ms", type=float, default=0.5, help="ignore slowdowns smaller than this (ms)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as td:
+        paths = collect_images(args.images)
+        box_sets = []
+        for i in range(args.synthetic):
+            path, boxes = synthetic_diagram(Path(td), i)
+            paths.append(path)
+            box_sets.append(boxes)
+        if not paths:
+            print("error: no benchmark images", file=sys.stderr)
+            return 2
+        results = run_benchmark(paths, box_sets or [[("empty", ((0, 0), (0, 0)))]], args.repeat)
+
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        args.output.write_text(text + "\n")
+    else:
+        print(text)
+
+    if args.update_baseline:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(text + "\n")
+        print(f"baseline written to {args.baseline}", file=sys.stderr)
+        return 0
+    if not args.baseline.exists():
+        print(f"no baseline at {args.baseline}; run with --update-baseline to create one", file=sys.stderr)
+        return 0
+
+    baseline = json.loads(args.baseline.read_text())
+    problems = compare(results, baseline, args.tolerance, args.min_ms)
+    for p in problems:
+        print(f"REGRESSION {p}", file=sys.stderr)
+    if not problems:
+        print(f"no regressions against {args.baseline}", file=sys.stderr)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,193 @@
+"""Load test: the naming pipeline against the local stub LLM server.
+
+Starts `src.stub_llm_server` in this process (or uses --url), points the Ollama backend at it
+and names --images synthetic OCR texts at each concurrency level through the real naming
+code: threads calling `name_from_ocr_text` (sequential batch runs), one `AsyncLLMPool`
+(--mode async, pipeline runs) or `name_many_from_ocr_texts` over groups of --group texts
+(--mode batch, batched requests). Reports throughput, per-image latency percentiles, how
+images were named, why the LLM fell back and the server's peak concurrency. In async mode all
+images are submitted at once, so their latency includes the wait for a free slot, as in
+pipeline runs.
+
+Usage: python scripts/loadtest_llm.py [--concurrency 1,4,16] [--images 200] [--mode threads|async|batch]
+       [--latency lognormal:0.3,0.5] [--error-rate 0.05] [--malformed-rate 0.05] [--url URL] [--json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from src.llm_integration import AsyncLLMPool, _has_openai  # noqa: E402
+from src.naming_engine import name_from_ocr_text, name_from_ocr_text_async, name_many_from_ocr_texts  # noqa: E402
+from src.resilience import reset_breakers  # noqa: E402
+from src.stub_llm_server import StubConfig, StubLLMServer  # noqa: E402
+from src.utils import percentile  # noqa: E402
+
+_SUBJECTS = ["Payment", "Order", "Service", "Network", "Cluster", "Ledger", "Identity", "Storage", "Billing", "Search"]
+_KINDS = ["Architecture", "Sequence Diagram", "Topology", "Data Flow", "Deployment", "Overview"]
+_WORDS = ["gateway", "queue", "replica", "sidecar", "scheduler", "database", "cache", "ingress", "broker", "worker"]
+
+
+def synthetic_ocr_texts(count: int, seed: int = 0) -> List[str]:
+    """OCR-like texts: a title line and a few lines of diagram labels, all different."""
+    rng = random.Random(seed)
+    texts = []
+    for i in range(count):
+        lines = [f"{rng.choice(_SUBJECTS)} {rng.choice(_KINDS)} {i}"]
+        lines += [" ".join(rng.sample(_WORDS, 4)) for _ in range(3)]
+        texts.append("\n".join(lines))
+    return texts
+
+
+def run_threads(texts: List[str], concurrency: int) -> List[Tuple[Dict[str, Any], float]]:
+    def one(item):
+        i, text = item
+        start = time.perf_counter()
+        named = name_from_ocr_text(f"image_{i}.png", text)
+        return named, time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(one, enumerate(texts)))
+
+
+def run_async(texts: List[str], concurrency: int) -> List[Tuple[Dict[str, Any], float]]:
+    async def main():
+        pool = AsyncLLMPool(max_in_flight=concurrency)
+
+        async def one(i, text):
+            start = time.perf_counter()
+            named = await name_from_ocr_text_async(f"image_{i}.png", text, pool)
+            return named, time.perf_counter() - start
+
+        try:
+            return await asyncio.gather(*(one(i, text) for i, text in enumerate(texts)))
+        finally:
+            await pool.aclose()
+
+    return asyncio.run(main())
+
+
+def run_batch(texts: List[str], concurrency: int, group: int) -> List[Tuple[Dict[str, Any], float]]:
+    def one(start_index):
+        items = [(f"image_{i}.png", texts[i]) for i in range(start_index, min(len(texts), start_index + group))]
+        start = time.perf_counter()
+        named = name_many_from_ocr_texts(items)
+        elapsed = time.perf_counter() - start
+        return [(n, elapsed) for n in named]
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return [r for chunk in pool.map(one, range(0, len(texts), group)) for r in chunk]
+
+
+def server_stats(server, url: str) -> Dict[str, Any]:
+    if server is not None:
+        return server.stats.as_dict()
+    try:
+        with urllib.request.urlopen(url.rstrip("/") + "/stats", timeout=5) as resp:
+            return json.loads(resp.read())
+    except Exception:
+        return {}
+
+
+def measure(mode: str, texts: List[str], concurrency: int, group: int, server, url: str) -> Dict[str, Any]:
+    reset_breakers()
+    if server is not None:
+        server.stats.reset()
+    start = time.perf_counter()
+    if mode == "async":
+        outcomes = run_async(texts, concurrency)
+    elif mode == "batch":
+        outcomes = run_batch(texts, concurrency, group)
+    else:
+        outcomes = run_threads(texts, concurrency)
+    elapsed = time.perf_counter() - start
+    latencies = [seconds for _, seconds in outcomes]
+    paths: Dict[str, int] = {}
+    fallbacks: Dict[str, int] = {}
+    for named, _ in outcomes:
+        paths[named.get("naming_path", "?")] = paths.get(named.get("naming_path", "?"), 0) + 1
+        if named.get("llm_fallback"):
+            fallbacks[named["llm_fallback"]] = fallbacks.get(named["llm_fallback"], 0) + 1
+    served = server_stats(server, url)
+    return {
+        "mode": mode,
+        "concurrency": concurrency,
+        "images": len(texts),
+        "elapsed_seconds": round(elapsed, 3),
+        "images_per_second": round(len(texts) / elapsed, 2) if elapsed > 0 else 0.0,
+        "latency_p50": round(percentile(latencies, 50), 3),
+        "latency_p95": round(percentile(latencies, 95), 3),
+        "latency_p99": round(percentile(latencies, 99), 3),
+        "llm_share": round(paths.get("llm", 0) / len(texts), 3),
+        "naming_paths": paths,
+        "fallbacks": fallbacks,
+        "server": served,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", default="1,4,16", help="comma-separated concurrency levels")
+    parser.add_argument("--images", type=int, default=200, help="OCR texts named per level")
+    parser.add_argument("--mode", choices=("threads", "async", "batch"), default="threads")
+    parser.add_argument("--group", type=int, default=8, help="texts per name_many_from_ocr_texts call (--mode batch)")
+    parser.add_argument("--url", default=None, help="use a running server instead of starting the stub")
+    parser.add_argument("--latency", default="lognormal:0.2,0.5", help="stub reply latency (see src/stub_llm_server.py)")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--chunk-delay", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print one JSON object per level instead of a table")
+    args = parser.parse_args()
+
+    if not _has_openai():
+        print("error: the openai package is required to drive the LLM path", file=sys.stderr)
+        return 2
+    try:
+        levels = [int(c) for c in args.concurrency.split(",")]
+    except ValueError:
+        print(f"error: invalid --concurrency \"{args.concurrency}\"", file=sys.stderr)
+        return 2
+
+    server = None
+    url = args.url
+    if url is None:
+        config = StubConfig(latency=args.latency, error_rate=args.error_rate, malformed_rate=args.malformed_rate,
+                            chunk_delay=args.chunk_delay, seed=args.seed)
+        server = StubLLMServer(config=config).start()
+        url = server.url
+    # the stub is the only backend, and every image goes to it
+    os.environ.update(OLLAMA_HOST=url, OLLAMA_MODEL="stub")
+    for name in ("OPENAI_API_KEY", "DPR_LOCAL_THRESHOLD"):
+        os.environ.pop(name, None)
+
+    texts = synthetic_ocr_texts(args.images, args.seed)
+    if not args.json:
+        print(f"{args.mode} against {url}, {args.images} images per level")
+        print(f"{'conc':>5} {'img/s':>8} {'p50':>7} {'p95':>7} {'p99':>7} {'llm':>6} {'peak':>5}  fallbacks")
+    try:
+        for concurrency in levels:
+            report = measure(args.mode, texts, concurrency, args.group, server, url)
+            if args.json:
+                print(json.dumps(report))
+                continue
+            fallbacks = ", ".join(f"{k} {v}" for k, v in sorted(report["fallbacks"].items())) or "-"
+            print(f"{concurrency:>5} {report['images_per_second']:>8.1f} {report['latency_p50']:>7.3f} {report['latency_p95']:>7.3f} "
+                  f"{report['latency_p99']:>7.3f} {report['llm_share']:>6.0%} {report['server'].get('peak_in_flight', '-'):>5}  {fallbacks}")
+    finally:
+        if server is not None:
+            server.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
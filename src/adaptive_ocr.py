@@ -0,0 +1,104 @@
+"""Adaptive OCR: extra preprocessing passes only for images the first pass reads badly.
+
+With $OCR_ADAPTIVE set, the Tesseract path OCRs the image once with the configured recipe
+and word-level confidences. When that gives a few words at a good mean confidence, it is
+the result, so clean images cost a single pass. Otherwise alternate passes run in
+parallel: other global thresholds, adaptive (Sauvola) thresholding, the inverted image
+for dark themes and sparse-text/single-block page segmentation, and the pass whose words
+score best is kept.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+# the first pass is enough with this many words (2+ letters or digits) at this mean confidence
+MIN_WORDS = 3
+MIN_CONFIDENCE = 75.0
+# global thresholds tried besides the configured one (lighter and darker text)
+ALT_THRESHOLDS = (140, 210)
+# tesseract page segmentation modes tried besides the default: sparse text, one uniform block
+ALT_PSMS = (11, 6)
+
+
+class OCRPass(NamedTuple):
+    """One recipe: binarization method, global threshold, inverted input, page segmentation mode."""
+    name: str
+    method: str
+    threshold: Optional[int] = None
+    invert: bool = False
+    psm: Optional[int] = None
+
+
+def adaptive_enabled() -> bool:
+    """$OCR_ADAPTIVE: 1/true/yes/on enables confidence-driven extra passes."""
+    return (os.environ.get("OCR_ADAPTIVE") or "").lower() in ("1", "true", "yes", "on")
+
+
+def real_words(words: list) -> list:
+    return [w for w in words if sum(c.isalnum() for c in w.text) >= 2]
+
+
+def is_confident(words: list, min_words: int = MIN_WORDS, min_confidence: float = MIN_CONFIDENCE) -> bool:
+    """True when a pass read enough words at a good enough mean confidence to stop there."""
+    real = real_words(words)
+    return len(real) >= min_words and sum(w.conf for w in real) / len(real) >= min_confidence
+
+
+def pass_score(words: list) -> float:
+    """Confidence-weighted amount of text: each real word counts (conf/100)**2, so a pass
+    that reads the same words more surely wins, and low-confidence noise adds little."""
+    return sum((max(0.0, w.conf) / 100) ** 2 for w in real_words(words))
+
+
+def alternate_passes(gray: Image.Image, first: OCRPass) -> List[OCRPass]:
+    """Recipes to try after `first`; the inverted one only for dark-themed images."""
+    from src.preprocess import has_dark_background
+
+    passes = [OCRPass(f"threshold {t}", "fixed", threshold=t) for t in ALT_THRESHOLDS if t != first.threshold]
+    if first.method != "sauvola":
+        passes.append(OCRPass("sauvola", "sauvola"))
+    if has_dark_background(np.asarray(gray, dtype=np.uint8)):
+        passes.append(OCRPass("inverted", first.method, threshold=first.threshold, invert=True))
+    passes += [first._replace(name=f"psm {psm}", psm=psm) for psm in ALT_PSMS]
+    return passes
+
+
+def ocr_adaptive(
+        gray: Image.Image,
+        engine,
+        binarize: Callable[[Image.Image, OCRPass], Image.Image],
+        first: OCRPass,
+        max_workers: Optional[int] = None,
+        ) -> Tuple[str, List[str], str]:
+    """OCR the grayscale `gray` with `first`, then with the alternate passes if it is not
+    confident. `binarize(img, pass)` applies a recipe. Returns (text, passes run, best pass).
+    With an engine that batches, the alternate passes sharing a page segmentation mode go
+    through one engine call instead of running in parallel."""
+    from src.tiling import stitch_words
+
+    def prepare(p: OCRPass) -> Image.Image:
+        return binarize(Image.eval(gray, lambda v: 255 - v) if p.invert else gray, p)
+
+    def run(p: OCRPass) -> list:
+        return engine.recognize_words(prepare(p), psm=p.psm)
+
+    words = run(first)
+    if is_confident(words):
+        return stitch_words(words, gray.size), [first.name], first.name
+    passes = alternate_passes(gray, first)
+    if getattr(engine, "batches", False):
+        found = {}
+        for psm in dict.fromkeys(p.psm for p in passes):
+            group = [p for p in passes if p.psm == psm]
+            found.update(zip(group, engine.recognize_words_many([prepare(p) for p in group], psm=psm)))
+        results = [(first, words)] + [(p, found[p]) for p in passes]
+    else:
+        workers = max(1, min(len(passes), max_workers or os.cpu_count() or 1))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = [(first, words)] + list(zip(passes, pool.map(run, passes)))
+    # max keeps the earliest of equal scores, so ties go to the configured recipe
+    best, best_words = max(results, key=lambda r: pass_score(r[1]))
+    return stitch_words(best_words, gray.size), [p.name for p, _ in results], best.name
@@ -0,0 +1,150 @@
+"""Batch processing: input collection and the multi-process OCR worker pool."""
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from src.instrumentation import tracing
+
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".webp", ".gif", ".bmp", ".tif", ".tiff", ".heic"}
+
+_GLOB_CHARS = set("*?[")
+
+
+def is_image_file(path: Path) -> bool:
+    return path.is_file() and path.suffix.lower() in IMAGE_EXTENSIONS
+
+
+def collect_images(inputs: Iterable[str], file_list: Optional[Path] = None, recursive: bool = False) -> List[Path]:
+    """Expand directories, glob patterns and an optional file list into image paths.
+
+    Directories are scanned for files with a known image extension (recursively when
+    `recursive` is set), glob patterns support `**`, and the file list holds one path
+    per line (blank lines and lines starting with '#' are ignored).
+    Order is preserved and duplicates are dropped.
+    """
+    items = list(inputs or [])
+    if file_list is not None:
+        for line in file_list.read_text(encoding="utf-8").splitlines():
+            line = line.strip()
+            if line and not line.startswith("#"):
+                items.append(line)
+
+    seen = set()
+    out: List[Path] = []
+
+    def add(p: Path) -> None:
+        key = os.path.abspath(p)
+        if key not in seen:
+            seen.add(key)
+            out.append(p)
+
+    for item in items:
+        if any(c in item for c in _GLOB_CHARS):
+            for match in sorted(glob.glob(item, recursive=True)):
+                p = Path(match)
+                if is_image_file(p):
+                    add(p)
+            continue
+
+        p = Path(item)
+        if p.is_dir():
+            entries = p.rglob("*") if recursive else p.iterdir()
+            for child in sorted(entries):
+                if is_image_file(child):
+                    add(child)
+        elif p.is_file():
+            # explicit files are accepted regardless of extension
+            add(p)
+        else:
+            print(f"warning: input not found \"{item}\"", file=sys.stderr)
+
+    return out
+
+
+# (image_path, ocr_text, ocr_seconds, error, stages recorded by the instrumentation)
+OCRResult = Tuple[str, str, float, Optional[str], Dict[str, Dict[str, Any]]]
+
+
+def _ocr_worker(args: Tuple[str, bool]) -> OCRResult:
+    """Run the OCR stage for a single image inside a worker process."""
+    image_path, force_tesseract = args
+    from src.image_handler import extract_text_with_ocr
+
+    start = time.perf_counter()
+    with tracing() as trace:
+        try:
+            text = extract_text_with_ocr(image_path, force_tesseract=force_tesseract)
+            return image_path, text, time.perf_counter() - start, None, trace.stages
+        except Exception as e:
+            return image_path, "", time.perf_counter() - start, str(e), trace.stages
+
+
+def _ocr_chunk_worker(args: Tuple[List[str], bool]) -> List[OCRResult]:
+    """Run the OCR stage for several images in one engine call (see `extract_texts_with_ocr`)."""
+    image_paths, force_tesseract = args
+    if len(image_paths) == 1:
+        return [_ocr_worker((image_paths[0], force_tesseract))]
+    from src.image_handler import extract_texts_with_ocr
+
+    start = time.perf_counter()
+    with tracing() as trace:
+        try:
+            texts = extract_texts_with_ocr(image_paths, force_tesseract=force_tesseract)
+        except Exception:
+            return [_ocr_worker((p, force_tesseract)) for p in image_paths]
+    # the engine call is shared, so each image is charged an equal part of it; the
+    # chunk's stages go with the first image so that totals over all files stay right
+    secs = (time.perf_counter() - start) / len(image_paths)
+    return [(p, text, secs, None, trace.stages if i == 0 else {}) for i, (p, text) in enumerate(zip(image_paths, texts))]
+
+
+def ocr_chunk_size(jobs: int, workers: int, force_tesseract: bool = False, max_chunk: int = 8) -> int:
+    """Images per worker task: 1, or up to `max_chunk` when the Tesseract engine batches
+    images (one tesseract process per chunk), while still spreading work over all workers."""
+    from src.image_handler import tesseract_batches
+
+    if jobs <= 1 or not tesseract_batches(force_tesseract):
+        return 1
+    return max(1, min(max_chunk, -(-jobs // workers)))
+
+
+def warm_up_worker(force_tesseract: bool = False) -> bool:
+    """Import the OCR backend (and start the Tesseract engine) in a worker process ahead of the first image."""
+    from src.image_handler import has_ocr_backend, ocr_backend_name
+    ready = has_ocr_backend(force_tesseract)
+    if ready and ocr_backend_name(force_tesseract) == "tesseract":
+        from src.tesseract_pool import get_engine
+        get_engine()
+    return ready
+
+
+def run_ocr_pool(
+        paths: List[Path],
+        workers: Optional[int] = None,
+        force_tesseract: bool = False,
+        chunk_size: Optional[int] = None,
+        ) -> Iterator[OCRResult]:
+    """Fan the load -> preprocess -> OCR stages out over a process pool.
+
+    Yields (image_path, ocr_text, ocr_seconds, error, stages) tuples as soon as each image (or
+    chunk of `chunk_size` images, default from `ocr_chunk_size`) is done, so the caller
+    can overlap naming with the remaining OCR work.
+    """
+    workers = workers or os.cpu_count() or 1
+    names = [str(p) for p in paths]
+    chunk_size = chunk_size or ocr_chunk_size(len(names), workers, force_tesseract)
+    jobs = [(names[i:i + chunk_size], force_tesseract) for i in range(0, len(names), chunk_size)]
+
+    if workers <= 1 or len(jobs) <= 1:
+        for job in jobs:
+            yield from _ocr_chunk_worker(job)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_ocr_chunk_worker, job) for job in jobs]
+        for fut in as_completed(futures):
+            yield from fut.result()
@@ -0,0 +1,165 @@
+"""Persistent, content-addressed cache for OCR text and LLM results (SQLite)."""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+DEFAULT_CACHE_DIR = Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "diagram-picture-renamer"
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_MAX_AGE_DAYS = 180
+
+# run eviction every N writes rather than on every put
+_EVICT_EVERY = 200
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL,
+    PRIMARY KEY (kind, key)
+);
+CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed);
+"""
+
+
+def file_digest(path: str, chunk_size: int = 1 << 20) -> str:
+    """Return the SHA-256 hex digest of the file content."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def make_key(*parts: Any) -> str:
+    """Build a stable cache key from arbitrary JSON-serializable parts."""
+    raw = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """SQLite-backed cache with LRU size eviction, age eviction and hit/miss counters.
+
+    Entries are grouped by `kind` ("ocr", "llm", ...). Keys should be content-addressed
+    (see `make_key` and `file_digest`) so copies of a file and re-runs hit the cache.
+    """
+
+    def __init__(self, path: Optional[Path] = None, max_bytes: int = DEFAULT_MAX_BYTES, max_age_days: float = DEFAULT_MAX_AGE_DAYS):
+        self.path = Path(path) if path else DEFAULT_CACHE_DIR / "cache.sqlite3"
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.max_age = max_age_days * 86400
+        self.stats: Dict[str, int] = {}
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self.evict()
+
+    def _count(self, kind: str, outcome: str) -> None:
+        name = f"{kind}_{outcome}"
+        self.stats[name] = self.stats.get(name, 0) + 1
+
+    def get(self, kind: str, key: str) -> Optional[Any]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM entries WHERE kind = ? AND key = ?", (kind, key)
+            ).fetchone()
+            if row is None:
+                self._count(kind, "misses")
+                return None
+            self._conn.execute(
+                "UPDATE entries SET accessed = ? WHERE kind = ? AND key = ?", (time.time(), kind, key)
+            )
+            self._conn.commit()
+            self._count(kind, "hits")
+        return json.loads(row[0])
+
+    def put(self, kind: str, key: str, value: Any) -> None:
+        data = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (kind, key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?, ?)",
+                (kind, key, data, len(data.encode("utf-8")), now, now),
+            )
+            self._conn.commit()
+            self._writes += 1
+            due = self._writes % _EVICT_EVERY == 0
+        if due:
+            self.evict()
+
+    def put_many(self, kind: str, items: List[Tuple[str, Any]]) -> None:
+        """Store several entries of `kind` in one transaction."""
+        now = time.time()
+        rows = []
+        for key, value in items:
+            data = json.dumps(value, ensure_ascii=False)
+            rows.append((kind, key, data, len(data.encode("utf-8")), now, now))
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO entries (kind, key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+            before = self._writes
+            self._writes += len(rows)
+            due = self._writes // _EVICT_EVERY > before // _EVICT_EVERY
+        if due:
+            self.evict()
+
+    def evict(self) -> int:
+        """Drop entries older than max_age, then least recently used ones until under max_bytes.
+        Returns the number of removed entries."""
+        removed = 0
+        with self._lock:
+            if self.max_age > 0:
+                cur = self._conn.execute("DELETE FROM entries WHERE accessed < ?", (time.time() - self.max_age,))
+                removed += cur.rowcount
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if self.max_bytes > 0 and total > self.max_bytes:
+                excess = total - self.max_bytes
+                rows = self._conn.execute("SELECT kind, key, size FROM entries ORDER BY accessed ASC").fetchall()
+                doomed = []
+                for kind, key, size in rows:
+                    if excess <= 0:
+                        break
+                    doomed.append((kind, key))
+                    excess -= size
+                self._conn.executemany("DELETE FROM entries WHERE kind = ? AND key = ?", doomed)
+                removed += len(doomed)
+            self._conn.commit()
+        self.stats["evicted"] = self.stats.get("evicted", 0) + removed
+        return removed
+
+    def items(self, kind: str) -> List[Tuple[str, Any]]:
+        """All (key, value) entries of `kind`, without touching their access times."""
+        with self._lock:
+            rows = self._conn.execute("SELECT key, value FROM entries WHERE kind = ?", (kind,)).fetchall()
+        return [(key, json.loads(value)) for key, value in rows]
+
+    def size_bytes(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def open_cache(cache_dir: Optional[Path] = None) -> ResultCache:
+    """Open the cache in `cache_dir`, $DPR_CACHE_DIR or the default user cache directory.
+    Size and age limits can be tuned with $DPR_CACHE_MAX_MB and $DPR_CACHE_MAX_AGE_DAYS."""
+    directory = Path(cache_dir or os.environ.get("DPR_CACHE_DIR") or DEFAULT_CACHE_DIR)
+    max_mb = float(os.environ.get("DPR_CACHE_MAX_MB", DEFAULT_MAX_BYTES / (1024 * 1024)))
+    max_age = float(os.environ.get("DPR_CACHE_MAX_AGE_DAYS", DEFAULT_MAX_AGE_DAYS))
+    return ResultCache(directory / "cache.sqlite3", max_bytes=int(max_mb * 1024 * 1024), max_age_days=max_age)
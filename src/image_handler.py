@@ -1,26 +1,136 @@
+import os
 import sys
+import time
 from PIL import Image
 from pathlib import Path
-
-# Detect if we are on macOS with Vision framework available
-try:
-    from Vision import VNRecognizeTextRequest, VNImageRequestHandler
-    from Foundation import NSData
-    _HAS_APPLE_VISION = True
-except Exception:
-    _HAS_APPLE_VISION = False
-
-# Detect if pytesseract is available
-try:
-    import pytesseract
-    _HAS_TESSERACT = True
-except Exception:
-    pytesseract = None
-    _HAS_TESSERACT = False
-
-
-def load_image(path: str) -> Image.Image:
-    return Image.open(path).convert("RGB")
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.instrumentation import stage
+from src.preprocess import preprocess
+from src.adaptive_ocr import OCRPass, adaptive_enabled, ocr_adaptive
+from src.progressive import ocr_progressive, ocr_progressive_many, progressive_enabled
+from src.text_lines import group_text_lines
+
+# OCR backends are probed on first use: importing PyObjC's Vision bridge and the Tesseract
+# engines is slow and not needed by invocations that never reach OCR
+VNRecognizeTextRequest = VNImageRequestHandler = NSData = None
+_HAS_APPLE_VISION: Optional[bool] = None
+_HAS_TESSERACT: Optional[bool] = None
+
+
+def _has_apple_vision() -> bool:
+    """Detect (once) if we are on macOS with the Vision framework available."""
+    global _HAS_APPLE_VISION, VNRecognizeTextRequest, VNImageRequestHandler, NSData
+    if _HAS_APPLE_VISION is None:
+        try:
+            from Vision import VNRecognizeTextRequest, VNImageRequestHandler
+            from Foundation import NSData
+            _HAS_APPLE_VISION = True
+        except Exception:
+            _HAS_APPLE_VISION = False
+    return _HAS_APPLE_VISION
+
+
+def _has_tesseract() -> bool:
+    """Detect (once) if a Tesseract engine (tesserocr, the tesseract binary) is available."""
+    global _HAS_TESSERACT
+    if _HAS_TESSERACT is None:
+        try:
+            from src.tesseract_pool import select_engine_name
+            _HAS_TESSERACT = select_engine_name() is not None
+        except Exception:
+            _HAS_TESSERACT = False
+    return _HAS_TESSERACT
+
+
+# Preprocessing recipe applied before Tesseract; part of the OCR cache key
+OCR_PREPROCESS_PARAMS = {"max_width": 2000, "contrast": 2.0, "threshold": 180, "method": "fixed", "window": 31, "tiling": "auto", "progressive": False, "adaptive": False}
+
+
+def ocr_preprocess_params() -> dict:
+    """Return the preprocessing recipe, with the binarization method and window
+    overridable through $OCR_BINARIZATION (fixed|sauvola|niblack) and $OCR_THRESHOLD_WINDOW,
+    tiling of large images through $OCR_TILING (auto|off), title-band-first OCR through
+    $OCR_PROGRESSIVE and confidence-driven extra passes through $OCR_ADAPTIVE."""
+    params = dict(OCR_PREPROCESS_PARAMS)
+    params["method"] = os.environ.get("OCR_BINARIZATION") or params["method"]
+    params["window"] = int(os.environ.get("OCR_THRESHOLD_WINDOW") or params["window"])
+    params["tiling"] = (os.environ.get("OCR_TILING") or params["tiling"]).lower()
+    params["progressive"] = progressive_enabled()
+    params["adaptive"] = adaptive_enabled()
+    return params
+
+
+def ocr_backend_name(force_tesseract: bool = False) -> str:
+    """Return the name of the OCR backend `extract_text_with_ocr` will use."""
+    if force_tesseract or not _has_apple_vision():
+        return "tesseract"
+    return "apple_vision"
+
+
+def has_ocr_backend(force_tesseract: bool = False) -> bool:
+    """Return True if the OCR backend selected by `ocr_backend_name` is installed."""
+    if ocr_backend_name(force_tesseract) == "tesseract":
+        return _has_tesseract()
+    return _has_apple_vision()
+
+
+def load_image(path: str, max_width: Optional[int] = None, mode: str = "RGB") -> Image.Image:
+    """Open and decode an image in `mode`.
+
+    With `max_width`, the codec is asked for a reduced size up front: JPEG uses DCT
+    scaling (`draft`), which also decodes straight to grayscale for mode "L"; other
+    formats use a fast integer `reduce`. The result is at least `max_width` wide (when
+    the source is), ready for a final `resize_image`.
+    """
+    img = Image.open(path)
+    if max_width and img.width > max_width:
+        target = (max_width, max(1, round(img.height * max_width / img.width)))
+        if img.format == "JPEG":
+            img.draft(mode, target)
+        else:
+            factor = img.width // max_width
+            if factor >= 2:
+                img = img.reduce(factor)
+    elif mode == "L" and img.format == "JPEG":
+        # no scaling needed, but still skip the chroma planes
+        img.draft(mode, img.size)
+    return img if img.mode == mode else img.convert(mode)
+
+
+def decode_for_ocr(path: str, max_width: int = 2000) -> Tuple[Image.Image, Dict[str, Any]]:
+    """Decode an image as grayscale at (about) OCR resolution and report what it cost.
+
+    Returns the image and stats with the decode time and the estimated peak pixel-buffer
+    memory saved compared with the full-resolution RGB decode done by `load_image(path)`.
+    """
+    start = time.perf_counter()
+    with Image.open(path) as probe:
+        source_size, source_format = probe.size, probe.format
+        source_bands = len(probe.getbands())
+        source_is_rgb = probe.mode == "RGB"
+    img = load_image(path, max_width=max_width, mode="L")
+    img.load()
+    decoded_size = img.size
+    img = resize_image(img, max_width)
+    elapsed = time.perf_counter() - start
+
+    source_px = source_size[0] * source_size[1]
+    decoded_px = decoded_size[0] * decoded_size[1]
+    # full path: native decode, plus an RGB copy when the source is not RGB
+    full_peak = source_px * (source_bands + (0 if source_is_rgb else 3))
+    # JPEG decodes straight to the reduced grayscale buffer; other codecs decode fully first
+    peak = decoded_px if source_format == "JPEG" else source_px * source_bands + decoded_px
+    stats = {
+        "decode_seconds": round(elapsed, 4),
+        "source_size": list(source_size),
+        "decoded_size": list(decoded_size),
+        "output_size": list(img.size),
+        "full_decode_peak_bytes": full_peak,
+        "peak_bytes": peak,
+        "memory_saved_bytes": full_peak - peak,
+    }
+    return img, stats
 
 
 def resize_image(img: Image.Image, max_width: int = 2000) -> Image.Image:
@@ -41,54 +151,190 @@ def save_preprocessed_image(img: Image.Image) -> None:
         pass
 
 
-def preprocess_for_ocr(img: Image.Image, max_width: int = 2000) -> Image.Image:
-    from PIL import ImageEnhance, ImageOps
-    # 1. Convert to grayscale
-    proc_img = img.convert("L")
-    # 2. Enhance contrast
-    enhancer = ImageEnhance.Contrast(proc_img)
-    proc_img = enhancer.enhance(2.0)  # 2.0 is a good default, can be tuned
-    # 3. Adaptive threshold (binarization)
-    # Use PIL's point method for simple thresholding
-    # Or use ImageOps.autocontrast for further normalization
-    proc_img = ImageOps.autocontrast(proc_img)
-    # Try both adaptive and fixed threshold
-    threshold = 180  # can be tuned
-    proc_img = proc_img.point(lambda x: 255 if x > threshold else 0, mode='1')
-    return proc_img
+def preprocess_for_ocr(img: Image.Image, max_width: int = 2000, method: Optional[str] = None, threshold: Optional[int] = None) -> Image.Image:
+    """Binarize the image for OCR (grayscale, contrast stretch, threshold) in as few passes as possible.
+    `method` selects the global "fixed" threshold or adaptive "sauvola"/"niblack" thresholding."""
+    params = ocr_preprocess_params()
+    return preprocess(
+        img,
+        method=method or params["method"],
+        contrast=params["contrast"],
+        threshold=threshold or params["threshold"],
+        window=params["window"],
+    )
+
+
+def prepare_for_tesseract(image_path: str, verbose: bool = False) -> Image.Image:
+    """Decode (reduced, grayscale) and preprocess an image into what Tesseract gets to see."""
+    img = decode_for_tesseract(image_path, verbose=verbose)
+    with stage("ocr.preprocess"):
+        return preprocess_for_ocr(img)
+
+
+def decode_for_tesseract(image_path: str, verbose: bool = False) -> Image.Image:
+    """Decode an image reduced and grayscale, ready for `preprocess_for_ocr`."""
+    with stage("ocr.decode") as span:
+        img, decode_stats = decode_for_ocr(image_path, max_width=OCR_PREPROCESS_PARAMS["max_width"])
+        span.set(bytes_read=os.path.getsize(image_path), source_size=list(decode_stats["source_size"]),
+                 output_size=list(decode_stats["output_size"]))
+    if verbose:
+        print(f"[VERBOSE] decoded {decode_stats['source_size']} -> {decode_stats['decoded_size']} in {decode_stats['decode_seconds'] * 1000:.1f} ms, "
+              f"~{decode_stats['memory_saved_bytes'] / 1e6:.1f} MB less than a full RGB decode", file=sys.stderr)
+    return img
 
 
 def extract_text_with_tesseract(image_path: str, verbose: bool = False, save_preprocessed_img: bool = False) -> str:
     """
-    Extract text from an image using pytesseract OCR, with optional pre-processing to improve results on low-contrast text.
+    Extract text from an image with the process's persistent Tesseract engine, after
+    pre-processing to improve results on low-contrast text.
     Args:
-        img: PIL.Image.Image
+        image_path: str
         verbose: bool
-        preprocess: bool (default True) - apply grayscale, contrast, and binarization
+        save_preprocessed_img: bool - also save the image as seen by Tesseract
     Returns:
         str: cleaned OCR text
     """
-    
+    from src.tesseract_pool import get_engine
+
     if verbose:
         print(f"[VERBOSE] extract text using Tesseract", file=sys.stderr)
 
-    if not _HAS_TESSERACT:
+    if not _has_tesseract():
         return ""
     try:
-        img = load_image(image_path)
-        img = resize_image(img)
-
-        preprocess = True  # set True by default, can be parameterized if needed
-        proc_img = preprocess_for_ocr(img) if preprocess else img
+        tiled = extract_text_tiled(image_path, verbose=verbose)
+        if tiled is not None:
+            return tiled.strip()
+        if adaptive_enabled():
+            return extract_text_adaptive(image_path, verbose=verbose, save_preprocessed_img=save_preprocessed_img).strip()
+        proc_img = prepare_for_tesseract(image_path, verbose=verbose)
         save_preprocessed_image(proc_img) if save_preprocessed_img else None
 
-        ocr_text = pytesseract.image_to_string(proc_img)
+        engine = get_engine()
+        if verbose:
+            print(f"[VERBOSE] Tesseract engine: {engine.name}", file=sys.stderr)
+        if progressive_enabled():
+            with stage("ocr.tesseract", engine=engine.name, progressive=True) as span:
+                ocr_text, early_exit, band_height = ocr_progressive(proc_img, engine)
+                span.add("early_exits" if early_exit else "full_passes")
+            if verbose:
+                outcome = "whole image (too short for a band)" if band_height >= proc_img.height else \
+                    "enough text, rest skipped" if early_exit else "not enough text, rest OCR-ed too"
+                print(f"[VERBOSE] progressive OCR: top {band_height} of {proc_img.height} px, {outcome}", file=sys.stderr)
+        else:
+            with stage("ocr.tesseract", engine=engine.name):
+                ocr_text = engine.recognize(proc_img)
         ocr_text = ocr_text.strip()
         return ocr_text
     except Exception:
         return ""
 
 
+def extract_text_adaptive(image_path: str, verbose: bool = False, save_preprocessed_img: bool = False) -> str:
+    """OCR with the configured recipe, and alternate recipes in parallel when its word
+    confidences are low (see `src.adaptive_ocr`)."""
+    from src.tesseract_pool import get_engine
+
+    gray = decode_for_tesseract(image_path, verbose=verbose)
+    params = ocr_preprocess_params()
+    first = OCRPass(params["method"], params["method"], threshold=params["threshold"])
+    if save_preprocessed_img:
+        save_preprocessed_image(preprocess_for_ocr(gray))
+
+    def binarize(img: Image.Image, p: OCRPass) -> Image.Image:
+        return preprocess_for_ocr(img, method=p.method, threshold=p.threshold)
+
+    engine = get_engine()
+    with stage("ocr.tesseract", engine=engine.name, adaptive=True) as span:
+        text, passes, best = ocr_adaptive(gray, engine, binarize, first)
+        span.set(passes=len(passes), best_pass=best)
+        span.add("extra_passes", len(passes) - 1)
+    if verbose:
+        outcome = "confident, single pass" if len(passes) == 1 else f"{len(passes)} passes ({', '.join(passes)}), kept {best}"
+        print(f"[VERBOSE] adaptive OCR: {outcome}", file=sys.stderr)
+    return text
+
+
+def extract_texts_with_tesseract(image_paths: List[str]) -> List[str]:
+    """OCR several images with one engine call where the engine supports it (the pipe
+    engine sends them all through a single tesseract process; progressive OCR takes two,
+    for the bands and the remainders). Failed images give ""."""
+    from src.tesseract_pool import get_engine
+
+    engine = get_engine() if _has_tesseract() else None
+    if engine is None or not engine.batches:
+        return [extract_text_with_tesseract(p) for p in image_paths]
+
+    out = [""] * len(image_paths)
+    ready = []
+    for i, p in enumerate(image_paths):
+        try:
+            tiled = extract_text_tiled(p)
+            if tiled is not None:
+                out[i] = tiled.strip()
+                continue
+            ready.append((i, prepare_for_tesseract(p)))
+        except Exception:
+            pass
+    try:
+        if progressive_enabled():
+            with stage("ocr.tesseract", engine=engine.name, images=len(ready), progressive=True) as span:
+                outcomes = ocr_progressive_many([img for _, img in ready], engine)
+                texts = [text for text, _, _ in outcomes]
+                span.add("early_exits", sum(1 for _, early_exit, _ in outcomes if early_exit))
+                span.add("full_passes", sum(1 for _, early_exit, _ in outcomes if not early_exit))
+        else:
+            with stage("ocr.tesseract", engine=engine.name, images=len(ready)):
+                texts = engine.recognize_many([img for _, img in ready])
+    except Exception:
+        texts = [""] * len(ready)
+    for (i, _), text in zip(ready, texts):
+        out[i] = text.strip()
+    return out
+
+
+def extract_text_tiled(image_path: str, verbose: bool = False) -> Optional[str]:
+    """OCR a very large or tall image as overlapping tiles in parallel (see `src.tiling`).
+    Returns None when the image does not need tiling, so the caller takes the normal path."""
+    from src import tiling
+    from src.tesseract_pool import get_engine
+
+    if tiling.tiling_mode() == "off":
+        return None
+    max_width = OCR_PREPROCESS_PARAMS["max_width"]
+    with Image.open(image_path) as probe:
+        if not tiling.might_need_tiling(probe.size, max_width):
+            return None
+    with stage("ocr.decode") as span:
+        img = load_image(image_path, mode="L")
+        img.load()
+        span.set(bytes_read=os.path.getsize(image_path), source_size=list(img.size))
+    with stage("ocr.tile_plan") as span:
+        text_height = tiling.estimate_text_height(img)
+        plan = tiling.plan_tiling(img.size, text_height, max_width)
+        span.set(text_height=text_height)
+    if plan is None:
+        return None
+    engine = get_engine()
+    workers = int(os.environ.get("OCR_TILE_WORKERS") or 0) or None
+    with stage("ocr.tesseract", engine=engine.name, tiled=True) as span:
+        text, tiles = tiling.ocr_tiled(img, plan, engine, max_workers=workers)
+        span.set(tiles=tiles, scale=round(plan.scale, 3))
+    if verbose:
+        print(f"[VERBOSE] tiled OCR: {img.size[0]}x{img.size[1]}, text height ~{text_height} px, scale {plan.scale:.2f}, "
+              f"{tiles} tiles of {plan.tile_width}x{plan.tile_height} (overlap {plan.overlap})", file=sys.stderr)
+    return text
+
+
+def tesseract_batches(force_tesseract: bool = False) -> bool:
+    """True when OCR goes to a Tesseract engine that handles several images per call
+    (and adaptive OCR, which decides per image, is off)."""
+    if ocr_backend_name(force_tesseract) != "tesseract" or not _has_tesseract() or adaptive_enabled():
+        return False
+    from src.tesseract_pool import engine_batches
+    return engine_batches()
+
+
 def extract_text_boxes(req):
     """
     Extract text boxes from a VNRecognizeTextRequest result.
@@ -108,31 +354,12 @@ def extract_text_boxes(req):
 def merge_text_boxes(results, y_tolerance=0.02, max_dist=0.05):
     """
     Merge text boxes into lines based on vertical and horizontal proximity.
+    Returns the line strings, top line first; see `group_text_lines` for the
+    structured lines with bounding boxes.
     """
 
     # results = [(text, box), ...]
-    rows = []
-
-    for text, box in sorted(results, key=lambda x: x[1][0][0]):  # sort by x
-        line_merged = False
-        (bx, by), (bw, bh) = box
-        
-        for r in rows:
-            # same row if y-coord close and x-coord close
-            _, ((rx, ry), (rw, rh)) = r[-1]
-            if abs(by - ry) < y_tolerance and (bx - (rx + rw)) < max_dist:
-                r.append((text, box))
-                line_merged = True
-                break
-        
-        if not line_merged:
-            rows.append([(text, box)])
-
-    # sort by y-coordinate, 0 is bottom
-    rows = sorted(rows, key=lambda x: x[0][1][0][1], reverse=True)
-
-    # merge texts in each row
-    return [" ".join([t for t, _ in row]) for row in rows]
+    return [line.text for line in group_text_lines(results, y_tolerance=y_tolerance, max_dist=max_dist)]
 
 
 def extract_text_with_apple_vision(image_path: str, verbose: bool = False, save_preprocessed_img: bool = False) -> str:
@@ -143,19 +370,22 @@ def extract_text_with_apple_vision(image_path: str, verbose: bool = False, save_
     if verbose:
         print(f"[VERBOSE] extract text using Apple Vision", file=sys.stderr)
 
-    if not _HAS_APPLE_VISION:
+    if not _has_apple_vision():
         return ""
     try:
         req = VNRecognizeTextRequest.alloc().init()
         req.setRecognitionLevel_(1)  # HIGH
         req.setUsesLanguageCorrection_(True)
 
-        data = NSData.dataWithContentsOfFile_(image_path)
-        handler = VNImageRequestHandler.alloc().initWithData_options_(data, None)
-        handler.performRequests_error_([req], None)
+        with stage("ocr.vision") as span:
+            data = NSData.dataWithContentsOfFile_(image_path)
+            span.set(bytes_read=int(data.length()))
+            handler = VNImageRequestHandler.alloc().initWithData_options_(data, None)
+            handler.performRequests_error_([req], None)
 
         boxes = extract_text_boxes(req)
-        lines = merge_text_boxes(boxes)
+        with stage("ocr.merge_text_boxes", boxes=len(boxes)):
+            lines = merge_text_boxes(boxes)
         return "\n".join(lines)
     except Exception:
         return ""
@@ -169,12 +399,10 @@ def extract_text_with_ocr(
     """
     Extract text from an image using OCR, trying macOS Vision first and falling back to Tesseract if needed.
     """
-    
-    import re
 
     ocr_text = ""    
     try:
-        if force_tesseract:                        
+        if ocr_backend_name(force_tesseract) == "tesseract":
             if verbose:
                 print(f"[VERBOSE] force using Tesseract", file=sys.stderr)
             raise Exception("Forced Tesseract")
@@ -182,7 +410,27 @@ def extract_text_with_ocr(
     except Exception:
         ocr_text = extract_text_with_tesseract(image_path, verbose=verbose, save_preprocessed_img=save_preprocessed_img)
 
-    # Clean OCR text: process each line, keep only alphanumeric characters, remove empty lines
+    with stage("ocr.cleanup"):
+        clean_text = clean_ocr_text(ocr_text)
+
+    if verbose:
+        print(f"[VERBOSE] OCR text extracted:\n{ocr_text}", file=sys.stderr)
+        print(f"[VERBOSE] OCR text cleaned:\n{clean_text}", file=sys.stderr)
+
+    return clean_text
+
+
+def extract_texts_with_ocr(image_paths: List[str], force_tesseract: bool = False) -> List[str]:
+    """Cleaned OCR text for several images; with a batching Tesseract engine they share one call."""
+    if not tesseract_batches(force_tesseract):
+        return [extract_text_with_ocr(p, force_tesseract=force_tesseract) for p in image_paths]
+    return [clean_ocr_text(t) for t in extract_texts_with_tesseract(image_paths)]
+
+
+def clean_ocr_text(ocr_text: str) -> str:
+    """Clean OCR text: keep alphanumeric characters and common punctuation per line, drop empty lines."""
+    import re
+
     lines = ocr_text.split('\n')
     cleaned_lines = []
     for line in lines:
@@ -198,9 +446,4 @@ def extract_text_with_ocr(
     clean_ocr_text = re.sub(r'\n+', '\n', clean_ocr_text)
     clean_ocr_text = re.sub(r'[ \t]+', ' ', clean_ocr_text) # collapse multiple spaces
     clean_ocr_text = re.sub(r'[\u200b-\u200d\uFEFF]', '', clean_ocr_text) # remove zero-width chars
-
-    if verbose:
-        print(f"[VERBOSE] OCR text extracted:\n{ocr_text}", file=sys.stderr)
-        print(f"[VERBOSE] OCR text cleaned:\n{clean_ocr_text}", file=sys.stderr)
-
     return clean_ocr_text
@@ -0,0 +1,243 @@
+"""Lightweight per-stage instrumentation: wall/CPU time and counters, aggregated per trace.
+
+Code marks its stages with `with stage("ocr.decode") as s: ...; s.set(width=w)` and adds
+counters with `count("heuristic_names")`. Nothing is recorded unless a trace is active
+(`with tracing() as trace:`), so the calls cost one context-variable lookup otherwise.
+One trace is kept per processed file; OCR worker processes send their stages back as a
+plain dict that the parent merges (`Trace.merge`).
+
+Sinks turn finished traces into a JSONL trace log or a Prometheus textfile (node_exporter
+textfile collector format) for batch and watch runs.
+"""
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional
+
+_TRACE: ContextVar[Optional["Trace"]] = ContextVar("dpr_trace", default=None)
+_SPAN: ContextVar[Optional["Span"]] = ContextVar("dpr_span", default=None)
+
+
+class Span:
+    """Attributes of one running stage; numbers are summed per stage, other values kept as last seen."""
+    __slots__ = ("name", "attrs")
+
+    def __init__(self, name: str, attrs: Dict[str, Any]):
+        self.name = name
+        self.attrs = attrs
+
+    def set(self, **attrs: Any) -> None:
+        self.attrs.update(attrs)
+
+    def add(self, key: str, value: float = 1) -> None:
+        self.attrs[key] = self.attrs.get(key, 0) + value
+
+
+class _NullSpan:
+    def set(self, **attrs: Any) -> None:
+        pass
+
+    def add(self, key: str, value: float = 1) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Trace:
+    """Per-stage aggregates: calls, wall and CPU seconds, plus the stages' attributes."""
+
+    def __init__(self):
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, wall: float, cpu: float, attrs: Dict[str, Any]) -> None:
+        self.merge({name: dict(attrs, calls=1, wall_seconds=wall, cpu_seconds=cpu)})
+
+    def merge(self, stages: Optional[Dict[str, Dict[str, Any]]]) -> None:
+        """Fold in stages recorded elsewhere (another trace, a worker process)."""
+        with self._lock:
+            for name, values in (stages or {}).items():
+                agg = self.stages.setdefault(name, {})
+                for key, value in values.items():
+                    if isinstance(value, (int, float)) and not isinstance(value, bool):
+                        agg[key] = agg.get(key, 0) + value
+                    else:
+                        agg[key] = value
+
+    def as_dict(self) -> Dict[str, Dict[str, Any]]:
+        """Stages with times in milliseconds, for the result JSON."""
+        out = {}
+        for name, values in self.stages.items():
+            entry = {}
+            for key, value in values.items():
+                if key.endswith("_seconds"):
+                    entry[key[:-len("_seconds")] + "_ms"] = round(value * 1000, 3)
+                else:
+                    entry[key] = value
+            out[name] = entry
+        return out
+
+
+@contextmanager
+def tracing(trace: Optional[Trace] = None) -> Iterator[Trace]:
+    """Make `trace` (or a new one) the active trace for the enclosed code."""
+    trace = trace if trace is not None else Trace()
+    token = _TRACE.set(trace)
+    try:
+        yield trace
+    finally:
+        _TRACE.reset(token)
+
+
+@contextmanager
+def stage(name: str, **attrs: Any):
+    """Time the enclosed block as stage `name` in the active trace (no-op without one)."""
+    trace = _TRACE.get()
+    if trace is None:
+        yield _NULL_SPAN
+        return
+    span = Span(name, attrs)
+    token = _SPAN.set(span)
+    wall0 = time.perf_counter()
+    cpu0 = time.thread_time()
+    try:
+        yield span
+    finally:
+        trace.record(name, time.perf_counter() - wall0, time.thread_time() - cpu0, span.attrs)
+        _SPAN.reset(token)
+
+
+def count(key: str, value: float = 1) -> None:
+    """Add to a counter of the innermost running stage (or a top-level "counters" entry)."""
+    span = _SPAN.get()
+    if span is not None:
+        span.add(key, value)
+        return
+    trace = _TRACE.get()
+    if trace is not None:
+        trace.merge({"counters": {key: value}})
+
+
+class JsonlTraceSink:
+    """Append one JSON line per finished file: {"ts", "file", "stages"}."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+    def emit(self, file: str, trace: Trace) -> None:
+        line = json.dumps({"ts": round(time.time(), 3), "file": file, "stages": trace.as_dict()}, ensure_ascii=False)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+    def close(self) -> None:
+        pass
+
+
+def _metric_name(key: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_]", "_", key)
+
+
+class PrometheusTextfileSink:
+    """Cumulative per-stage counters written as a Prometheus textfile.
+
+    The file is rewritten atomically (temp file + rename) at most every `interval` seconds
+    and on close, so a long batch does not rewrite it for every image.
+    """
+
+    def __init__(self, path: Path, interval: float = 5.0, prefix: str = "dpr"):
+        self.path = Path(path)
+        self.interval = interval
+        self.prefix = prefix
+        self.files = 0
+        self._totals = Trace()
+        self._last_write = 0.0
+        self._lock = threading.Lock()
+
+    def emit(self, file: str, trace: Trace) -> None:
+        with self._lock:
+            self.files += 1
+        self._totals.merge(trace.stages)
+        if time.monotonic() - self._last_write >= self.interval:
+            self.write()
+
+    def render(self) -> str:
+        p = self.prefix
+        lines = [
+            f"# HELP {p}_files_total Files processed.",
+            f"# TYPE {p}_files_total counter",
+            f"{p}_files_total {self.files}",
+        ]
+        by_metric: Dict[str, list] = {}
+        for name, values in sorted(self._totals.stages.items()):
+            for key, value in sorted(values.items()):
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    by_metric.setdefault(f"{p}_stage_{_metric_name(key)}_total", []).append((name, value))
+        for metric, samples in by_metric.items():
+            lines.append(f"# TYPE {metric} counter")
+            lines.extend(f'{metric}{{stage="{name}"}} {value:g}' for name, value in samples)
+        return "\n".join(lines) + "\n"
+
+    def write(self) -> None:
+        with self._lock:
+            tmp = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+            tmp.write_text(self.render(), encoding="utf-8")
+            os.replace(tmp, self.path)
+            self._last_write = time.monotonic()
+
+    def close(self) -> None:
+        self.write()
+
+
+class TraceSinks:
+    """Fan finished traces out to the configured sinks (none, JSONL, Prometheus textfile)."""
+
+    def __init__(self, trace_file: Optional[Path] = None, metrics_file: Optional[Path] = None):
+        self.sinks = []
+        if trace_file:
+            self.sinks.append(JsonlTraceSink(trace_file))
+        if metrics_file:
+            self.sinks.append(PrometheusTextfileSink(metrics_file))
+
+    def __bool__(self) -> bool:
+        return bool(self.sinks)
+
+    def emit(self, file: str, trace: Trace) -> None:
+        for sink in self.sinks:
+            sink.emit(file, trace)
+
+    def close(self) -> None:
+        for sink in self.sinks:
+            sink.close()
+
+
+def run_traced(trace: Trace, fn, *args, **kwargs):
+    """Call `fn` with `trace` active; for executor threads, which do not inherit context variables."""
+    with tracing(trace):
+        return fn(*args, **kwargs)
+
+
+class Profiler:
+    """Collects the per-file traces of a run: keeps run totals, feeds the sinks and, with
+    `embed`, adds each file's stages to its result as `profile`."""
+
+    def __init__(self, embed: bool = False, sinks: Optional[TraceSinks] = None):
+        self.embed = embed
+        self.sinks = sinks or TraceSinks()
+        self.totals = Trace()
+
+    def file_done(self, result: Dict[str, Any], trace: Trace) -> None:
+        self.totals.merge(trace.stages)
+        if self.embed:
+            result["profile"] = trace.as_dict()
+        if self.sinks:
+            self.sinks.emit(result.get("file", ""), trace)
+
+    def close(self) -> None:
+        self.sinks.close()
@@ -0,0 +1,229 @@
+"""Local title and keyword extraction from OCR text, so confident images skip the LLM.
+
+Keywords are scored with TF-IDF against corpus statistics (document frequencies of the
+terms of every image named before, kept in the result cache under kind "corpus") combined
+with a RAKE-style degree score: terms that occur inside longer phrases between stopwords
+and punctuation count for more than isolated ones. The title is the best of the first
+lines, judged on position, length and how much of it looks like real words. A confidence
+in [0, 1] says how much to trust the result; with $DPR_LOCAL_THRESHOLD (or
+`--local-threshold`) set, results at or above it are used without calling the LLM.
+"""
+import math
+import os
+import re
+import threading
+import weakref
+from collections import Counter
+from typing import Dict, List, NamedTuple, Optional
+
+from src.cache import make_key
+
+STOPWORDS = frozenset("""
+a about above after again against all also am an and any are as at be because been before being
+below between both but by can could did do does doing down during each either else etc few for
+from further had has have having he her here hers him his how i if in into is it its itself just
+let may me might more most must my no nor not now of off on once only or other our ours out over
+own per same she should so some such than that the their theirs them then there these they this
+those through to too under until up upon us use used using very via was we were what when where
+which while who whom why will with within without would yes yet you your yours
+""".split())
+
+_TOKEN = re.compile(r"[A-Za-z][A-Za-z0-9]*(?:['\-][A-Za-z0-9]+)*")
+# phrases (RAKE candidates) end at punctuation other than hyphens and apostrophes
+_PHRASE_BREAK = re.compile(r"[^\w\s'\-]+")
+_VOWEL = re.compile(r"[aeiouy]", re.IGNORECASE)
+
+# how many leading lines may give the title, and how far down the score decays
+TITLE_LINES = 5
+TITLE_POSITION_DECAY = 0.7
+MAX_TITLE_CHARS = 80
+MAX_KEYWORDS = 5
+# below this many meaningful terms the text says too little to name the image
+MIN_TERMS = 4
+# IDF is barely informative until the corpus has seen this many documents
+MIN_CORPUS_DOCS = 20
+
+
+class LocalResult(NamedTuple):
+    title: str
+    keywords: List[str]
+    confidence: float
+
+
+def local_threshold() -> Optional[float]:
+    """$DPR_LOCAL_THRESHOLD: minimum confidence to name without the LLM (unset = always ask it)."""
+    value = os.environ.get("DPR_LOCAL_THRESHOLD")
+    return float(value) if value else None
+
+
+def looks_like_word(token: str) -> bool:
+    """Cheap filter for OCR noise: some letters, a vowel, no long runs of one character."""
+    letters = sum(c.isalpha() for c in token)
+    if letters < 2 or letters < len(token) / 2:
+        return False
+    if len(token) > 3 and not _VOWEL.search(token):
+        return False
+    return not re.search(r"(.)\1\1", token.lower())
+
+
+def terms(text: str) -> List[str]:
+    """Lowercased terms of `text` that can be keywords: real-looking words, no stopwords."""
+    out = []
+    for tok in _TOKEN.findall(text):
+        low = tok.lower()
+        if len(low) >= 3 and low not in STOPWORDS and looks_like_word(tok):
+            out.append(low)
+    return out
+
+
+class CorpusStats:
+    """Document frequencies of terms over the OCR texts of processed images.
+
+    Backed by the result cache when one is given, so statistics build up across runs;
+    each document is counted once (keyed by a hash of its text). Safe to share between threads.
+    """
+
+    def __init__(self, cache=None):
+        self.cache = cache
+        self.docs = 0
+        self.df: Counter = Counter()
+        self._seen = set()
+        self._lock = threading.Lock()
+        if cache is not None:
+            for key, value in cache.items("corpus"):
+                if key == "docs":
+                    self.docs = value
+                elif key.startswith("df:"):
+                    self.df[key[3:]] = value
+
+    def idf(self, term: str) -> float:
+        return math.log((1 + self.docs) / (1 + self.df.get(term, 0))) + 1.0
+
+    def maturity(self) -> float:
+        """How far the corpus is from giving meaningful IDF values, in [0, 1]."""
+        return min(1.0, self.docs / MIN_CORPUS_DOCS)
+
+    def add(self, text: str) -> bool:
+        """Count the document `text` (once); returns False when it was already counted."""
+        unique = sorted(set(terms(text)))
+        if not unique:
+            return False
+        doc_key = "doc:" + make_key(text)
+        with self._lock:
+            if doc_key in self._seen or (self.cache is not None and self.cache.get("corpus", doc_key) is not None):
+                self._seen.add(doc_key)
+                return False
+            self._seen.add(doc_key)
+            self.docs += 1
+            self.df.update(unique)
+            updates = [(f"df:{t}", self.df[t]) for t in unique] + [("docs", self.docs), (doc_key, 1)]
+        if self.cache is not None:
+            self.cache.put_many("corpus", updates)
+        return True
+
+
+_CORPORA: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_MEMORY_CORPUS: Optional[CorpusStats] = None
+_CORPORA_LOCK = threading.Lock()
+
+
+def corpus_for(cache=None) -> CorpusStats:
+    """The corpus statistics shared by everything using `cache` (in-memory without one)."""
+    global _MEMORY_CORPUS
+    with _CORPORA_LOCK:
+        if cache is None:
+            if _MEMORY_CORPUS is None:
+                _MEMORY_CORPUS = CorpusStats()
+            return _MEMORY_CORPUS
+        corpus = _CORPORA.get(cache)
+        if corpus is None:
+            corpus = _CORPORA[cache] = CorpusStats(cache)
+        return corpus
+
+
+def rake_scores(lines: List[str]) -> Dict[str, float]:
+    """RAKE word scores (degree / frequency) over candidate phrases split at stopwords and punctuation."""
+    freq: Counter = Counter()
+    degree: Counter = Counter()
+    for line in lines:
+        for chunk in _PHRASE_BREAK.split(line):
+            phrase: List[str] = []
+            for tok in _TOKEN.findall(chunk) + [""]:
+                low = tok.lower()
+                if low and low not in STOPWORDS and looks_like_word(tok):
+                    phrase.append(low)
+                    continue
+                for word in phrase:
+                    freq[word] += 1
+                    degree[word] += len(phrase)
+                phrase = []
+    return {w: degree[w] / freq[w] for w in freq}
+
+
+def _clean_title(line: str) -> str:
+    line = re.sub(r"\s+", " ", line).strip(" \t-_:;,.|*#=~>")
+    if len(line) > MAX_TITLE_CHARS:
+        line = line[:MAX_TITLE_CHARS].rsplit(" ", 1)[0]
+    return line
+
+
+def _line_quality(line: str) -> float:
+    """Share of the line's non-space characters that belong to real-looking words."""
+    chars = sum(not c.isspace() for c in line)
+    if not chars:
+        return 0.0
+    good = sum(len(tok) for tok in _TOKEN.findall(line) if looks_like_word(tok))
+    return good / chars
+
+
+def _length_fit(words: int) -> float:
+    if words == 0:
+        return 0.0
+    if words == 1:
+        return 0.5
+    if words <= 8:
+        return 1.0
+    return max(0.3, 1.0 - 0.1 * (words - 8))
+
+
+def extract_local(ocr_text: str, corpus: Optional[CorpusStats] = None) -> LocalResult:
+    """Title, keywords and confidence for `ocr_text`, using `corpus` for IDF when given."""
+    lines = [l.strip() for l in (ocr_text or "").splitlines() if l.strip()]
+    all_tokens = [tok for l in lines for tok in _TOKEN.findall(l)]
+    doc_terms = terms("\n".join(lines))
+    if not doc_terms:
+        return LocalResult("", [], 0.0)
+
+    tf = Counter(doc_terms)
+    rake = rake_scores(lines)
+    max_rake = max(rake.values())
+    scores = {}
+    for term, n in tf.items():
+        idf = corpus.idf(term) if corpus is not None else 1.0
+        scores[term] = (1 + math.log(n)) * idf * (1 + rake.get(term, 0.0) / max_rake)
+    top = max(scores.values())
+
+    best, best_score = "", 0.0
+    for i, line in enumerate(lines[:TITLE_LINES]):
+        line_terms = terms(line)
+        if not line_terms:
+            continue
+        mass = sum(scores[t] for t in line_terms) / len(line_terms) / top
+        fit = _length_fit(len(_TOKEN.findall(line)))
+        score = _line_quality(line) * fit * (TITLE_POSITION_DECAY ** i) * (0.7 + 0.3 * mass)
+        if score > best_score:
+            best, best_score = line, score
+    title = _clean_title(best)
+
+    # descriptive terms not already in the title come first
+    title_terms = set(terms(title))
+    ranked = sorted(scores, key=lambda t: (-(scores[t] * (0.5 if t in title_terms else 1.0)), t))
+    keywords = ranked[:MAX_KEYWORDS]
+
+    if not title:
+        return LocalResult("", keywords, 0.0)
+    text_quality = sum(looks_like_word(t) for t in all_tokens) / len(all_tokens)
+    support = min(1.0, len(tf) / MIN_TERMS)
+    maturity = corpus.maturity() if corpus is not None else 0.0
+    confidence = best_score * math.sqrt(text_quality) * support * (0.6 + 0.4 * maturity)
+    return LocalResult(title, keywords, round(min(1.0, confidence), 3))
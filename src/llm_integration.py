@@ -1,132 +1,775 @@
+import asyncio
+import json
 import os
 import sys
-from typing import Optional, Dict, Any
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field, replace
+from typing import Callable, Optional, Dict, Any, List, Tuple
 
-try:
-    import openai    
-    _HAS_OPENAI = True
-except Exception:
-    openai = None
-    _HAS_OPENAI = False
+from src.instrumentation import stage
+from src.resilience import Deadline, RetryPolicy, backoff_delay, breaker_for, is_retryable, retry_policy
+from src.utils import percentile
 
-def analyze_with_llm(image_path: str, ocr_text: str, verbose: bool = False) -> Optional[Dict[str, Any]]:
-    """Optional: call OpenAI (if configured) to get title+keywords.
+# The openai SDK takes hundreds of milliseconds to import, so it is loaded on first use
+openai = None
+_HAS_OPENAI: Optional[bool] = None
 
-    Returns dict {"title": str, "keywords": [str]} or None if not available.
-    """
 
+def _has_openai() -> bool:
+    """Import the openai SDK on first call; return whether it is available."""
+    global openai, _HAS_OPENAI
+    if _HAS_OPENAI is None:
+        try:
+            import openai as _openai
+            openai = _openai
+            _HAS_OPENAI = True
+        except Exception:
+            _HAS_OPENAI = False
+    return _HAS_OPENAI
+
+SYSTEM_PROMPT = (
+    "You are an assistant that reads information from the image to suggest a proper filename.\n"
+    "The user will provide OCR text extracted from the image.\n"
+    "You must reply with valid JSON only. Do not include any explanatory text.\n"
+    "Return a JSON object with this structure:\n"
+    "{\n  \"title\": \"concise title here\",\n  \"keywords\": [\"keyword1\", \"keyword2\", ...]\n}\n"
+    "Generally the best title can be found in the first few lines of the OCR text.\n"
+    "The title should be concise (max 8 words), descriptive of the main subject of the image.\n"
+    "The title should contain only alphanumeric characters and spaces; do not include special characters or punctuation.\n"
+    "If the first sentence is a good candidate for the title, fix its grammar and use it.\n"
+    "Identify the keywords relevant to the content that represent subjects of study, and select only the 5 most relevant keywords if possible."
+)
+
+
+# OCR text budget of a single-image prompt ($LLM_PROMPT_TOKENS) and reply limit ($LLM_MAX_TOKENS):
+# a title and five keywords fit in well under 100 tokens
+DEFAULT_PROMPT_TOKENS = 600
+DEFAULT_MAX_TOKENS = 200
+# lines always kept at the top of a trimmed prompt, where titles usually are
+_KEEP_FIRST_LINES = 3
+
+
+def prompt_token_budget() -> int:
+    """Token budget for the OCR text in a prompt; 0 disables trimming."""
+    return int(os.environ.get("LLM_PROMPT_TOKENS") or DEFAULT_PROMPT_TOKENS)
+
+
+def streaming_enabled() -> bool:
+    """Stream replies and stop at the first complete JSON object ($LLM_STREAM, default on)."""
+    return (os.environ.get("LLM_STREAM") or "1").lower() not in ("0", "false", "no", "off")
+
+
+def llm_cache_identity() -> Dict[str, Any]:
+    """Describe the configured models and prompt, used as part of the LLM cache key.
+    Changing the model or the prompt invalidates previously cached results."""
+    return {
+        "ollama_model": os.environ.get("OLLAMA_MODEL"),
+        "openai_model": os.environ.get("OPENAI_MODEL") if os.environ.get("OPENAI_API_KEY") else None,
+        "system_prompt": SYSTEM_PROMPT,
+        "prompt_tokens": prompt_token_budget(),
+    }
+
+@dataclass(frozen=True)
+class LLMBackend:
+    """An OpenAI-compatible chat completions endpoint (local Ollama or OpenAI)."""
+    name: str
+    model: str
+    api_key: str
+    base_url: Optional[str] = None
+    max_tokens: int = 500
+
+
+def configured_backends() -> List[LLMBackend]:
+    """Return the configured backends in preference order: Ollama (local) first, then OpenAI."""
+    backends = []
+    max_tokens = int(os.environ.get("LLM_MAX_TOKENS") or DEFAULT_MAX_TOKENS)
+    ollama_model = os.environ.get("OLLAMA_MODEL")
+    if ollama_model:
+        backends.append(LLMBackend(
+            name="ollama",
+            model=ollama_model,
+            # Ollama ignores the key, but the client refuses an empty one
+            api_key=os.environ.get("OLLAMA_API_KEY") or "ollama",
+            base_url=os.environ.get("OLLAMA_HOST", "http://127.0.0.1:11434/v1"),
+            max_tokens=max_tokens,
+        ))
     api_key = os.environ.get("OPENAI_API_KEY")
     model = os.environ.get("OPENAI_MODEL")
-    ollama_model = os.environ.get("OLLAMA_MODEL")
-    ollama_host = os.environ.get("OLLAMA_HOST", "http://127.0.0.1:11434/v1")
-    if not api_key or not model or not _HAS_OPENAI:
-        # If OpenAI is not configured, fall back to Ollama when available
-        pass
-
-    system_prompt = (
-        "You are an assistant that reads information from the image to suggest a proper filename.\n"
-        "The user will provide OCR text extracted from the image.\n"
-        "You must reply with valid JSON only. Do not include any explanatory text.\n"
-        "Return a JSON object with this structure:\n"
-        "{\n  \"title\": \"concise title here\",\n  \"keywords\": [\"keyword1\", \"keyword2\", ...]\n}\n"
-        "Generally the best title can be found in the first few lines of the OCR text.\n"
-        "The title should be concise (max 8 words), descriptive of the main subject of the image.\n"
-        "The title should contain only alphanumeric characters and spaces; do not include special characters or punctuation.\n"
-        "If the first sentence is a good candidate for the title, fix its grammar and use it.\n"
-        "Identify the keywords relevant to the content that represent subjects of study, and select only the 5 most relevant keywords if possible."
-    )
+    if api_key and model:
+        backends.append(LLMBackend(name="openai", model=model, api_key=api_key, max_tokens=max_tokens))
+    return backends
 
-    prompt = (
+
+def _line_score(line: str, index: int) -> float:
+    """How much a line is worth keeping: early lines and lines with several real words win;
+    short fragments, numbers and symbol noise lose."""
+    words = [w for w in line.split() if sum(c.isalpha() for c in w) >= 2]
+    if not words:
+        return 0.0
+    alpha = sum(c.isalpha() for c in line) / len(line)
+    informativeness = min(len(set(w.lower() for w in words)), 8) * alpha
+    position = 1.0 / (1.0 + 0.05 * index)
+    return informativeness * position
+
+
+def trim_ocr_text(ocr_text: str, token_budget: Optional[int] = None) -> str:
+    """Fit OCR text into `token_budget` tokens (default: `prompt_token_budget`).
+
+    Text within the budget is returned unchanged. Otherwise duplicate lines are dropped,
+    the first lines are kept (titles are usually there) and the remaining budget goes to
+    the best-scoring lines (`_line_score`), which are emitted in their original order.
+    """
+    budget = prompt_token_budget() if token_budget is None else token_budget
+    if budget <= 0 or estimate_tokens(ocr_text) <= budget:
+        return ocr_text
+    seen = set()
+    lines = []
+    for line in ocr_text.splitlines():
+        key = line.strip().lower()
+        if key and key not in seen:
+            seen.add(key)
+            lines.append(line.strip())
+    ranked = sorted(range(len(lines)), key=lambda i: (i >= _KEEP_FIRST_LINES, -_line_score(lines[i], i)))
+    chosen = []
+    used = 0
+    for i in ranked:
+        if i >= _KEEP_FIRST_LINES and _line_score(lines[i], i) == 0.0:
+            break
+        cost = estimate_tokens(lines[i])
+        if used + cost > budget:
+            continue
+        chosen.append(i)
+        used += cost
+    return "\n".join(lines[i] for i in sorted(chosen))
+
+
+def build_user_prompt(ocr_text: str) -> str:
+    return (
         "Return JSON object for these OCR text:\n\n"
-        f"{ocr_text}\n\n"
+        f"{trim_ocr_text(ocr_text)}\n\n"
+    )
+
+
+def build_messages(ocr_text: str) -> List[Dict[str, str]]:
+    # Enforce JSON-only output with a system message and request format
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": build_user_prompt(ocr_text)},
+    ]
+
+
+def _request_kwargs(backend: LLMBackend, messages: List[Dict[str, str]], max_tokens: Optional[int] = None, stream: bool = False,
+                    timeout: Optional[float] = None) -> Dict[str, Any]:
+    kwargs = dict(
+        model=backend.model,
+        messages=messages,
+        max_tokens=max_tokens or backend.max_tokens,
+        temperature=0.0,
+        stream=stream,
+        # ask the (OpenAI-compatible) endpoint for a JSON object
+        response_format={"type": "json_object"},
     )
+    if timeout is not None:
+        kwargs["timeout"] = timeout
+    return kwargs
+
+
+class JsonObjectScanner:
+    """Find the end of the first top-level JSON object in text that arrives in pieces.
+
+    Tracks brace depth outside of strings (and escapes inside them); `feed` returns the
+    object's text as soon as its closing brace arrives, else None. Anything before the
+    opening brace (a code fence, whitespace) is skipped.
+    """
+
+    def __init__(self):
+        self._buf: List[str] = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self.done = False
+
+    def feed(self, text: str) -> Optional[str]:
+        if self.done:
+            return None
+        start = 0
+        for i, ch in enumerate(text):
+            if self._depth == 0:
+                if ch != "{":
+                    continue
+                start = i
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                self._depth += 1
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._buf.append(text[start:i + 1])
+                    self.done = True
+                    return "".join(self._buf)
+        if self._depth > 0:
+            self._buf.append(text[start:])
+        return None
+
+
+def _chunk_text(chunk: Any) -> str:
+    try:
+        return chunk.choices[0].delta.content or ""
+    except Exception:
+        return ""
+
+
+def _consume_stream(stream: Any, deadline: Optional[Deadline] = None) -> Tuple[str, bool]:
+    """Read a streamed reply until its first JSON object is complete, then close the stream.
+    Returns the content and whether the object was complete (else everything that arrived).
+    Raises TimeoutError when `deadline` passes while chunks are still arriving."""
+    scanner = JsonObjectScanner()
+    parts = []
+    try:
+        for chunk in stream:
+            if deadline is not None and deadline.expired:
+                raise TimeoutError("LLM deadline exceeded while streaming the reply")
+            text = _chunk_text(chunk)
+            parts.append(text)
+            obj = scanner.feed(text)
+            if obj is not None:
+                return obj, True
+    finally:
+        close = getattr(stream, "close", None)
+        if close is not None:
+            close()
+    return "".join(parts), False
+
+
+async def _consume_stream_async(stream: Any) -> Tuple[str, bool]:
+    """Async counterpart of `_consume_stream`."""
+    scanner = JsonObjectScanner()
+    parts = []
+    try:
+        async for chunk in stream:
+            text = _chunk_text(chunk)
+            parts.append(text)
+            obj = scanner.feed(text)
+            if obj is not None:
+                return obj, True
+    finally:
+        close = getattr(stream, "close", None)
+        if close is not None:
+            await close()
+    return "".join(parts), False
+
+
+def _extract_content(resp: Any) -> Optional[str]:
+    """Extract text from an OpenAI-style response object."""
+    try:
+        return resp.choices[0].message.content
+    except Exception:
+        # fallback if different shape (some clients use .text)
+        try:
+            return resp.choices[0].text
+        except Exception:
+            return None
+
+
+def _record_usage(span: Any, resp: Any, messages: List[Dict[str, str]], content: Optional[str]) -> None:
+    """Put prompt/response token counts on an instrumentation span (estimated when the server sends no usage)."""
+    usage = getattr(resp, "usage", None)
+    prompt = getattr(usage, "prompt_tokens", None)
+    completion = getattr(usage, "completion_tokens", None)
+    span.add("prompt_tokens", int(prompt) if prompt is not None else sum(estimate_tokens(m["content"]) for m in messages))
+    span.add("completion_tokens", int(completion) if completion is not None else estimate_tokens(content or ""))
+
+
+def parse_llm_json(content: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Parse the model reply; returns None for empty or non-JSON content."""
+    if not content or content.strip() == "":
+        return None
+    try:
+        result = json.loads(content)
+    except Exception:
+        return None
+    return result if isinstance(result, dict) else None
+
+
+# One client (and so one HTTP connection pool) per backend, shared by all calls in the process
+_CLIENTS: Dict[LLMBackend, Any] = {}
+_CLIENTS_LOCK = threading.Lock()
+
+
+def get_client(backend: LLMBackend) -> Any:
+    """Return the shared synchronous client for `backend`, creating it on first use."""
+    with _CLIENTS_LOCK:
+        client = _CLIENTS.get(backend)
+        if client is None:
+            # retries are ours (`src.resilience`), so they stay within the image's deadline
+            client = openai.OpenAI(api_key=backend.api_key, base_url=backend.base_url, max_retries=0)
+            _CLIENTS[backend] = client
+        return client
+
+
+def warm_up_clients() -> int:
+    """Create the shared clients for all configured backends; returns how many are ready."""
+    if not _has_openai():
+        return 0
+    backends = configured_backends()
+    for backend in backends:
+        get_client(backend)
+    return len(backends)
+
+
+def analyze_with_llm(image_path: str, ocr_text: str, verbose: bool = False, info: Optional["LLMCallInfo"] = None) -> Optional[Dict[str, Any]]:
+    """Optional: call Ollama or OpenAI (if configured) to get title+keywords.
+
+    Returns dict {"title": str, "keywords": [str]} or None if not available.
+    Backends are tried in order, each with retries of transient failures, all within the
+    image's deadline and skipping backends whose circuit breaker is open (`src.resilience`).
+    The OCR text is trimmed to the prompt token budget, and streamed replies are read
+    only until their JSON object is complete. `info`, when given, receives the backend,
+    attempts and latency, or the reason no reply was obtained (`fallback`).
+    """
+    info = info if info is not None else LLMCallInfo()
+    backends = configured_backends() if _has_openai() else []
+    if not backends:
+        info.fallback = "no_backend"
+        return None
+
+    messages = build_messages(ocr_text)
 
     if verbose:
-        print(f"[VERBOSE] LLM system_prompt:\n{system_prompt}", file=sys.stderr)
-        print(f"[VERBOSE] LLM user_prompt:\n{prompt}", file=sys.stderr)
+        print(f"[VERBOSE] LLM system_prompt:\n{messages[0]['content']}", file=sys.stderr)
+        print(f"[VERBOSE] LLM user_prompt:\n{messages[1]['content']}", file=sys.stderr)
 
-    # Prefer Ollama (local) if configured and openai library is available
-    if ollama_model and _HAS_OPENAI:
+    policy = retry_policy()
+    deadline = Deadline(policy.deadline)
+    start = time.perf_counter()
+    try:
+        for backend in backends:
+            if verbose:
+                print(f"[VERBOSE] Using {backend.name} service at {backend.base_url or 'default endpoint'} with model {backend.model}", file=sys.stderr)
+            answered, content = _call_backend(backend, messages, policy, deadline, info, verbose)
+            if answered:
+                if verbose:
+                    print(f"[VERBOSE] LLM JSON result: {content}", file=sys.stderr)
+                result = parse_llm_json(content)
+                info.fallback = None if result else "invalid_reply"
+                return result
+            # fall back to the next configured backend
+    finally:
+        info.latency_seconds = time.perf_counter() - start
+    return None
+
+
+def _call_backend(backend: LLMBackend, messages: List[Dict[str, str]], policy: RetryPolicy, deadline: Deadline,
+                  info: "LLMCallInfo", verbose: bool = False,
+                  send: Optional[Callable[[LLMBackend, List[Dict[str, str]], float, Deadline], Optional[str]]] = None,
+                  ) -> Tuple[bool, Optional[str]]:
+    """Send one request to `backend` (with `send`, default `_send_request`), retrying transient
+    failures with jittered backoff while the deadline allows. Returns (answered, content);
+    on failure `info.fallback` says why."""
+    send = send or _send_request
+    breaker = breaker_for(backend.name)
+    for attempt in range(policy.retries + 1):
+        if deadline.expired:
+            info.fallback = "deadline"
+            return False, None
+        if not breaker.allow():
+            info.fallback = "circuit_open"
+            if verbose:
+                print(f"[VERBOSE] {backend.name} circuit breaker is open, skipping it", file=sys.stderr)
+            return False, None
+        info.attempts += 1
         try:
+            content = send(backend, messages, deadline.timeout(policy.timeout), deadline)
+        except Exception as e:
+            breaker.record_failure()
+            info.error = str(e)
+            info.fallback = "deadline" if deadline.expired else "error"
             if verbose:
-                print(f"[VERBOSE] Using Ollama service at {ollama_host} with model {ollama_model}", file=sys.stderr)
-            
-            # Point the OpenAI client at the Ollama host (OpenAI-compatible)
-            client = openai.OpenAI(
-                api_key = os.environ.get("OLLAMA_API_KEY", ""),
-                base_url = ollama_host
-            )
-
-            # Enforce JSON-only output with a system message and request format
-            messages = [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": prompt},
-            ]
-            resp = client.chat.completions.create(
-                model=ollama_model,
-                messages=messages,
-                max_tokens=500,
-                temperature=0.0,
-                stream=False,
-                # pass format parameter to Ollama-compatible endpoint to request JSON
-                response_format={ "type": "json_object" }
-            )
-
-            # Extract text from the OpenAI-style response object
-            content = None
-            try:
-                content = resp.choices[0].message.content
-            except Exception:
-                # fallback if different shape (some clients use .text)
+                print(f"[VERBOSE] {backend.name} request failed (attempt {attempt + 1}): {e}", file=sys.stderr)
+            if not is_retryable(e) or attempt == policy.retries:
+                return False, None
+            delay = backoff_delay(attempt)
+            if delay >= deadline.remaining():
+                info.fallback = "deadline"
+                return False, None
+            time.sleep(delay)
+            continue
+        except BaseException:
+            # interrupted: no outcome, but a half-open breaker must not stay reserved for this probe
+            breaker.release()
+            raise
+        breaker.record_success()
+        info.backend = backend.name
+        info.error = None
+        return True, content
+    return False, None
+
+
+def _send_request(backend: LLMBackend, messages: List[Dict[str, str]], timeout: float, deadline: Deadline) -> Optional[str]:
+    stream = streaming_enabled()
+    with stage("llm.request", backend=backend.name, model=backend.model, streamed=stream) as span:
+        try:
+            resp = get_client(backend).chat.completions.create(**_request_kwargs(backend, messages, stream=stream, timeout=timeout))
+            # some OpenAI-compatible servers ignore `stream` and answer in one piece
+            if stream and not hasattr(resp, "choices"):
+                content, complete = _consume_stream(resp, deadline)
+                span.add("json_complete" if complete else "json_incomplete")
+                resp = None
+            else:
+                content = _extract_content(resp)
+        except Exception:
+            span.add("errors")
+            raise
+        _record_usage(span, resp, messages, content)
+    return content
+
+
+BATCH_SYSTEM_PROMPT = (
+    SYSTEM_PROMPT
+    + "\n\nThe user will provide OCR text from several images, each introduced by a line '### item <id>'.\n"
+    "Handle every item independently with the rules above and return a JSON object with this structure:\n"
+    "{\n  \"results\": [{\"id\": <id>, \"title\": \"concise title here\", \"keywords\": [\"keyword1\", ...]}, ...]\n}\n"
+    "Return exactly one entry per item, using the item ids given."
+)
+
+# rough per-item size of a {"id", "title", "keywords"} reply entry
+_BATCH_REPLY_TOKENS_PER_ITEM = 80
+DEFAULT_BATCH_TOKEN_BUDGET = 4000
+DEFAULT_BATCH_MAX_ITEMS = 16
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (about 4 characters per token for English text)."""
+    return len(text) // 4 + 1
+
+
+def plan_batches(ocr_texts: List[str], token_budget: int = DEFAULT_BATCH_TOKEN_BUDGET, max_items: int = DEFAULT_BATCH_MAX_ITEMS) -> List[List[int]]:
+    """Split item indexes into batches whose prompt plus expected reply fits `token_budget`.
+
+    The system prompt is paid once per batch, so batches are filled greedily in order;
+    an item too large to share a request gets a batch of its own.
+    """
+    fixed = estimate_tokens(BATCH_SYSTEM_PROMPT)
+    batches: List[List[int]] = []
+    current: List[int] = []
+    used = fixed
+    for i, text in enumerate(ocr_texts):
+        cost = estimate_tokens(text) + 10 + _BATCH_REPLY_TOKENS_PER_ITEM
+        if current and (used + cost > token_budget or len(current) >= max_items):
+            batches.append(current)
+            current, used = [], fixed
+        current.append(i)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+
+def build_batch_messages(ocr_texts: List[str]) -> List[Dict[str, str]]:
+    items = "\n\n".join(f"### item {i}\n{text}" for i, text in enumerate(ocr_texts))
+    return [
+        {"role": "system", "content": BATCH_SYSTEM_PROMPT},
+        {"role": "user", "content": f"Return the JSON object for these {len(ocr_texts)} OCR texts:\n\n{items}\n\n"},
+    ]
+
+
+def _validate_item(item: Any) -> Optional[Dict[str, Any]]:
+    """Return {"title", "keywords"} when `item` is a usable reply entry, else None."""
+    if not isinstance(item, dict):
+        return None
+    title = item.get("title")
+    if not isinstance(title, str) or not title.strip():
+        return None
+    keywords = item.get("keywords", [])
+    if isinstance(keywords, str):
+        keywords = [k.strip() for k in keywords.split(",") if k.strip()]
+    if not isinstance(keywords, list):
+        return None
+    return {"title": title.strip(), "keywords": [str(k) for k in keywords]}
+
+
+def parse_batch_reply(content: Optional[str], count: int) -> List[Optional[Dict[str, Any]]]:
+    """Map a batched reply back to its items; entries that are missing or invalid stay None."""
+    out: List[Optional[Dict[str, Any]]] = [None] * count
+    parsed = parse_llm_json(content)
+    entries = parsed.get("results") if parsed else None
+    if not isinstance(entries, list):
+        return out
+    for pos, entry in enumerate(entries):
+        idx = entry.get("id", pos) if isinstance(entry, dict) else pos
+        try:
+            idx = int(idx)
+        except (TypeError, ValueError):
+            continue
+        if 0 <= idx < count and out[idx] is None:
+            out[idx] = _validate_item(entry)
+    return out
+
+
+def _count(stats: Optional[Dict[str, int]], name: str, value: int = 1) -> None:
+    if stats is not None:
+        stats[name] = stats.get(name, 0) + value
+
+
+def _send_batch_request(backend: LLMBackend, messages: List[Dict[str, str]], items: int, timeout: float,
+                        stats: Optional[Dict[str, int]] = None) -> Optional[str]:
+    with stage("llm.batch_request", backend=backend.name, model=backend.model, items=items) as span:
+        try:
+            resp = get_client(backend).chat.completions.create(
+                **_request_kwargs(backend, messages, max_tokens=_BATCH_REPLY_TOKENS_PER_ITEM * items + 50, timeout=timeout))
+        except Exception:
+            span.add("errors")
+            raise
+        content = _extract_content(resp)
+        _record_usage(span, resp, messages, content)
+    _count(stats, "requests")
+    usage = getattr(resp, "usage", None)
+    _count(stats, "prompt_tokens", int(getattr(usage, "prompt_tokens", 0) or 0))
+    return content
+
+
+def analyze_batch_with_llm(
+        ocr_texts: List[str],
+        token_budget: int = DEFAULT_BATCH_TOKEN_BUDGET,
+        max_items: int = DEFAULT_BATCH_MAX_ITEMS,
+        verbose: bool = False,
+        stats: Optional[Dict[str, int]] = None,
+        infos: Optional[List["LLMCallInfo"]] = None,
+        ) -> List[Optional[Dict[str, Any]]]:
+    """Name several images with as few requests as possible.
+
+    OCR texts are packed into requests sized by `plan_batches`, each returning a JSON
+    array of {title, keywords} and retried like single requests (`_call_backend`).
+    Entries that are missing or fail validation are retried one by one with
+    `analyze_with_llm`. `stats`, when given, collects request, retry and prompt token
+    counts; `infos`, one `LLMCallInfo` per text, receives why an item got no reply.
+    """
+    results: List[Optional[Dict[str, Any]]] = [None] * len(ocr_texts)
+    infos = infos if infos is not None else [LLMCallInfo() for _ in ocr_texts]
+    if not _has_openai() or not ocr_texts or not configured_backends():
+        for info in infos:
+            info.fallback = "no_backend"
+        return results
+    ocr_texts = [trim_ocr_text(t) for t in ocr_texts]
+    policy = retry_policy()
+    # a batch reply is several images' worth of work: each attempt may take one image's whole deadline
+    batch_policy = replace(policy, timeout=policy.deadline)
+
+    for batch in plan_batches(ocr_texts, token_budget=token_budget, max_items=max_items):
+        texts = [ocr_texts[i] for i in batch]
+        replies: List[Optional[Dict[str, Any]]] = [None] * len(batch)
+        batch_info = LLMCallInfo()
+        if len(batch) > 1:
+            messages = build_batch_messages(texts)
+            deadline = Deadline(policy.deadline)
+            for backend in configured_backends():
+                if verbose:
+                    print(f"[VERBOSE] Batched request of {len(batch)} items to {backend.name} ({backend.model})", file=sys.stderr)
+                answered, content = _call_backend(
+                    backend, messages, batch_policy, deadline, batch_info, verbose,
+                    send=lambda backend, messages, timeout, deadline: _send_batch_request(backend, messages, len(batch), timeout, stats))
+                if answered:
+                    _count(stats, "batched_items", len(batch))
+                    replies = parse_batch_reply(content, len(batch))
+                    break
+                _count(stats, "circuit_open" if batch_info.fallback == "circuit_open" else "failures")
+
+        for pos, i in enumerate(batch):
+            if replies[pos] is None:
+                # not batched, or the batch reply was unusable for this item: ask for it on its own
+                if len(batch) > 1:
+                    _count(stats, "retried_items")
+                _count(stats, "requests")
+                replies[pos] = _validate_item(analyze_with_llm("", ocr_texts[i], verbose=verbose, info=infos[i]))
+                if replies[pos] is None and infos[i].fallback is None:
+                    infos[i].fallback = "invalid_reply"
+            else:
+                infos[i].backend = batch_info.backend
+                infos[i].attempts = batch_info.attempts
+            results[i] = replies[pos]
+
+    return results
+
+
+@dataclass
+class LLMCallInfo:
+    """Outcome and timing of one image's LLM call, over all backends and retries.
+    `fallback` says why no reply was obtained: no_backend, circuit_open, deadline, error
+    or invalid_reply."""
+    backend: Optional[str] = None
+    queued_seconds: float = 0.0
+    latency_seconds: float = 0.0
+    error: Optional[str] = None
+    attempts: int = 0
+    fallback: Optional[str] = None
+
+
+# request latencies kept by an AsyncLLMPool for its percentiles
+LATENCY_SAMPLES = 4096
+
+
+@dataclass
+class AsyncLLMPool:
+    """Async LLM client pool with a bounded number of in-flight requests.
+
+    Keeps one `openai.AsyncOpenAI` client (one keep-alive HTTP connection pool) per backend
+    and never has more than `max_in_flight` requests outstanding, so a batch can keep a
+    local Ollama server busy without overloading it. Use it from a single event loop.
+    """
+    max_in_flight: int = 0
+    # the most recent request latencies (a watch daemon runs for days)
+    latencies: deque = field(default_factory=lambda: deque(maxlen=LATENCY_SAMPLES))
+    requests: int = 0
+    failures: int = 0
+    in_flight: int = 0
+    peak_in_flight: int = 0
+
+    def __post_init__(self):
+        if self.max_in_flight <= 0:
+            self.max_in_flight = int(os.environ.get("LLM_MAX_IN_FLIGHT", "4"))
+        self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        self._clients: Dict[LLMBackend, Any] = {}
+
+    def _client(self, backend: LLMBackend) -> Any:
+        client = self._clients.get(backend)
+        if client is None:
+            kwargs: Dict[str, Any] = {"api_key": backend.api_key, "base_url": backend.base_url, "max_retries": 0}
+            http_client_cls = getattr(openai, "DefaultAsyncHttpxClient", None)
+            if http_client_cls is not None:
+                import httpx
+                limits = httpx.Limits(max_connections=self.max_in_flight, max_keepalive_connections=self.max_in_flight)
+                kwargs["http_client"] = http_client_cls(limits=limits)
+            client = openai.AsyncOpenAI(**kwargs)
+            self._clients[backend] = client
+        return client
+
+    async def analyze(self, ocr_text: str, verbose: bool = False) -> Tuple[Optional[Dict[str, Any]], LLMCallInfo]:
+        """Async counterpart of `analyze_with_llm`; also returns the call's outcome and timing.
+        The deadline starts before waiting for a free slot, so a backlog behind a slow
+        backend degrades to the fallback instead of piling up."""
+        info = LLMCallInfo()
+        backends = configured_backends() if _has_openai() else []
+        if not backends:
+            info.fallback = "no_backend"
+            return None, info
+
+        messages = build_messages(ocr_text)
+        policy = retry_policy()
+        deadline = Deadline(policy.deadline)
+        queued = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), deadline.remaining())
+        except asyncio.TimeoutError:
+            info.queued_seconds = time.perf_counter() - queued
+            info.fallback = "deadline"
+            return None, info
+        info.queued_seconds = time.perf_counter() - queued
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            for backend in backends:
+                answered, content = await self._call_backend(backend, messages, policy, deadline, info, verbose)
+                if answered:
+                    if verbose:
+                        print(f"[VERBOSE] LLM JSON result ({info.latency_seconds:.2f}s): {content}", file=sys.stderr)
+                    result = parse_llm_json(content)
+                    info.fallback = None if result else "invalid_reply"
+                    return result, info
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+        return None, info
+
+    async def _call_backend(self, backend: LLMBackend, messages: List[Dict[str, str]], policy: RetryPolicy,
+                            deadline: Deadline, info: LLMCallInfo, verbose: bool = False) -> Tuple[bool, Optional[str]]:
+        """Async counterpart of `_call_backend`."""
+        breaker = breaker_for(backend.name)
+        for attempt in range(policy.retries + 1):
+            if deadline.expired:
+                info.fallback = "deadline"
+                return False, None
+            if not breaker.allow():
+                info.fallback = "circuit_open"
+                return False, None
+            info.attempts += 1
+            self.requests += 1
+            start = time.perf_counter()
+            stream = streaming_enabled()
+            with stage("llm.request", backend=backend.name, model=backend.model, streamed=stream,
+                       queued_seconds=info.queued_seconds) as span:
                 try:
-                    content = resp.choices[0].text
+                    timeout = deadline.timeout(policy.timeout)
+                    resp = await asyncio.wait_for(
+                        self._client(backend).chat.completions.create(**_request_kwargs(backend, messages, stream=stream, timeout=timeout)),
+                        timeout)
+                    if stream and not hasattr(resp, "choices"):
+                        content, complete = await asyncio.wait_for(_consume_stream_async(resp), deadline.remaining())
+                        span.add("json_complete" if complete else "json_incomplete")
+                        resp = None
+                    else:
+                        content = _extract_content(resp)
                 except Exception as e:
+                    breaker.record_failure()
+                    self.failures += 1
+                    info.error = str(e) or type(e).__name__
+                    info.fallback = "deadline" if deadline.expired else "error"
+                    span.add("errors")
                     if verbose:
-                        print(f"[VERBOSE] Failed to extract content from Ollama response: {e}", file=sys.stderr)
+                        print(f"[VERBOSE] {backend.name} request failed (attempt {attempt + 1}): {info.error}", file=sys.stderr)
+                    retry = is_retryable(e) and attempt < policy.retries
                     content = None
+                except BaseException:
+                    # cancelled: no outcome, but a half-open breaker must not stay reserved for this probe
+                    breaker.release()
+                    raise
+                else:
+                    retry = None
+                    breaker.record_success()
+                    _record_usage(span, resp, messages, content)
+                finally:
+                    info.latency_seconds = time.perf_counter() - start
+                    self.latencies.append(info.latency_seconds)
+            if retry is None:
+                info.backend = backend.name
+                info.error = None
+                return True, content
+            if not retry:
+                return False, None
+            delay = backoff_delay(attempt)
+            if delay >= deadline.remaining():
+                info.fallback = "deadline"
+                return False, None
+            await asyncio.sleep(delay)
+        return False, None
 
-            if not content or content.strip() == "":
-                if verbose:
-                    print(f"[VERBOSE] Ollama response content is empty", file=sys.stderr)
-                return None
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "failures": self.failures,
+            "max_in_flight": self.max_in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "latency_p50": round(percentile(self.latencies, 50), 3),
+            "latency_p95": round(percentile(self.latencies, 95), 3),
+            "latency_max": round(max(self.latencies), 3) if self.latencies else 0.0,
+        }
 
-            if verbose:
-                print(f"[VERBOSE] LLM JSON result: {content}", file=sys.stderr)
+    async def aclose(self) -> None:
+        for client in self._clients.values():
+            await client.close()
+        self._clients.clear()
 
-            if content:
-                import json
-                try:
-                    result = json.loads(content)
-                    return result
-                except Exception:
-                    return None
-        except Exception as e:
-            # If Ollama via openai client fails, fall back to OpenAI path below
-            print(f"[VERBOSE] ollama via openai client failed: {e}", file=sys.stderr)
-            pass
 
-    # Fall back to OpenAI if available
-    try:
-        if api_key and model and _HAS_OPENAI:
-            if verbose:
-                print(f"[VERBOSE] Using OpenAI service with model {model}", file=sys.stderr)
-            
-            openai.api_key = api_key
-            resp = openai.ChatCompletion.create(
-                model=model,
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=300,
-            )
-            content = resp.choices[0].message.content
-            # attempt to parse JSON from content
-            import json
-            try:
-                result = json.loads(content)
-                if verbose:
-                    print(f"[VERBOSE] LLM JSON result: {json.dumps(result, ensure_ascii=False)}", file=sys.stderr)
-                return result
-            except Exception:
-                # best-effort: look for title: and keywords:
-                return None
-    except Exception:
-        return None
+async def analyze_with_llm_async(image_path: str, ocr_text: str, pool: AsyncLLMPool, verbose: bool = False) -> Optional[Dict[str, Any]]:
+    """Async variant of `analyze_with_llm` running through a shared `AsyncLLMPool`."""
+    result, _ = await pool.analyze(ocr_text, verbose=verbose)
+    return result
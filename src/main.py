@@ -1,16 +1,23 @@
 """Entry point CLI"""
-from dotenv import load_dotenv
 from pathlib import Path
+from typing import Any, Dict, List, Optional
 import json
+import time
 import typer
 import sys
 
 
-from src.naming_engine import generate_name_and_keywords, build_final_filename, is_filename_in_desired_format
+from src.naming_engine import is_filename_in_desired_format
 import os
 
-# Load environment variables from .env file
-load_dotenv(override=True)
+# OCR/LLM backends (Pillow, pytesseract, Vision, openai) are imported inside the commands,
+# after the cheap early exits, so `--help` and rejected files return quickly.
+
+
+def load_environment() -> None:
+    """Load environment variables from the .env file (once, when a command needs the backends)."""
+    from dotenv import load_dotenv
+    load_dotenv(override=True)
 
 # Initialize Typer app
 app = typer.Typer(rich_markup_mode="rich")
@@ -23,6 +30,17 @@ def analyze(
     rename: bool = typer.Option(False, "--rename", "-r", help="Rename the file to the suggested name with keywords and timestamp"),
     save_preprocessed_img: bool = typer.Option(False, "--save-preprocessed-img", "-s", help="Save the preprocessed image (as seen by OCR) to the current working directory"),
     force_tesseract: bool = typer.Option(False, "--tesseract", "-t", help="Use Tesseract OCR instead of Apple Vision"),
+    binarize: Optional[str] = typer.Option(None, "--binarize", "-b", help="Tesseract preprocessing: fixed, sauvola or niblack (default: $OCR_BINARIZATION or fixed)"),
+    progressive: bool = typer.Option(False, "--progressive", envvar="OCR_PROGRESSIVE", help="Tesseract: OCR the top band first and the rest only if it has too little text or confidence"),
+    adaptive: bool = typer.Option(False, "--adaptive", envvar="OCR_ADAPTIVE", help="Tesseract: when the words of the first pass have low confidence, try other thresholds, inversion and page segmentation modes in parallel and keep the best"),
+    no_cache: bool = typer.Option(False, "--no-cache", help="Do not read or write the OCR/LLM result cache"),
+    cache_dir: Optional[Path] = typer.Option(None, "--cache-dir", help="Directory of the result cache (default: $DPR_CACHE_DIR or ~/.cache/diagram-picture-renamer)"),
+    journal_path: Optional[Path] = typer.Option(None, "--journal", envvar="DPR_JOURNAL", help="Journal of renames, for `undo` and crash recovery (default: renames.jsonl in the cache directory)"),
+    reuse_similar: bool = typer.Option(False, "--reuse-similar", envvar="DPR_REUSE_SIMILAR", help="Reuse the name of a near-duplicate image (perceptual hash) instead of running OCR and the LLM"),
+    similar_distance: int = typer.Option(6, "--similar-distance", help="Max Hamming distance (of 64 bits) between perceptual hashes of near-duplicates"),
+    local_threshold: Optional[float] = typer.Option(None, "--local-threshold", envvar="DPR_LOCAL_THRESHOLD", help="Name images locally (TF-IDF/RAKE over the OCR text) without the LLM when the extractor's confidence (0-1) reaches this value"),
+    llm_deadline: Optional[float] = typer.Option(None, "--llm-deadline", envvar="LLM_DEADLINE", help="Seconds the LLM may take per image, retries and backends included, before falling back to heuristic naming (default 60)"),
+    profile: bool = typer.Option(False, "--profile", help="Add per-stage timings, sizes, token counts and cache hits to the output as `profile`"),
     verbose: bool = typer.Option(False, "--verbose", "-v", help="Print detailed information about processing steps"),
 ):
     """Analyze an image and optionally rename the file using the suggested name.
@@ -35,6 +53,11 @@ def analyze(
     """
     if not image_path.exists():
         raise typer.Exit(code=2)
+    set_binarization(binarize)
+    set_progressive(progressive)
+    set_adaptive(adaptive)
+    set_local_threshold(local_threshold)
+    set_llm_deadline(llm_deadline)
 
     if verbose:
         print(f"[VERBOSE] Input file: {image_path.absolute()}", file=sys.stderr)
@@ -46,44 +69,620 @@ def analyze(
     elif verbose:
         print(f"[VERBOSE] Filename does not match the target format, proceeding with analysis, \"force\" set to {force}", file=sys.stderr)
 
-    # Generate suggested name and keywords
-    result = generate_name_and_keywords(
-        str(image_path),
+    load_environment()
+    from src.instrumentation import tracing
+    from src.naming_engine import generate_name_and_keywords, rename_to_suggested
+
+    cache = open_result_cache(no_cache, cache_dir)
+    # a single rename is cheaper without listing the whole directory
+    open_renamer(rename, journal_path, cache_dir, index=False)
+    with tracing() as trace:
+        # Generate suggested name and keywords
+        result = generate_name_and_keywords(
+            str(image_path),
+            force_tesseract=force_tesseract,
+            verbose=verbose,
+            save_preprocessed_img=save_preprocessed_img,
+            cache=cache,
+            similar=open_similar_index(reuse_similar, cache, similar_distance),
+        )
+
+        if verbose:
+            print(f"[VERBOSE] Suggested title: {result.get('title')}", file=sys.stderr)
+            print(f"[VERBOSE] Keywords: {result.get('keywords')}", file=sys.stderr)
+
+        # perform rename if requested
+        renamed = not rename or rename_to_suggested(image_path, result)
+    if profile:
+        result["profile"] = trace.as_dict()
+
+    if not renamed:
+        # include error info in JSON and exit non-zero
+        print_result(result, verbose)
+        raise typer.Exit(code=3)
+
+    print_result(result, verbose)
+
+
+@app.command()
+def batch(
+    inputs: List[str] = typer.Argument(None, help="Image files, directories or glob patterns (use quotes for recursive '**' globs)"),
+    from_file: Optional[Path] = typer.Option(None, "--from-file", "-l", help="Read additional input paths from a file, one per line"),
+    recursive: bool = typer.Option(False, "--recursive", "-R", help="Descend into subdirectories of directory inputs"),
+    workers: int = typer.Option(0, "--workers", "-w", help="Number of OCR worker processes (0 = one per CPU core)"),
+    force: bool = typer.Option(False, "--force", "-f", help="Process files even if the filename seems already in the desired format"),
+    rename: bool = typer.Option(False, "--rename", "-r", help="Rename each file to the suggested name with keywords and timestamp"),
+    force_tesseract: bool = typer.Option(False, "--tesseract", "-t", help="Use Tesseract OCR instead of Apple Vision"),
+    binarize: Optional[str] = typer.Option(None, "--binarize", "-b", help="Tesseract preprocessing: fixed, sauvola or niblack (default: $OCR_BINARIZATION or fixed)"),
+    progressive: bool = typer.Option(False, "--progressive", envvar="OCR_PROGRESSIVE", help="Tesseract: OCR the top band first and the rest only if it has too little text or confidence"),
+    adaptive: bool = typer.Option(False, "--adaptive", envvar="OCR_ADAPTIVE", help="Tesseract: when the words of the first pass have low confidence, try other thresholds, inversion and page segmentation modes in parallel and keep the best"),
+    no_cache: bool = typer.Option(False, "--no-cache", help="Do not read or write the OCR/LLM result cache"),
+    cache_dir: Optional[Path] = typer.Option(None, "--cache-dir", help="Directory of the result cache (default: $DPR_CACHE_DIR or ~/.cache/diagram-picture-renamer)"),
+    journal_path: Optional[Path] = typer.Option(None, "--journal", envvar="DPR_JOURNAL", help="Journal of renames, for `undo` and crash recovery (default: renames.jsonl in the cache directory)"),
+    reuse_similar: bool = typer.Option(False, "--reuse-similar", envvar="DPR_REUSE_SIMILAR", help="Reuse the name of a near-duplicate image (perceptual hash) instead of running OCR and the LLM"),
+    similar_distance: int = typer.Option(6, "--similar-distance", help="Max Hamming distance (of 64 bits) between perceptual hashes of near-duplicates"),
+    local_threshold: Optional[float] = typer.Option(None, "--local-threshold", envvar="DPR_LOCAL_THRESHOLD", help="Name images locally (TF-IDF/RAKE over the OCR text) without the LLM when the extractor's confidence (0-1) reaches this value"),
+    llm_deadline: Optional[float] = typer.Option(None, "--llm-deadline", envvar="LLM_DEADLINE", help="Seconds the LLM may take per image, retries and backends included, before falling back to heuristic naming (default 60)"),
+    pipeline: bool = typer.Option(False, "--pipeline", "-p", help="Overlap OCR, LLM and rename stages with bounded queues between them"),
+    llm_concurrency: int = typer.Option(0, "--llm-concurrency", help="Max in-flight LLM requests in pipeline mode (0 = $LLM_MAX_IN_FLIGHT or 4)"),
+    queue_size: int = typer.Option(16, "--queue-size", help="Capacity of each queue between pipeline stages"),
+    llm_batch_tokens: int = typer.Option(0, "--llm-batch-tokens", help="Name several images per LLM request, packing OCR texts up to this token budget (0 = one request per image; not used with --pipeline)"),
+    incremental: bool = typer.Option(False, "--incremental", "-i", help="Skip files unchanged since they were last processed (see --manifest)"),
+    manifest_path: Optional[Path] = typer.Option(None, "--manifest", envvar="DPR_MANIFEST", help="Manifest of processed files (implies --incremental; default: manifest.sqlite3 in the cache directory)"),
+    shard: Optional[str] = typer.Option(None, "--shard", envvar="DPR_SHARD", help="Process only shard i of N (1-based, e.g. 2/4) of the inputs, picked by a stable hash, so several machines can split one archive"),
+    shard_by: str = typer.Option("path", "--shard-by", help="What shards hash: path (as given) or content (size and first 64 KiB, stable across renames)"),
+    jsonl: bool = typer.Option(False, "--jsonl", help="Print each result as a JSON line as soon as it is done, then a line with the stats, instead of one JSON object at the end"),
+    profile: bool = typer.Option(False, "--profile", help="Add per-stage timings, sizes, token counts and cache hits per file and in total"),
+    trace_file: Optional[Path] = typer.Option(None, "--trace-file", envvar="DPR_TRACE_FILE", help="Append one JSON line of per-stage measurements per file to this file"),
+    metrics_file: Optional[Path] = typer.Option(None, "--metrics-file", envvar="DPR_METRICS_FILE", help="Write cumulative per-stage counters to this Prometheus textfile"),
+    verbose: bool = typer.Option(False, "--verbose", "-v", help="Print detailed information about processing steps"),
+):
+    """Analyze many images in one run, optionally renaming them.
+
+    OCR runs in a pool of worker processes; naming and renaming happen in this process
+    as soon as each OCR result is ready. With `--pipeline` the OCR, LLM and rename stages
+    run concurrently and per-stage queue depth and utilization are reported.
+    With `--incremental`, files recorded in the manifest as processed and unchanged since
+    (same device/inode, size and mtime) are skipped without being opened; files named by
+    heuristics because the LLM was unavailable are named again.
+    With `--shard i/N` only the inputs hashed to shard i are processed (see `merge`).
+    Prints one JSON object with per-file results and aggregate throughput statistics,
+    or with `--jsonl` one line per result as it finishes and a final stats line.
+    """
+    from src.batch import collect_images
+    from src.sharding import SHARD_KEYS, JsonlWriter, parse_shard, select_shard
+
+    set_binarization(binarize)
+    set_progressive(progressive)
+    set_adaptive(adaptive)
+    set_local_threshold(local_threshold)
+    set_llm_deadline(llm_deadline)
+    paths = collect_images(inputs or [], file_list=from_file, recursive=recursive)
+    if not paths:
+        print("error: no input images found", file=sys.stderr)
+        raise typer.Exit(code=2)
+    if shard:
+        if shard_by not in SHARD_KEYS:
+            print(f"error: unknown shard key \"{shard_by}\", expected one of {', '.join(SHARD_KEYS)}", file=sys.stderr)
+            raise typer.Exit(code=2)
+        try:
+            index, shards = parse_shard(shard)
+        except ValueError as e:
+            print(f"error: {e}", file=sys.stderr)
+            raise typer.Exit(code=2)
+        inputs_total = len(paths)
+        paths = select_shard(paths, index, shards, by=shard_by)
+        if verbose:
+            print(f"[VERBOSE] shard {index}/{shards}: {len(paths)} of {inputs_total} input files", file=sys.stderr)
+    writer = JsonlWriter(shard) if jsonl else None
+
+    start = time.perf_counter()
+    results = []
+    pending = []
+    candidates = paths
+    manifest = open_manifest(incremental or manifest_path is not None, manifest_path, cache_dir)
+    diff = None
+    if manifest is not None and not force:
+        diff = manifest.diff(paths, rename=rename)
+        candidates = diff.pending
+        for p, stored in diff.unchanged:
+            results.append(_manifest_entry(p, stored, skipped="unchanged since the last run"))
+    # a heuristic fallback name is in the target format, but is meant to be replaced
+    retried = set(diff.fallback) if diff is not None else set()
+    for p in candidates:
+        if not force and p not in retried and is_filename_in_desired_format(p.name):
+            results.append({"file": str(p), "skipped": "filename already matches the target format"})
+        else:
+            pending.append(p)
+
+    if verbose:
+        print(f"[VERBOSE] {len(paths)} input files, {len(pending)} to process, {len(paths) - len(pending)} skipped", file=sys.stderr)
+    if writer is not None:
+        writer.emit_missing(results)
+
+    renamer = open_renamer(rename, journal_path, cache_dir)
+    if diff is not None and diff.rename_only:
+        # named on an earlier run but not renamed: only the renames are left to do
+        from src.naming_engine import rename_many_to_suggested
+        entries = [_manifest_entry(p, stored) for p, stored in diff.rename_only]
+        rename_many_to_suggested([(p, entry) for (p, _), entry in zip(diff.rename_only, entries)])
+        for entry in entries:
+            manifest.record(entry)
+            results.append(entry)
+            if writer is not None:
+                writer.emit(entry)
+
+    load_environment()
+    cache = open_result_cache(no_cache, cache_dir)
+    profiler = open_profiler(profile, trace_file, metrics_file)
+    callbacks = [cb for cb in (manifest.record if manifest is not None else None, writer.emit if writer is not None else None) if cb]
+
+    def notify(entry: Dict[str, Any]) -> None:
+        for callback in callbacks:
+            callback(entry)
+
+    on_result = notify if callbacks else None
+    similar = open_similar_index(reuse_similar, cache, similar_distance)
+    stages = None
+    llm_stats: Dict[str, int] = {}
+    if pipeline:
+        from src.pipeline import Pipeline
+        engine = Pipeline(
+            ocr_workers=workers or None,
+            llm_concurrency=llm_concurrency or None,
+            queue_size=queue_size,
+            rename=rename,
+            force_tesseract=force_tesseract,
+            cache=cache,
+            verbose=verbose,
+            on_result=on_result,
+            profiler=profiler,
+            similar=similar,
+        )
+        outcome = engine.run(pending)
+        results.extend(outcome["results"])
+        stages = outcome["stages"]
+    else:
+        results.extend(_run_batch_sequential_naming(
+            pending, workers, rename, force_tesseract, cache, verbose,
+            llm_batch_tokens=llm_batch_tokens, llm_stats=llm_stats, profiler=profiler, on_result=on_result,
+            similar=similar))
+    profiler.close()
+    if renamer is not None:
+        from src.renamer import set_default_renamer
+        renamer.close()
+        set_default_renamer(None)
+
+    elapsed = time.perf_counter() - start
+    processed = len(pending)
+    errors = sum(1 for r in results if "error" in r or "rename_error" in r)
+    report = {
+        "results": results,
+        "stats": {
+            "files": len(paths),
+            "processed": processed,
+            "skipped": len(paths) - processed,
+            "errors": errors,
+            "elapsed_seconds": round(elapsed, 3),
+            "ocr_seconds": round(sum(r.get("ocr_seconds", 0.0) for r in results), 3),
+            "images_per_second": round(processed / elapsed, 3) if elapsed > 0 else 0.0,
+        },
+    }
+    if stages is not None:
+        report["stats"]["stages"] = stages
+    if llm_stats:
+        report["stats"]["llm"] = llm_stats
+    paths_taken: Dict[str, int] = {}
+    for r in results:
+        if "naming_path" in r:
+            paths_taken[r["naming_path"]] = paths_taken.get(r["naming_path"], 0) + 1
+    report["stats"]["naming_paths"] = paths_taken
+    from src.resilience import breaker_stats
+    breakers = breaker_stats()
+    if breakers:
+        report["stats"]["breakers"] = breakers
+    if cache is not None:
+        report["stats"]["cache"] = dict(cache.stats)
+    if similar is not None:
+        report["stats"]["similar"] = {"reused": sum(1 for r in results if "similar_to" in r), "known": len(similar.tree)}
+    if manifest is not None:
+        report["stats"]["manifest"] = {
+            "unchanged": len(diff.unchanged) if diff else 0,
+            "rename_only": len(diff.rename_only) if diff else 0,
+            "records": len(manifest),
+        }
+        manifest.close()
+    if profile:
+        report["stats"]["profile"] = profiler.totals.as_dict()
+    if shard:
+        report["shard"] = shard
+    if writer is not None:
+        writer.emit_missing(results)
+        writer.summary(report["stats"])
+    else:
+        print_result(report, verbose)
+    if errors:
+        raise typer.Exit(code=3)
+
+
+@app.command()
+def watch(
+    directory: Path = typer.Argument(..., help="Folder to watch for new images"),
+    recursive: bool = typer.Option(False, "--recursive", "-R", help="Also watch subdirectories"),
+    rename: bool = typer.Option(False, "--rename", "-r", help="Rename each new file to the suggested name with keywords and timestamp"),
+    workers: int = typer.Option(2, "--workers", "-w", help="Number of OCR worker processes kept warm"),
+    settle: float = typer.Option(2.0, "--settle", help="Seconds a file's size and mtime must stay unchanged before it is processed"),
+    poll_interval: float = typer.Option(2.0, "--poll-interval", help="Seconds between directory scans when polling"),
+    polling: bool = typer.Option(False, "--polling", help="Poll the folder instead of using inotify"),
+    scan_existing: bool = typer.Option(False, "--scan-existing", help="Also process images already in the folder at startup"),
+    force_tesseract: bool = typer.Option(False, "--tesseract", "-t", help="Use Tesseract OCR instead of Apple Vision"),
+    binarize: Optional[str] = typer.Option(None, "--binarize", "-b", help="Tesseract preprocessing: fixed, sauvola or niblack (default: $OCR_BINARIZATION or fixed)"),
+    progressive: bool = typer.Option(False, "--progressive", envvar="OCR_PROGRESSIVE", help="Tesseract: OCR the top band first and the rest only if it has too little text or confidence"),
+    adaptive: bool = typer.Option(False, "--adaptive", envvar="OCR_ADAPTIVE", help="Tesseract: when the words of the first pass have low confidence, try other thresholds, inversion and page segmentation modes in parallel and keep the best"),
+    no_cache: bool = typer.Option(False, "--no-cache", help="Do not read or write the OCR/LLM result cache"),
+    cache_dir: Optional[Path] = typer.Option(None, "--cache-dir", help="Directory of the result cache (default: $DPR_CACHE_DIR or ~/.cache/diagram-picture-renamer)"),
+    journal_path: Optional[Path] = typer.Option(None, "--journal", envvar="DPR_JOURNAL", help="Journal of renames, for `undo` and crash recovery (default: renames.jsonl in the cache directory)"),
+    reuse_similar: bool = typer.Option(False, "--reuse-similar", envvar="DPR_REUSE_SIMILAR", help="Reuse the name of a near-duplicate image (perceptual hash) instead of running OCR and the LLM"),
+    similar_distance: int = typer.Option(6, "--similar-distance", help="Max Hamming distance (of 64 bits) between perceptual hashes of near-duplicates"),
+    local_threshold: Optional[float] = typer.Option(None, "--local-threshold", envvar="DPR_LOCAL_THRESHOLD", help="Name images locally (TF-IDF/RAKE over the OCR text) without the LLM when the extractor's confidence (0-1) reaches this value"),
+    llm_deadline: Optional[float] = typer.Option(None, "--llm-deadline", envvar="LLM_DEADLINE", help="Seconds the LLM may take per image, retries and backends included, before falling back to heuristic naming (default 60)"),
+    profile: bool = typer.Option(False, "--profile", help="Add per-stage timings, sizes, token counts and cache hits to each output line"),
+    trace_file: Optional[Path] = typer.Option(None, "--trace-file", envvar="DPR_TRACE_FILE", help="Append one JSON line of per-stage measurements per file to this file"),
+    metrics_file: Optional[Path] = typer.Option(None, "--metrics-file", envvar="DPR_METRICS_FILE", help="Write cumulative per-stage counters to this Prometheus textfile"),
+    verbose: bool = typer.Option(False, "--verbose", "-v", help="Print detailed information about processing steps"),
+):
+    """Watch a folder and analyze (and optionally rename) images as they arrive.
+
+    Uses inotify on Linux and falls back to polling elsewhere. Files are processed once
+    their size and mtime have settled; names already in the target format are skipped.
+    Prints one JSON line per processed file. Stop with Ctrl-C.
+    """
+    if not directory.is_dir():
+        print(f"error: not a directory \"{directory}\"", file=sys.stderr)
+        raise typer.Exit(code=2)
+    set_binarization(binarize)
+    set_progressive(progressive)
+    set_adaptive(adaptive)
+    set_local_threshold(local_threshold)
+    set_llm_deadline(llm_deadline)
+    load_environment()
+    from src.watcher import FolderWatcher
+
+    cache = open_result_cache(no_cache, cache_dir)
+    open_renamer(rename, journal_path, cache_dir)
+    watcher = FolderWatcher(
+        directory,
+        rename=rename,
+        workers=workers,
+        settle=settle,
+        poll_interval=poll_interval,
+        polling=polling,
+        recursive=recursive,
         force_tesseract=force_tesseract,
+        cache=cache,
         verbose=verbose,
-        save_preprocessed_img=save_preprocessed_img
+        on_result=lambda entry: print(json.dumps(entry, ensure_ascii=False), flush=True),
+        profiler=open_profiler(profile, trace_file, metrics_file),
+        similar=open_similar_index(reuse_similar, cache, similar_distance),
     )
+    try:
+        watcher.run(scan_existing=scan_existing)
+    except KeyboardInterrupt:
+        if verbose:
+            print(f"[VERBOSE] Stopped after {watcher.processed} files", file=sys.stderr)
+    finally:
+        watcher.profiler.close()
 
-    if verbose:
-        print(f"[VERBOSE] Suggested title: {result.get('title')}", file=sys.stderr)
-        print(f"[VERBOSE] Keywords: {result.get('keywords')}", file=sys.stderr)
 
-    # perform rename if requested
-    if rename:
-        try:
-            suggested_title = result.get("title")
-            keywords = result.get("keywords", [])
-            original_suffix = image_path.suffix or ""
-            new_name = build_final_filename(suggested_title, keywords, original_suffix)
-
-            # ensure we don't overwrite existing files — add numeric suffix if needed
-            parent = image_path.parent
-            candidate = parent / new_name
-            i = 1
-            base, ext = os.path.splitext(new_name)
-            while candidate.exists():
-                candidate = parent / f"{base}_{i}{ext}"
-                i += 1
-
-            image_path.rename(candidate)
-            result["renamed_to"] = str(candidate.name)
-        except Exception as e:
-            # include error info in JSON and exit non-zero
-            result["rename_error"] = str(e)
-            output = json.dumps(result, ensure_ascii=False, indent=2, sort_keys=True) if verbose else json.dumps(result, ensure_ascii=False)
-            print(output)
-            raise typer.Exit(code=3)
+@app.command()
+def undo(
+    run: Optional[str] = typer.Option(None, "--run", help="Run to undo (default: the latest one with renames left to undo)"),
+    list_runs: bool = typer.Option(False, "--list", help="List the runs with renames that can be undone"),
+    dry_run: bool = typer.Option(False, "--dry-run", "-n", help="Only report which files would be moved back"),
+    journal_path: Optional[Path] = typer.Option(None, "--journal", envvar="DPR_JOURNAL", help="Journal of renames (default: renames.jsonl in the cache directory)"),
+    cache_dir: Optional[Path] = typer.Option(None, "--cache-dir", help="Directory of the result cache (default: $DPR_CACHE_DIR or ~/.cache/diagram-picture-renamer)"),
+    verbose: bool = typer.Option(False, "--verbose", "-v", help="Print detailed information about processing steps"),
+):
+    """Move the files renamed by a run back to their original names, using the rename journal.
+
+    Files are restored newest rename first; a file that is gone or whose original name is
+    taken again is reported under `conflicts` and left alone.
+    """
+    from src import renamer
+
+    path = journal_path or (Path(cache_dir) / "renames.jsonl" if cache_dir else renamer.default_journal_path())
+    if list_runs:
+        print_result({"runs": renamer.runs(path)}, verbose)
+        return
+    report = renamer.undo(path, run=run, dry_run=dry_run)
+    if report["run"] is None:
+        print(f"error: nothing to undo in \"{path}\"", file=sys.stderr)
+        raise typer.Exit(code=2)
+    print_result(report, verbose)
+    if report["conflicts"]:
+        raise typer.Exit(code=3)
+
+
+@app.command()
+def merge(
+    outputs: List[Path] = typer.Argument(..., help="Outputs of `batch --jsonl` or `batch` runs, and manifests of shards"),
+    verbose: bool = typer.Option(False, "--verbose", "-v", help="Pretty-print the merged report"),
+):
+    """Combine the outputs and manifests of sharded or resumed batch runs into one report.
+
+    Each file is reported once, with its latest result; a later skip (e.g. of an already
+    renamed file) does not hide an earlier result. The stats list the shards seen and,
+    when all outputs come from one `--shard i/N` split, the shards still missing.
+    """
+    from src.sharding import merge_outputs
+
+    missing = [p for p in outputs if not p.is_file()]
+    if missing:
+        print(f"error: not a file \"{missing[0]}\"", file=sys.stderr)
+        raise typer.Exit(code=2)
+    print_result(merge_outputs(outputs), verbose)
+
+
+def _run_batch_sequential_naming(
+        pending: List[Path],
+        workers: int,
+        rename: bool,
+        force_tesseract: bool,
+        cache,
+        verbose: bool,
+        llm_batch_tokens: int = 0,
+        llm_stats: Optional[Dict[str, int]] = None,
+        profiler=None,
+        on_result=None,
+        similar=None,
+        group_similar: bool = True,
+        ) -> List[Dict[str, Any]]:
+    """OCR on the worker pool, then naming and renaming in this process as results arrive.
+    With `llm_batch_tokens` > 0, several images are named per LLM request.
+    With `similar` (a `NearDuplicateIndex`), near-duplicates of earlier images and (with
+    `group_similar`) of other images in this batch reuse their result instead of being
+    OCR'd and named. `on_result` is called with each finished per-file result."""
+    from src.batch import run_ocr_pool
+    from src.image_handler import has_ocr_backend
+    from src.instrumentation import Profiler, Trace, stage, tracing
+    from src.llm_integration import estimate_tokens
+    from src.naming_engine import lookup_similar, name_from_ocr_text, name_many_from_ocr_texts, ocr_cache_key, rename_to_suggested
+
+    profiler = profiler or Profiler()
+    results = []
+
+    def finish(entry: Dict[str, Any], trace: Trace) -> None:
+        if rename:
+            with tracing(trace):
+                rename_to_suggested(Path(entry["file"]), entry)
+        if similar is not None and "similar_to" not in entry:
+            similar.add(entry["file"], entry)
+        results.append(entry)
+        profiler.file_done(entry, trace)
+        if on_result is not None:
+            on_result(entry)
+        if verbose:
+            print(f"[VERBOSE] {entry['file']} -> {entry.get('renamed_to') or entry.get('title')}", file=sys.stderr)
+
+    traces: Dict[str, Trace] = {}
+    followers: Dict[str, Any] = {}
+    if similar is not None:
+        similar.prefetch([str(p) for p in pending])
+        remaining = []
+        for p in pending:
+            trace = traces[str(p)] = Trace()
+            with tracing(trace):
+                reused = lookup_similar(str(p), similar, verbose)
+            if reused is not None:
+                finish(dict(reused, file=str(p)), traces.pop(str(p)))
+            else:
+                remaining.append(p)
+        if group_similar:
+            followers = similar.group([str(p) for p in remaining])
+        pending = [p for p in remaining if str(p) not in followers]
+
+    # serve OCR from the cache where possible, only dispatch misses to the worker pool
+    use_ocr_cache = cache is not None and has_ocr_backend(force_tesseract)
+    cached_ocr = []
+    ocr_keys: Dict[str, str] = {}
+    to_ocr = []
+    for p in pending:
+        trace = traces[str(p)] = traces.get(str(p)) or Trace()
+        if use_ocr_cache:
+            with tracing(trace), stage("cache.ocr") as span:
+                ocr_keys[str(p)] = ocr_cache_key(str(p), force_tesseract)
+                text = cache.get("ocr", ocr_keys[str(p)])
+                span.add("hits" if text is not None else "misses")
+            if text is not None:
+                cached_ocr.append((str(p), text, 0.0, None, {}))
+                continue
+        to_ocr.append(p)
+
+    def ocr_results():
+        yield from cached_ocr
+        for item in run_ocr_pool(to_ocr, workers=workers or None, force_tesseract=force_tesseract):
+            if use_ocr_cache and not item[3]:
+                cache.put("ocr", ocr_keys[item[0]], item[1])
+            yield item
+
+    # with LLM batching, OCR results are buffered until they fill one request's token budget
+    buffered: List[Dict[str, Any]] = []
+    buffered_tokens = 0
+
+    def flush() -> None:
+        nonlocal buffered_tokens
+        # the batched requests are shared; their stages are booked on the first file
+        with tracing(traces[buffered[0]["file"]]):
+            named = name_many_from_ocr_texts(
+                [(e["file"], e.pop("_ocr_text")) for e in buffered],
+                token_budget=llm_batch_tokens, verbose=verbose, cache=cache, stats=llm_stats)
+        for entry, name in zip(buffered, named):
+            entry.update(name)
+            finish(entry, traces.pop(entry["file"]))
+        buffered.clear()
+        buffered_tokens = 0
+
+    for image_path, ocr_text, ocr_time, error, ocr_stages in ocr_results():
+        entry: Dict[str, Any] = {"file": image_path}
+        trace = traces[image_path]
+        trace.merge(ocr_stages)
+        if error:
+            entry["error"] = error
+            results.append(entry)
+            profiler.file_done(entry, traces.pop(image_path))
+            if on_result is not None:
+                on_result(entry)
+            continue
+
+        entry["ocr_seconds"] = round(ocr_time, 3)
+        if llm_batch_tokens > 0:
+            entry["_ocr_text"] = ocr_text
+            buffered.append(entry)
+            buffered_tokens += estimate_tokens(ocr_text)
+            if buffered_tokens >= llm_batch_tokens:
+                flush()
+            continue
+
+        with tracing(trace):
+            entry.update(name_from_ocr_text(image_path, ocr_text, verbose=verbose, cache=cache))
+        finish(entry, traces.pop(image_path))
+
+    if buffered:
+        flush()
+
+    if followers:
+        from src.phash import reusable
+
+        # near-duplicates within the batch take their leader's result once it is known,
+        # unless it is a heuristic fallback: then they are named on their own
+        by_file = {r["file"]: r for r in results}
+        orphans = []
+        for path, (leader, distance) in followers.items():
+            done = by_file.get(leader, {})
+            if not reusable(done):
+                orphans.append(Path(path))
+                continue
+            entry = {"file": path, "title": done["title"], "keywords": done.get("keywords", []),
+                     "filename": Path(path).name, "similar_to": done.get("renamed_to") or Path(leader).name,
+                     "similar_distance": distance, "naming_path": "similar"}
+            finish(entry, traces.pop(path, None) or Trace())
+        if orphans:
+            results.extend(_run_batch_sequential_naming(
+                orphans, workers, rename, force_tesseract, cache, verbose,
+                llm_batch_tokens=llm_batch_tokens, llm_stats=llm_stats, profiler=profiler, on_result=on_result,
+                similar=similar, group_similar=False))
+    return results
+
+
+def set_binarization(method: Optional[str]) -> None:
+    """Select the OCR binarization method; set in the environment so OCR worker processes see it too."""
+    if not method:
+        return
+    from src.preprocess import BINARIZATION_METHODS
+    if method not in BINARIZATION_METHODS:
+        print(f"error: unknown binarization method \"{method}\", expected one of {', '.join(BINARIZATION_METHODS)}", file=sys.stderr)
+        raise typer.Exit(code=2)
+    os.environ["OCR_BINARIZATION"] = method
+
+
+def set_progressive(enabled: bool) -> None:
+    """Switch title-band-first OCR on for this process and its OCR workers."""
+    if enabled:
+        os.environ["OCR_PROGRESSIVE"] = "1"
+
+
+def set_adaptive(enabled: bool) -> None:
+    """Switch confidence-driven extra OCR passes on for this process and its OCR workers."""
+    if enabled:
+        os.environ["OCR_ADAPTIVE"] = "1"
+
+
+def set_local_threshold(threshold: Optional[float]) -> None:
+    """Let confident local extraction replace the LLM call (see `src.keyword_extractor`)."""
+    if threshold is None:
+        return
+    if not 0.0 <= threshold <= 1.0:
+        print(f"error: --local-threshold must be between 0 and 1, got {threshold}", file=sys.stderr)
+        raise typer.Exit(code=2)
+    os.environ["DPR_LOCAL_THRESHOLD"] = str(threshold)
+
+
+def set_llm_deadline(seconds: Optional[float]) -> None:
+    """Per-image LLM latency budget, read by `src.resilience.retry_policy`."""
+    if seconds is None:
+        return
+    if seconds <= 0:
+        print(f"error: --llm-deadline must be positive, got {seconds}", file=sys.stderr)
+        raise typer.Exit(code=2)
+    os.environ["LLM_DEADLINE"] = str(seconds)
+
+
+def open_result_cache(no_cache: bool = False, cache_dir: Optional[Path] = None):
+    """Open the persistent OCR/LLM result cache, or return None when disabled or unavailable."""
+    if no_cache or os.environ.get("DPR_NO_CACHE"):
+        return None
+    from src.cache import open_cache
+    try:
+        return open_cache(cache_dir)
+    except Exception as e:
+        print(f"warning: result cache disabled: {e}", file=sys.stderr)
+        return None
+
+
+def open_similar_index(enabled: bool, cache=None, max_distance: int = 6):
+    """Near-duplicate index backed by the result cache (in-memory only without one), or None when disabled."""
+    if not enabled:
+        return None
+    from src.phash import NearDuplicateIndex
+    return NearDuplicateIndex(cache, max_distance=max_distance)
+
+
+def open_renamer(enabled: bool, journal_path: Optional[Path] = None, cache_dir: Optional[Path] = None, index: bool = True):
+    """Journaled renamer used by every rename of this process, or None when not renaming.
+    Interrupted renames of earlier runs are settled when the journal is opened."""
+    if not enabled:
+        return None
+    from src.renamer import RenameJournal, Renamer, default_journal_path, set_default_renamer
+    path = journal_path or (Path(cache_dir) / "renames.jsonl" if cache_dir else default_journal_path())
+    try:
+        renamer = Renamer(RenameJournal(path), index=index)
+    except Exception as e:
+        print(f"warning: rename journal disabled: {e}", file=sys.stderr)
+        renamer = Renamer(index=index)
+    set_default_renamer(renamer)
+    return renamer
+
+
+def open_manifest(enabled: bool, manifest_path: Optional[Path] = None, cache_dir: Optional[Path] = None):
+    """Open the processed-file manifest for incremental runs, or return None when disabled or unavailable."""
+    if not enabled:
+        return None
+    from src.manifest import Manifest, default_manifest_path
+    path = manifest_path or (Path(cache_dir) / "manifest.sqlite3" if cache_dir else default_manifest_path())
+    try:
+        return Manifest(path)
+    except Exception as e:
+        print(f"warning: manifest disabled: {e}", file=sys.stderr)
+        return None
+
+
+def _manifest_entry(path: Path, stored: Dict[str, Any], **extra: Any) -> Dict[str, Any]:
+    """A batch result for `path` built from the result stored in the manifest."""
+    entry: Dict[str, Any] = {"file": str(path)}
+    for key in ("title", "keywords"):
+        if key in stored:
+            entry[key] = stored[key]
+    entry.update(extra)
+    return entry
+
+
+def open_profiler(profile: bool = False, trace_file: Optional[Path] = None, metrics_file: Optional[Path] = None):
+    """Instrumentation for batch and watch runs: per-file profiles and the trace/metrics sinks."""
+    from src.instrumentation import Profiler, TraceSinks
+    return Profiler(embed=profile, sinks=TraceSinks(trace_file, metrics_file))
+
 
+def print_result(result: Dict[str, Any], verbose: bool = False) -> None:
     output = json.dumps(result, ensure_ascii=False, indent=2, sort_keys=True) if verbose else json.dumps(result, ensure_ascii=False)
     print(output)
 
@@ -0,0 +1,224 @@
+"""Manifest of processed files for incremental batch runs (SQLite).
+
+Files are identified by (device, inode), so a record survives renames and moves within a
+filesystem. Each record keeps the size, mtime and content hash seen when the file was
+processed, plus its last result; renames are kept as history. A re-run then only needs a
+`stat` per file to tell unchanged files from new or modified ones (`Manifest.diff`); the
+content hash is read only when the mtime changed but the size did not (a touched file).
+Files that failed, or were only named by heuristics because the LLM was unavailable, are
+processed again.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from src.cache import file_digest
+
+# bump when the stored records change meaning; older manifests are then rebuilt
+FORMAT_VERSION = 1
+
+# results are committed in groups rather than one transaction per file
+_COMMIT_EVERY = 100
+
+# per-run measurements that are not worth keeping as the file's last result
+_VOLATILE_KEYS = ("ocr_seconds", "profile")
+
+# statuses of records whose file is processed again by the next run
+DISPATCHED_STATUSES = ("error", "fallback")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    dev INTEGER NOT NULL,
+    ino INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    digest TEXT NOT NULL,
+    path TEXT NOT NULL,
+    status TEXT NOT NULL,
+    result TEXT NOT NULL,
+    updated REAL NOT NULL,
+    PRIMARY KEY (dev, ino)
+);
+CREATE TABLE IF NOT EXISTS renames (
+    dev INTEGER NOT NULL,
+    ino INTEGER NOT NULL,
+    old_path TEXT NOT NULL,
+    new_path TEXT NOT NULL,
+    ts REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS renames_file ON renames (dev, ino);
+"""
+
+
+@dataclass
+class ManifestDiff:
+    """Outcome of `Manifest.diff`: what a run still has to do."""
+    # new, modified, previously failed or heuristically named files: full OCR + naming
+    pending: List[Path] = field(default_factory=list)
+    # the pending files whose stored name is a heuristic fallback (already in the target format)
+    fallback: List[Path] = field(default_factory=list)
+    # unchanged files with their stored result
+    unchanged: List[Tuple[Path, Dict[str, Any]]] = field(default_factory=list)
+    # unchanged and named, but not (successfully) renamed yet: rename with the stored result
+    rename_only: List[Tuple[Path, Dict[str, Any]]] = field(default_factory=list)
+
+
+class Manifest:
+    """SQLite index of processed files keyed by (device, inode)."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._pending_writes = 0
+        self._conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'format_version'").fetchone()
+        if row is None or int(row[0]) != FORMAT_VERSION:
+            self._conn.execute("DELETE FROM files")
+            self._conn.execute("DELETE FROM renames")
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('format_version', ?)", (str(FORMAT_VERSION),))
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    def diff(self, paths: Iterable[Path], rename: bool = False) -> ManifestDiff:
+        """Split `paths` into files to process, unchanged files and (with `rename`) files
+        that only still need their rename. One stat per file; all records are read in one query."""
+        with self._lock:
+            rows = self._conn.execute("SELECT dev, ino, size, mtime_ns, digest, path, status, result FROM files").fetchall()
+        known = {(r[0], r[1]): r[2:] for r in rows}
+        out = ManifestDiff()
+        touched = []
+        moved = []
+        for p in paths:
+            try:
+                st = os.stat(p)
+            except OSError:
+                out.pending.append(p)
+                continue
+            rec = known.get((st.st_dev, st.st_ino))
+            if rec is None or rec[4] in DISPATCHED_STATUSES:
+                out.pending.append(p)
+                if rec is not None and rec[4] == "fallback":
+                    out.fallback.append(p)
+                continue
+            size, mtime_ns, digest, old_path, _, result = rec
+            if st.st_size != size:
+                out.pending.append(p)
+                continue
+            if st.st_mtime_ns != mtime_ns:
+                # same size, new mtime: only the content can tell
+                try:
+                    same = file_digest(str(p)) == digest
+                except OSError:
+                    same = False
+                if not same:
+                    out.pending.append(p)
+                    continue
+                touched.append((st.st_mtime_ns, st.st_dev, st.st_ino))
+            if old_path != str(p):
+                moved.append((str(p), st.st_dev, st.st_ino))
+            stored = json.loads(result)
+            if rename and "renamed_to" not in stored:
+                out.rename_only.append((p, stored))
+            else:
+                out.unchanged.append((p, stored))
+        if touched or moved:
+            with self._lock:
+                self._conn.executemany("UPDATE files SET mtime_ns = ? WHERE dev = ? AND ino = ?", touched)
+                self._conn.executemany("UPDATE files SET path = ? WHERE dev = ? AND ino = ?", moved)
+                self._conn.commit()
+        return out
+
+    def record(self, result: Dict[str, Any]) -> None:
+        """Store a finished per-file result (as produced by batch), following a rename."""
+        path = Path(result["file"])
+        if result.get("renamed_to"):
+            path = path.parent / result["renamed_to"]
+        try:
+            st = os.stat(path)
+            digest = file_digest(str(path))
+        except OSError:
+            return
+        stored = {k: v for k, v in result.items() if k not in _VOLATILE_KEYS}
+        status = result_status(result)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (dev, ino, size, mtime_ns, digest, path, status, result, updated)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns, digest, str(path), status,
+                 json.dumps(stored, ensure_ascii=False), now),
+            )
+            if result.get("renamed_to"):
+                self._conn.execute(
+                    "INSERT INTO renames (dev, ino, old_path, new_path, ts) VALUES (?, ?, ?, ?, ?)",
+                    (st.st_dev, st.st_ino, result["file"], str(path), now),
+                )
+            self._pending_writes += 1
+            if self._pending_writes >= _COMMIT_EVERY:
+                self._conn.commit()
+                self._pending_writes = 0
+
+    def lookup(self, path: Path) -> Optional[Dict[str, Any]]:
+        """The stored record of the file at `path` (by device and inode), with its rename history."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size, mtime_ns, digest, path, status, result, updated FROM files WHERE dev = ? AND ino = ?",
+                (st.st_dev, st.st_ino),
+            ).fetchone()
+            if row is None:
+                return None
+            renames = self._conn.execute(
+                "SELECT old_path, new_path, ts FROM renames WHERE dev = ? AND ino = ? ORDER BY ts",
+                (st.st_dev, st.st_ino),
+            ).fetchall()
+        size, mtime_ns, digest, stored_path, status, result, updated = row
+        return {
+            "path": stored_path,
+            "size": size,
+            "mtime_ns": mtime_ns,
+            "digest": digest,
+            "status": status,
+            "result": json.loads(result),
+            "updated": updated,
+            "renames": [{"from": a, "to": b, "ts": ts} for a, b, ts in renames],
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
+
+
+def result_status(result: Dict[str, Any]) -> str:
+    """"error", "fallback" (named by heuristics, the LLM should be asked again) or "ok"."""
+    if "error" in result:
+        return "error"
+    if result.get("llm_fallback") or result.get("naming_path") == "heuristic":
+        return "fallback"
+    return "ok"
+
+
+def default_manifest_path() -> Path:
+    """Next to the result cache: $DPR_CACHE_DIR or the default user cache directory."""
+    from src.cache import DEFAULT_CACHE_DIR
+    return Path(os.environ.get("DPR_CACHE_DIR") or DEFAULT_CACHE_DIR) / "manifest.sqlite3"
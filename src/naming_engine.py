@@ -2,60 +2,263 @@ import re
 import sys
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
 
-from src.image_handler import load_image, resize_image, extract_text_with_ocr
-from src.llm_integration import analyze_with_llm
+from typing import TYPE_CHECKING
+
+from src.instrumentation import count, stage
+
+# OCR and LLM backends are imported inside the functions that need them, so that cheap
+# calls such as `is_filename_in_desired_format` do not pay for Pillow or the openai SDK
+if TYPE_CHECKING:
+    from src.cache import ResultCache
+    from src.llm_integration import AsyncLLMPool
+    from src.phash import NearDuplicateIndex
+    from src.renamer import Renamer
 
 
 def generate_name_and_keywords(
         image_path: str, 
         force_tesseract: bool = False,
         verbose: bool = False, 
-        save_preprocessed_img: bool = False
+        save_preprocessed_img: bool = False,
+        cache: Optional["ResultCache"] = None,
+        similar: Optional["NearDuplicateIndex"] = None
         ) -> Dict[str, Any]:
     """Generate a suggested name and keywords for the given image.
     Uses OCR and LLM analysis to extract title and keywords.
-    Falls back to heuristics if LLM analysis fails."""
+    Falls back to heuristics if LLM analysis fails.
+    When a cache is given, OCR text and LLM results are reused across runs; with
+    `similar`, a near-duplicate's earlier result is reused without OCR or LLM."""
+    from src.image_handler import extract_text_with_ocr, has_ocr_backend
 
-    p = Path(image_path)
+    if similar is not None:
+        reused = lookup_similar(image_path, similar, verbose)
+        if reused is not None:
+            return reused
 
-    ocr_text = extract_text_with_ocr(image_path, force_tesseract=force_tesseract, verbose=verbose, save_preprocessed_img=save_preprocessed_img)
+    ocr_text = None
+    key = None
+    # saving the preprocessed image needs a real OCR run
+    if cache is not None and not save_preprocessed_img and has_ocr_backend(force_tesseract):
+        with stage("cache.ocr") as span:
+            key = ocr_cache_key(image_path, force_tesseract)
+            ocr_text = cache.get("ocr", key)
+            span.add("hits" if ocr_text is not None else "misses")
+        if verbose:
+            print(f"[VERBOSE] OCR cache {'hit' if ocr_text is not None else 'miss'}", file=sys.stderr)
 
-    # try LLM first
-    llm = analyze_with_llm(image_path, ocr_text, verbose=verbose)
-    if llm and isinstance(llm, dict) and llm.get("title"):
-        return {"title": llm.get("title"), "keywords": llm.get("keywords", []), "filename": p.name}
+    if ocr_text is None:
+        ocr_text = extract_text_with_ocr(image_path, force_tesseract=force_tesseract, verbose=verbose, save_preprocessed_img=save_preprocessed_img)
+        if key is not None:
+            cache.put("ocr", key, ocr_text)
 
-    # fallback heuristics
+    result = name_from_ocr_text(image_path, ocr_text, verbose=verbose, cache=cache)
+    if similar is not None:
+        similar.add(image_path, result)
+    return result
+
+
+def lookup_similar(image_path: str, similar: "NearDuplicateIndex", verbose: bool = False) -> Optional[Dict[str, Any]]:
+    """The result of a near-duplicate named earlier, as a naming result for `image_path`."""
+    with stage("similar.lookup") as span:
+        reused = similar.lookup(image_path)
+        span.add("hits" if reused is not None else "misses")
+    if reused is None:
+        return None
     if verbose:
-        print(f"[VERBOSE] LLM analysis failed or returned no title, falling back to heuristics", file=sys.stderr)
+        print(f"[VERBOSE] near-duplicate of {reused['similar_to']} (distance {reused['similar_distance']}), reusing its name", file=sys.stderr)
+    return dict(reused, filename=Path(image_path).name, naming_path="similar")
+
+
+def ocr_cache_key(image_path: str, force_tesseract: bool = False) -> str:
+    """Cache key for OCR output: image content hash plus backend and preprocessing parameters."""
+    from src.cache import file_digest, make_key
+    from src.image_handler import ocr_backend_name, ocr_preprocess_params
+    return make_key("ocr", file_digest(image_path), ocr_backend_name(force_tesseract), ocr_preprocess_params())
+
+
+def llm_cache_key(ocr_text: str) -> str:
+    """Cache key for LLM output: OCR text plus configured models and prompt."""
+    from src.cache import make_key
+    from src.llm_integration import llm_cache_identity
+    return make_key("llm", ocr_text, llm_cache_identity())
+
+
+def name_from_ocr_text(image_path: str, ocr_text: str, verbose: bool = False, cache: Optional["ResultCache"] = None) -> Dict[str, Any]:
+    """Generate a suggested name and keywords from OCR text already extracted from the image.
+    Used by batch runs, where OCR happens in worker processes and naming in the parent."""
+    from src.llm_integration import LLMCallInfo, analyze_with_llm
+
+    local = name_locally(image_path, ocr_text, cache=cache, verbose=verbose)
+    if local is not None:
+        return local
+
+    # then the LLM, within its deadline
+    info = LLMCallInfo()
+    key, llm = _lookup_llm_cache(ocr_text, cache, verbose)
+    path = "llm_cache"
+    if llm is None:
+        llm = analyze_with_llm(image_path, ocr_text, verbose=verbose, info=info)
+        path = "llm"
+        _store_llm_cache(key, llm, cache)
+    if _is_valid_llm_result(llm):
+        return _llm_name(image_path, llm, path)
+
+    return heuristic_name(image_path, ocr_text, verbose=verbose, cache=cache, fallback=info.fallback)
+
+
+async def name_from_ocr_text_async(
+        image_path: str,
+        ocr_text: str,
+        pool: "AsyncLLMPool",
+        verbose: bool = False,
+        cache: Optional["ResultCache"] = None
+        ) -> Dict[str, Any]:
+    """Async variant of `name_from_ocr_text`; the LLM request goes through the shared pool."""
+
+    local = name_locally(image_path, ocr_text, cache=cache, verbose=verbose)
+    if local is not None:
+        return local
+
+    key, llm = _lookup_llm_cache(ocr_text, cache, verbose)
+    path, fallback = "llm_cache", None
+    if llm is None:
+        llm, info = await pool.analyze(ocr_text, verbose=verbose)
+        path, fallback = "llm", info.fallback
+        _store_llm_cache(key, llm, cache)
+    if _is_valid_llm_result(llm):
+        return _llm_name(image_path, llm, path)
+
+    return heuristic_name(image_path, ocr_text, verbose=verbose, cache=cache, fallback=fallback)
+
+
+def name_many_from_ocr_texts(
+        items: List[Tuple[str, str]],
+        token_budget: Optional[int] = None,
+        verbose: bool = False,
+        cache: Optional["ResultCache"] = None,
+        stats: Optional[Dict[str, int]] = None
+        ) -> List[Dict[str, Any]]:
+    """Name several (image_path, ocr_text) items, packing the LLM calls into batched requests.
+    Items named locally or found in the cache skip the LLM; items it could not name fall back to heuristics."""
+    from src.llm_integration import DEFAULT_BATCH_TOKEN_BUDGET, LLMCallInfo, analyze_batch_with_llm
+
+    local: List[Optional[Dict[str, Any]]] = [name_locally(path, text, cache=cache, verbose=verbose) for path, text in items]
+    llm_results: List[Any] = [None] * len(items)
+    keys: List[Optional[str]] = [None] * len(items)
+    fallbacks: List[Optional[str]] = [None] * len(items)
+    misses = []
+    for i, (_, ocr_text) in enumerate(items):
+        if local[i] is not None:
+            continue
+        keys[i], llm_results[i] = _lookup_llm_cache(ocr_text, cache, verbose)
+        if llm_results[i] is None:
+            misses.append(i)
+    hits = set(range(len(items))) - set(misses)
+
+    if misses:
+        infos = [LLMCallInfo() for _ in misses]
+        replies = analyze_batch_with_llm([items[i][1] for i in misses], token_budget=token_budget or DEFAULT_BATCH_TOKEN_BUDGET,
+                                         verbose=verbose, stats=stats, infos=infos)
+        for i, reply, info in zip(misses, replies, infos):
+            llm_results[i] = reply
+            fallbacks[i] = info.fallback
+            _store_llm_cache(keys[i], reply, cache)
+
+    out = []
+    for i, ((image_path, ocr_text), named, llm) in enumerate(zip(items, local, llm_results)):
+        if named is not None:
+            out.append(named)
+        elif _is_valid_llm_result(llm):
+            out.append(_llm_name(image_path, llm, "llm_cache" if i in hits else "llm"))
+        else:
+            out.append(heuristic_name(image_path, ocr_text, verbose=verbose, cache=cache, fallback=fallbacks[i]))
+    return out
 
-    title_base = None
-    if ocr_text and ocr_text.strip():
-        # take first long line
-        lines = [l.strip() for l in ocr_text.splitlines() if l.strip()]
-        if lines:
-            title_base = lines[0][:80]
 
-    if not title_base:
-        # use filename without extension
-        title_base = p.stem
+def name_locally(image_path: str, ocr_text: str, cache: Optional["ResultCache"] = None, verbose: bool = False) -> Optional[Dict[str, Any]]:
+    """Name the image from its OCR text alone when the local extractor is at least as confident
+    as $DPR_LOCAL_THRESHOLD; None means the LLM should be asked. Either way the text is added
+    to the corpus statistics the extractor's IDF comes from."""
+    from src.keyword_extractor import corpus_for, extract_local, local_threshold
+
+    threshold = local_threshold()
+    with stage("naming.local") as span:
+        corpus = corpus_for(cache)
+        local = extract_local(ocr_text, corpus) if threshold is not None else None
+        corpus.add(ocr_text)
+        if local is not None:
+            span.set(confidence=local.confidence)
+    if local is None:
+        return None
+    if verbose:
+        print(f"[VERBOSE] Local extraction: {local.title!r} {local.keywords} (confidence {local.confidence}, threshold {threshold})", file=sys.stderr)
+    if not local.title or local.confidence < threshold:
+        return None
+    count("local_names")
+    return {"title": local.title, "keywords": local.keywords, "filename": Path(image_path).name,
+            "naming_path": "local", "local_confidence": local.confidence}
+
+
+def _llm_name(image_path: str, llm: Dict[str, Any], path: str) -> Dict[str, Any]:
+    return {"title": llm.get("title"), "keywords": llm.get("keywords", []), "filename": Path(image_path).name, "naming_path": path}
+
+
+def _is_valid_llm_result(llm: Any) -> bool:
+    return bool(llm and isinstance(llm, dict) and llm.get("title"))
+
+
+def _lookup_llm_cache(ocr_text: str, cache: Optional["ResultCache"], verbose: bool = False):
+    if cache is None:
+        return None, None
+    with stage("cache.llm") as span:
+        key = llm_cache_key(ocr_text)
+        llm = cache.get("llm", key)
+        span.add("hits" if llm is not None else "misses")
+    if verbose:
+        print(f"[VERBOSE] LLM cache {'hit' if llm is not None else 'miss'}", file=sys.stderr)
+    return key, llm
+
+
+def _store_llm_cache(key: Optional[str], llm: Any, cache: Optional["ResultCache"]) -> None:
+    if key is not None and _is_valid_llm_result(llm):
+        cache.put("llm", key, llm)
+
+
+def heuristic_name(image_path: str, ocr_text: str, verbose: bool = False, cache: Optional["ResultCache"] = None,
+                   fallback: Optional[str] = None) -> Dict[str, Any]:
+    """Name the image with the local extractor (or from the file name) when no LLM result is available.
+    `fallback` is why there is none (see `LLMCallInfo.fallback`) and is kept as `llm_fallback`."""
+    from src.keyword_extractor import corpus_for, extract_local
+
+    p = Path(image_path)
+
+    # fallback heuristics
+    count("heuristic_names")
+    if verbose:
+        print(f"[VERBOSE] LLM analysis failed or returned no title ({fallback or 'no reply'}), falling back to heuristics", file=sys.stderr)
+
+    local = extract_local(ocr_text, corpus_for(cache))
+    # use filename without extension when the OCR text gives no title
+    title_base = local.title or p.stem
 
     timestamp = datetime.now().strftime("%Y%m%d")
     title = f"{title_base} {timestamp}"
 
-    # keywords: tokens from OCR and filename tokens
-    keywords = set()
-    for tok in re.split(r"\W+", title_base):
-        if len(tok) > 2:
-            keywords.add(tok.lower())
-    keywords.add(p.suffix.replace('.', ''))
+    # keywords: extracted terms, else tokens of the title, and the file type
+    keywords = list(local.keywords) or [tok.lower() for tok in re.split(r"\W+", title_base) if len(tok) > 2]
+    suffix = p.suffix.replace('.', '')
+    if suffix and suffix not in keywords:
+        keywords.append(suffix)
 
-    keywords_str = ", ".join(sorted(keywords))
+    keywords_str = ", ".join(keywords)
     # Inserisci le keyword nel nome del file, separandole con virgola e spazio
     filename_with_keywords = f"{title_base} [{keywords_str}] {timestamp}{p.suffix}"
-    return {"title": title, "keywords": keywords_str, "filename": filename_with_keywords}
+    result = {"title": title, "keywords": keywords, "filename": filename_with_keywords, "naming_path": "heuristic"}
+    if fallback:
+        result["llm_fallback"] = fallback
+    return result
 
 
 def _slugify(text: str) -> str:
@@ -110,6 +313,42 @@ def build_final_filename(suggested_title: str, keywords: list, original_suffix:
     return f"{name_core}{original_suffix}"
 
 
+def rename_to_suggested(image_path: Path, result: Dict[str, Any], renamer: Optional["Renamer"] = None) -> bool:
+    """Rename the file to the name built from the result's title and keywords.
+
+    Stores `renamed_to` (or `rename_error`) in `result` and returns True on success.
+    Names are resolved and claimed by `renamer` (default: `src.renamer.default_renamer()`).
+    """
+    return rename_many_to_suggested([(image_path, result)], renamer)[0]
+
+
+def rename_many_to_suggested(items: List[Tuple[Path, Dict[str, Any]]], renamer: Optional["Renamer"] = None) -> List[bool]:
+    """`rename_to_suggested` for several files at once, sharing one journal sync."""
+    from src.renamer import default_renamer
+
+    with stage("rename") as span:
+        renamer = renamer or default_renamer()
+        moves = []
+        for image_path, result in items:
+            new_name = build_final_filename(result.get("title"), result.get("keywords", []), image_path.suffix or "")
+            moves.append((image_path, new_name))
+        span.set(files=len(moves))
+        try:
+            outcomes = renamer.rename_many(moves)
+        except Exception as e:
+            # e.g. the journal could not be written: nothing was moved
+            outcomes = [e] * len(moves)
+        oks = []
+        for (_, result), outcome in zip(items, outcomes):
+            if isinstance(outcome, Exception):
+                result["rename_error"] = str(outcome)
+                oks.append(False)
+            else:
+                result["renamed_to"] = outcome.name
+                oks.append(True)
+        return oks
+
+
 def is_filename_in_desired_format(filename: str) -> bool:
     """Return True if the given filename already matches the desired pattern:
     <safe_title> [kw1,kw2] - YYYYMMDDHHMMSS.ext  OR  <safe_title> - YYYYMMDDHHMMSS.ext
@@ -0,0 +1,234 @@
+"""Perceptual hashes to spot near-duplicate images and reuse their naming results.
+
+Screenshot folders hold many near-identical captures of the same diagram (re-saves, small
+crops, JPEG vs PNG). Each image gets a 64-bit pHash (DCT of a 32x32 thumbnail) and a
+64-bit dHash (gradients of a 9x8 thumbnail), both computed with NumPy from the reduced
+grayscale decode of `load_image`. Prior results are kept in the result cache (kind
+"phash", keyed by the hashes) and indexed by pHash in a BK-tree, so finding everything
+within a Hamming distance takes a fraction of the comparisons a linear scan would. A
+match must be close in both hashes, which keeps unrelated images with a similar layout
+apart.
+"""
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+# default Hamming distances (of 64 bits) still counted as the same picture
+DEFAULT_MAX_DISTANCE = 6
+DHASH_SLACK = 6
+# results worth reusing for near-duplicates: named by the LLM (now or from its cache) or the local extractor
+TRUSTED_NAMING_PATHS = ("llm", "llm_cache", "local")
+
+# decode width for hashing: enough detail for the 32x32 thumbnail, cheap with draft/reduce
+_HASH_DECODE_WIDTH = 256
+
+_DCT_CACHE: Dict[int, np.ndarray] = {}
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    m = _DCT_CACHE.get(n)
+    if m is None:
+        k = np.arange(n)[:, None]
+        i = np.arange(n)[None, :]
+        m = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+        m[0] /= np.sqrt(2.0)
+        _DCT_CACHE[n] = m
+    return m
+
+
+def _bits_to_int(bits: np.ndarray) -> int:
+    out = 0
+    for b in bits.ravel():
+        out = (out << 1) | int(b)
+    return out
+
+
+def phash(img: Image.Image) -> int:
+    """64-bit DCT hash: low 8x8 frequencies (without the DC term) against their median."""
+    small = np.asarray(img.convert("L").resize((32, 32), Image.LANCZOS), dtype=np.float64)
+    m = _dct_matrix(32)
+    low = (m @ small @ m.T)[:8, :8].ravel()
+    return _bits_to_int(low > np.median(low[1:]))
+
+
+def dhash(img: Image.Image) -> int:
+    """64-bit difference hash: is each pixel brighter than its right neighbour (9x8 thumbnail)."""
+    small = np.asarray(img.convert("L").resize((9, 8), Image.LANCZOS), dtype=np.int16)
+    return _bits_to_int(small[:, 1:] > small[:, :-1])
+
+
+def image_hashes(path: str) -> Tuple[int, int]:
+    """(pHash, dHash) of the image at `path`, from a reduced grayscale decode."""
+    from src.image_handler import load_image
+
+    img = load_image(path, max_width=_HASH_DECODE_WIDTH, mode="L")
+    return phash(img), dhash(img)
+
+
+def reusable(result: Dict[str, Any]) -> bool:
+    """Whether a naming result may be copied to near-duplicates. A heuristic fallback (LLM
+    outage, deadline) may not: it would spread to every near-duplicate instead of asking
+    the LLM again."""
+    return bool(result.get("title")) and "error" not in result and not result.get("llm_fallback") \
+        and result.get("naming_path") in TRUSTED_NAMING_PATHS
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class BKTree:
+    """Burkhard-Keller tree over 64-bit hashes with Hamming distance.
+
+    Each node's children are keyed by their distance to it; by the triangle inequality a
+    search with radius r only descends into children keyed within [d - r, d + r].
+    """
+
+    def __init__(self):
+        self._root: Optional[list] = None  # [hash, values, {distance: child}]
+        self.size = 0
+
+    def add(self, key: int, value: Any) -> None:
+        self.size += 1
+        if self._root is None:
+            self._root = [key, [value], {}]
+            return
+        node = self._root
+        while True:
+            d = hamming(key, node[0])
+            if d == 0:
+                node[1].append(value)
+                return
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [key, [value], {}]
+                return
+            node = child
+
+    def search(self, key: int, radius: int) -> List[Tuple[int, Any]]:
+        """All (distance, value) within `radius` of `key`, closest first."""
+        out = []
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node = stack.pop()
+            d = hamming(key, node[0])
+            if d <= radius:
+                out.extend((d, v) for v in node[1])
+            for dist, child in node[2].items():
+                if d - radius <= dist <= d + radius:
+                    stack.append(child)
+        out.sort(key=lambda item: item[0])
+        return out
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __iter__(self) -> Iterator[Any]:
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node = stack.pop()
+            yield from node[1]
+            stack.extend(node[2].values())
+
+
+class NearDuplicateIndex:
+    """Prior naming results, findable by perceptual similarity.
+
+    `lookup(path)` returns the closest stored result within `max_distance` (pHash, with
+    DHASH_SLACK more allowed on the dHash) as {"title", "keywords", "similar_to",
+    "similar_distance"}, or None. `add(path, result)` stores a finished result; entries are
+    persisted in the result cache, so later runs find them too. Safe to share between threads.
+    """
+
+    def __init__(self, cache=None, max_distance: int = DEFAULT_MAX_DISTANCE):
+        self.cache = cache
+        self.max_distance = max_distance
+        self.tree = BKTree()
+        self._hashes: Dict[str, Tuple[int, int]] = {}
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0}
+        self._lock = threading.Lock()
+        if cache is not None:
+            for _, entry in cache.items("phash"):
+                self.tree.add(entry["phash"], (entry["dhash"], entry))
+
+    def hashes(self, path: str) -> Tuple[int, int]:
+        h = self._hashes.get(path)
+        if h is None:
+            h = self._hashes[path] = image_hashes(path)
+        return h
+
+    def prefetch(self, paths: List[str], workers: Optional[int] = None) -> None:
+        """Hash many images concurrently (decoding releases the GIL); failures are skipped."""
+        from concurrent.futures import ThreadPoolExecutor
+
+        def one(path: str):
+            try:
+                return path, image_hashes(path)
+            except Exception:
+                return path, None
+
+        todo = [p for p in paths if p not in self._hashes]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for path, h in pool.map(one, todo):
+                if h is not None:
+                    self._hashes[path] = h
+
+    def _closest(self, tree: BKTree, p: int, d: int) -> Optional[Tuple[int, Any]]:
+        for distance, value in tree.search(p, self.max_distance):
+            if hamming(d, value[0]) <= self.max_distance + DHASH_SLACK:
+                return distance, value[1]
+        return None
+
+    def lookup(self, path: str) -> Optional[Dict[str, Any]]:
+        try:
+            p, d = self.hashes(path)
+        except Exception:
+            return None
+        with self._lock:
+            found = self._closest(self.tree, p, d)
+            self.stats["misses" if found is None else "hits"] += 1
+        if found is None:
+            return None
+        distance, entry = found
+        return {
+            "title": entry["title"],
+            "keywords": entry["keywords"],
+            "similar_to": entry["file"],
+            "similar_distance": distance,
+        }
+
+    def group(self, paths: List[str]) -> Dict[str, Tuple[str, int]]:
+        """Near-duplicates among `paths` themselves: {follower: (leader, distance)}, where the
+        leader is the first of its group. Only leaders need processing; followers reuse
+        their result."""
+        leaders = BKTree()
+        followers = {}
+        for path in paths:
+            try:
+                p, d = self.hashes(path)
+            except Exception:
+                continue
+            found = self._closest(leaders, p, d)
+            if found is None:
+                leaders.add(p, (d, path))
+            else:
+                followers[path] = (found[1], found[0])
+        return followers
+
+    def add(self, path: str, result: Dict[str, Any]) -> None:
+        """Remember `result` for the image at `path`, if it is `reusable`."""
+        if not reusable(result):
+            return
+        try:
+            p, d = self.hashes(path)
+        except Exception:
+            return
+        entry = {"phash": p, "dhash": d, "file": result.get("renamed_to") or Path(path).name,
+                 "title": result["title"], "keywords": result.get("keywords", [])}
+        with self._lock:
+            self.tree.add(p, (d, entry))
+        if self.cache is not None:
+            self.cache.put("phash", f"{p:016x}{d:016x}", entry)
@@ -0,0 +1,245 @@
+"""Staged streaming pipeline: OCR (processes) -> LLM (async) -> rename (single writer).
+
+Stages are connected by bounded queues, so a slow stage applies backpressure to the
+ones before it instead of letting work pile up in memory, and all three resources
+(CPU for OCR, the LLM server, the filesystem) are kept busy at the same time.
+"""
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from src.batch import _ocr_worker
+from src.cache import ResultCache
+from src.instrumentation import Profiler, Trace, run_traced, tracing
+from src.llm_integration import AsyncLLMPool
+from src.naming_engine import lookup_similar, name_from_ocr_text_async, ocr_cache_key, rename_many_to_suggested
+from src.image_handler import has_ocr_backend
+
+# sentinel telling a stage worker that its input is exhausted
+_DONE = object()
+
+
+@dataclass
+class StageStats:
+    """Counters for one pipeline stage; queue depth refers to the stage's input queue."""
+    name: str
+    workers: int
+    items: int = 0
+    errors: int = 0
+    busy_seconds: float = 0.0
+    queue_max: int = 0
+    queue_total: int = 0
+    queue_samples: int = 0
+
+    def sample_queue(self, depth: int) -> None:
+        self.queue_max = max(self.queue_max, depth)
+        self.queue_total += depth
+        self.queue_samples += 1
+
+    def as_dict(self, elapsed: float) -> Dict[str, Any]:
+        capacity = elapsed * self.workers
+        return {
+            "workers": self.workers,
+            "items": self.items,
+            "errors": self.errors,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "utilization": round(self.busy_seconds / capacity, 3) if capacity > 0 else 0.0,
+            "queue_depth_max": self.queue_max,
+            "queue_depth_avg": round(self.queue_total / self.queue_samples, 2) if self.queue_samples else 0.0,
+        }
+
+
+@dataclass
+class PipelineItem:
+    path: str
+    ocr_text: str = ""
+    result: Dict[str, Any] = field(default_factory=dict)
+    trace: Trace = field(default_factory=Trace)
+
+
+class Pipeline:
+    """Run OCR, naming and renaming for many images with the stages overlapped.
+
+    - OCR: `ocr_workers` processes (cache hits skip the pool)
+    - LLM: up to `llm_concurrency` naming coroutines sharing one `AsyncLLMPool`
+    - rename: a single writer, so renames in the same directory never race
+    With `similar` (a `NearDuplicateIndex`), near-duplicates of images named earlier skip
+    OCR and LLM and reuse that result. `on_result` is called with each finished per-file result, in completion order.
+    """
+
+    def __init__(
+            self,
+            ocr_workers: Optional[int] = None,
+            llm_concurrency: Optional[int] = None,
+            queue_size: int = 16,
+            rename: bool = False,
+            force_tesseract: bool = False,
+            cache: Optional[ResultCache] = None,
+            verbose: bool = False,
+            on_result: Optional[Callable[[Dict[str, Any]], None]] = None,
+            profiler: Optional[Profiler] = None,
+            similar=None,
+            ):
+        self.ocr_workers = ocr_workers or os.cpu_count() or 1
+        self.llm_pool = AsyncLLMPool(max_in_flight=llm_concurrency or 0)
+        self.llm_concurrency = self.llm_pool.max_in_flight
+        self.queue_size = max(1, queue_size)
+        self.rename = rename
+        self.force_tesseract = force_tesseract
+        self.cache = cache
+        self.verbose = verbose
+        self.on_result = on_result
+        self.profiler = profiler or Profiler()
+        self.similar = similar
+        self.stages = {
+            "ocr": StageStats("ocr", self.ocr_workers),
+            "llm": StageStats("llm", self.llm_concurrency),
+            "rename": StageStats("rename", 1),
+        }
+
+    def run(self, paths: List[Path]) -> Dict[str, Any]:
+        """Process `paths` and return {"results": [...], "stages": {...}, "elapsed_seconds": float}."""
+        return asyncio.run(self.run_async(paths))
+
+    async def run_async(self, paths: List[Path]) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        ocr_q: asyncio.Queue = asyncio.Queue(self.queue_size)
+        llm_q: asyncio.Queue = asyncio.Queue(self.queue_size)
+        rename_q: asyncio.Queue = asyncio.Queue(self.queue_size)
+        results: List[Dict[str, Any]] = []
+        start = time.perf_counter()
+
+        def finish(item: PipelineItem) -> None:
+            if self.similar is not None and "similar_to" not in item.result:
+                self.similar.add(item.path, item.result)
+            self.profiler.file_done(item.result, item.trace)
+            results.append(item.result)
+            if self.on_result is not None:
+                self.on_result(item.result)
+
+        async def feed() -> None:
+            for p in paths:
+                await ocr_q.put(PipelineItem(str(p)))
+            for _ in range(self.ocr_workers):
+                await ocr_q.put(_DONE)
+
+        async def ocr_stage(pool: ProcessPoolExecutor) -> None:
+            stats = self.stages["ocr"]
+            use_cache = self.cache is not None and has_ocr_backend(self.force_tesseract)
+            while True:
+                item = await ocr_q.get()
+                if item is _DONE:
+                    return
+                t0 = time.perf_counter()
+                if self.similar is not None:
+                    reused = await loop.run_in_executor(None, run_traced, item.trace, lookup_similar, item.path, self.similar, self.verbose)
+                    if reused is not None:
+                        item.result.update(reused, file=item.path)
+                        stats.busy_seconds += time.perf_counter() - t0
+                        stats.items += 1
+                        if self.rename:
+                            await rename_q.put(item)
+                        else:
+                            finish(item)
+                        continue
+                key = None
+                text = None
+                if use_cache:
+                    key = await loop.run_in_executor(None, ocr_cache_key, item.path, self.force_tesseract)
+                    text = self.cache.get("ocr", key)
+                    item.trace.merge({"cache.ocr": {"hits" if text is not None else "misses": 1}})
+                error = None
+                if text is None:
+                    _, text, ocr_time, error, ocr_stages = await loop.run_in_executor(pool, _ocr_worker, (item.path, self.force_tesseract))
+                    item.trace.merge(ocr_stages)
+                    item.result["ocr_seconds"] = round(ocr_time, 3)
+                    if key is not None and not error:
+                        self.cache.put("ocr", key, text)
+                stats.busy_seconds += time.perf_counter() - t0
+                stats.items += 1
+                item.result["file"] = item.path
+                if error:
+                    stats.errors += 1
+                    item.result["error"] = error
+                    finish(item)
+                    continue
+                item.ocr_text = text
+                await llm_q.put(item)
+
+        async def llm_stage() -> None:
+            stats = self.stages["llm"]
+            while True:
+                item = await llm_q.get()
+                if item is _DONE:
+                    return
+                t0 = time.perf_counter()
+                try:
+                    with tracing(item.trace):
+                        item.result.update(await name_from_ocr_text_async(
+                            item.path, item.ocr_text, self.llm_pool, verbose=self.verbose, cache=self.cache))
+                except Exception as e:
+                    stats.errors += 1
+                    item.result["error"] = str(e)
+                stats.busy_seconds += time.perf_counter() - t0
+                stats.items += 1
+                if "error" in item.result or not self.rename:
+                    finish(item)
+                else:
+                    await rename_q.put(item)
+
+        async def rename_stage() -> None:
+            stats = self.stages["rename"]
+            done = False
+            while not done:
+                group = [await rename_q.get()]
+                # files that queued up meanwhile are renamed together, sharing one journal sync
+                while not rename_q.empty():
+                    group.append(rename_q.get_nowait())
+                done = group[-1] is _DONE
+                items = [item for item in group if item is not _DONE]
+                if not items:
+                    continue
+                t0 = time.perf_counter()
+                # the group's rename stage is booked on its first file
+                oks = await loop.run_in_executor(None, run_traced, items[0].trace, rename_many_to_suggested,
+                                                 [(Path(item.path), item.result) for item in items])
+                stats.busy_seconds += time.perf_counter() - t0
+                stats.items += len(items)
+                stats.errors += oks.count(False)
+                for item in items:
+                    if self.verbose:
+                        print(f"[VERBOSE] {item.path} -> {item.result.get('renamed_to') or item.result.get('rename_error')}", file=sys.stderr)
+                    finish(item)
+
+        async def sample_queues() -> None:
+            while True:
+                self.stages["ocr"].sample_queue(ocr_q.qsize())
+                self.stages["llm"].sample_queue(llm_q.qsize())
+                self.stages["rename"].sample_queue(rename_q.qsize())
+                await asyncio.sleep(0.05)
+
+        sampler = asyncio.create_task(sample_queues())
+        try:
+            with ProcessPoolExecutor(max_workers=self.ocr_workers) as pool:
+                feeder = asyncio.create_task(feed())
+                llm_tasks = [asyncio.create_task(llm_stage()) for _ in range(self.llm_concurrency)]
+                rename_task = asyncio.create_task(rename_stage())
+                await asyncio.gather(feeder, *(ocr_stage(pool) for _ in range(self.ocr_workers)))
+                for _ in llm_tasks:
+                    await llm_q.put(_DONE)
+                await asyncio.gather(*llm_tasks)
+                await rename_q.put(_DONE)
+                await rename_task
+        finally:
+            sampler.cancel()
+            await self.llm_pool.aclose()
+
+        elapsed = time.perf_counter() - start
+        stages = {name: s.as_dict(elapsed) for name, s in self.stages.items()}
+        stages["llm"]["requests"] = self.llm_pool.stats()
+        return {"results": results, "stages": stages, "elapsed_seconds": elapsed}
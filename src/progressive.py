@@ -0,0 +1,94 @@
+"""Progressive OCR: the title band first, the rest of the image only when needed.
+
+Slide-style diagrams carry their title in the first lines, and that is what naming uses
+most. With $OCR_PROGRESSIVE set, the Tesseract path OCRs only a top band of the
+preprocessed image, cut at a blank row so no line is split, and stops there when the band
+gives enough words at a good enough confidence. Otherwise it OCRs the remainder below the
+cut and appends it, so the band is never recognized twice.
+"""
+import os
+from typing import List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+# share of the image height OCR'd first, and how far below it to look for a blank row
+BAND_FRACTION = 0.25
+MIN_BAND_HEIGHT = 200
+CUT_SEARCH_FRACTION = 0.15
+# the band is enough with this many words (2+ letters or digits) at this mean confidence
+MIN_WORDS = 3
+MIN_CONFIDENCE = 60.0
+
+
+def progressive_enabled() -> bool:
+    """$OCR_PROGRESSIVE: 1/true/yes/on enables the title-band-first mode."""
+    return (os.environ.get("OCR_PROGRESSIVE") or "").lower() in ("1", "true", "yes", "on")
+
+
+def find_band_cut(img: Image.Image, fraction: float = BAND_FRACTION) -> int:
+    """Row at which to end the top band: the first blank row at or below `fraction` of the
+    height (within CUT_SEARCH_FRACTION more), else the plain fraction. The foreground is
+    the minority colour, so it works for light and dark themes."""
+    h = img.height
+    start = min(h, max(MIN_BAND_HEIGHT, int(h * fraction)))
+    stop = min(h, start + int(h * CUT_SEARCH_FRACTION))
+    if stop <= start:
+        return h
+    arr = np.asarray(img.convert("L"), dtype=np.uint8)
+    fg = arr < 128
+    if fg.mean() > 0.5:
+        fg = ~fg
+    blank = np.nonzero(fg[start:stop].mean(axis=1) < 0.002)[0]
+    return start + int(blank[0]) if len(blank) else start
+
+
+def band_is_enough(words: list, min_words: int = MIN_WORDS, min_confidence: float = MIN_CONFIDENCE) -> bool:
+    """True when the band's words are enough to name the image from."""
+    real = [w for w in words if sum(c.isalnum() for c in w.text) >= 2]
+    if len(real) < min_words:
+        return False
+    return sum(w.conf for w in real) / len(real) >= min_confidence
+
+
+def ocr_progressive(img: Image.Image, engine, fraction: Optional[float] = None) -> Tuple[str, bool, int]:
+    """OCR the preprocessed `img` band first. Returns (text, early_exit, band_height)."""
+    from src.tiling import stitch_words
+
+    cut = find_band_cut(img, fraction or BAND_FRACTION)
+    if cut >= img.height:
+        return engine.recognize(img), False, img.height
+    band = img.crop((0, 0, img.width, cut))
+    words: List = engine.recognize_words(band)
+    text = stitch_words(words, band.size)
+    if band_is_enough(words):
+        return text, True, cut
+    rest = engine.recognize(img.crop((0, cut, img.width, img.height)))
+    return "\n".join(t for t in (text, rest.strip()) if t), False, cut
+
+
+def ocr_progressive_many(imgs: List[Image.Image], engine) -> List[Tuple[str, bool, int]]:
+    """`ocr_progressive` for several images with an engine that batches: all bands go
+    through one call (`recognize_words_many`), then all remainders still needed, and the
+    images too short for a band, through another (`recognize_many`)."""
+    from src.tiling import stitch_words
+
+    cuts = [find_band_cut(img, BAND_FRACTION) for img in imgs]
+    banded = [i for i, img in enumerate(imgs) if cuts[i] < img.height]
+    band_words = engine.recognize_words_many([imgs[i].crop((0, 0, imgs[i].width, cuts[i])) for i in banded])
+    out: List[Optional[Tuple[str, bool, int]]] = [None] * len(imgs)
+    band_texts = {}
+    rest = [(i, img) for i, img in enumerate(imgs) if cuts[i] >= img.height]
+    for i, words in zip(banded, band_words):
+        text = stitch_words(words, (imgs[i].width, cuts[i]))
+        if band_is_enough(words):
+            out[i] = (text, True, cuts[i])
+        else:
+            band_texts[i] = text
+            rest.append((i, imgs[i].crop((0, cuts[i], imgs[i].width, imgs[i].height))))
+    for (i, _), text in zip(rest, engine.recognize_many([img for _, img in rest])):
+        if i in band_texts:
+            out[i] = ("\n".join(t for t in (band_texts[i], text.strip()) if t), False, cuts[i])
+        else:
+            out[i] = (text, False, imgs[i].height)
+    return out
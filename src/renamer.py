@@ -0,0 +1,418 @@
+"""Collision-safe renames with a write-ahead journal, undo and crash recovery.
+
+Each target directory is listed into an in-memory index of taken names, again only when its
+mtime shows that someone else changed it, so picking a free name (`title`, `title_1`,
+`title_2`, ...) costs one `stat` of the directory per group of renames. A picked name is then
+claimed atomically with `link` + `unlink` (or an O_EXCL placeholder replaced by the file on
+filesystems without hard links): if another process took the name in the meantime the claim
+fails and the next candidate is tried, so concurrent renamers never overwrite each other.
+
+With a journal, every move is written as an intent (JSON line, fsynced) before it happens
+and marked done or failed afterwards; moves applied together share one fsync. On start the
+journal is replayed and moves interrupted by a crash are completed or rolled back from what
+is on disk; `undo` moves the files of a run back to their original names.
+"""
+import errno
+import json
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+# errors from `link` meaning "no hard links here" rather than "cannot move"
+_NO_LINK_ERRNOS = {errno.EPERM, errno.EXDEV, errno.EMLINK, errno.ENOTSUP, errno.EOPNOTSUPP, errno.ENOSYS}
+
+# give up after this many taken candidates (only other processes can make it this far)
+MAX_CANDIDATES = 10000
+
+
+def default_journal_path() -> Path:
+    """Next to the result cache: $DPR_CACHE_DIR or the default user cache directory."""
+    from src.cache import DEFAULT_CACHE_DIR
+    return Path(os.environ.get("DPR_CACHE_DIR") or DEFAULT_CACHE_DIR) / "renames.jsonl"
+
+
+def candidates(name: str) -> Iterator[str]:
+    """`name`, then `base_1.ext`, `base_2.ext`, ..."""
+    yield name
+    base, ext = os.path.splitext(name)
+    for i in range(1, MAX_CANDIDATES):
+        yield f"{base}_{i}{ext}"
+
+
+class DirectoryIndex:
+    """Names present in one directory, compared case-insensitively (as macOS does).
+
+    The listing is redone by `refresh` when the directory's mtime shows a change made by
+    someone else (files added, renamed or removed by hand or by other processes); names
+    reserved for moves still in flight survive it. `claimed` records the mtime left by our
+    own moves, so they do not cause a new listing.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self.reserved: Set[str] = set()
+        self._scan()
+
+    def _scan(self) -> None:
+        # stat first: a change made while listing shows up as a newer mtime next time
+        self.mtime_ns = os.stat(self.directory).st_mtime_ns
+        with os.scandir(self.directory) as entries:
+            self.names = {e.name.casefold() for e in entries} | self.reserved
+
+    def refresh(self) -> bool:
+        """List the directory again if it changed since; returns whether it did."""
+        if os.stat(self.directory).st_mtime_ns == self.mtime_ns:
+            return False
+        self._scan()
+        return True
+
+    def reserve(self, name: str) -> str:
+        """Pick the first free candidate for `name` and mark it taken."""
+        for candidate in candidates(name):
+            if candidate.casefold() not in self.names:
+                self.names.add(candidate.casefold())
+                self.reserved.add(candidate.casefold())
+                return candidate
+        raise FileExistsError(errno.EEXIST, "no free name", name)
+
+    def add(self, name: str) -> None:
+        self.names.add(name.casefold())
+        self.reserved.discard(name.casefold())
+
+    def discard(self, name: str) -> None:
+        self.names.discard(name.casefold())
+        self.reserved.discard(name.casefold())
+
+    def claimed(self, name: str) -> None:
+        """A reserved `name` now exists: our move is done, and the directory's new mtime is ours."""
+        self.reserved.discard(name.casefold())
+        try:
+            self.mtime_ns = os.stat(self.directory).st_mtime_ns
+        except OSError:
+            pass
+
+
+def claim(src: Path, dst: Path) -> bool:
+    """Move `src` to `dst` unless `dst` exists, atomically; False when `dst` is taken."""
+    try:
+        os.link(src, dst)
+    except FileExistsError:
+        return False
+    except OSError as e:
+        if e.errno not in _NO_LINK_ERRNOS:
+            raise
+        return _claim_with_placeholder(src, dst)
+    try:
+        os.unlink(src)
+    except FileNotFoundError:
+        pass  # finished by a concurrent recovery
+    return True
+
+
+def _claim_with_placeholder(src: Path, dst: Path) -> bool:
+    try:
+        fd = os.open(dst, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600)
+    except FileExistsError:
+        return False
+    os.close(fd)
+    try:
+        os.replace(src, dst)
+    except BaseException:
+        os.unlink(dst)
+        raise
+    return True
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True  # exists, owned by someone else
+    return True
+
+
+class RenameJournal:
+    """Append-only JSON-lines log of the moves of one run.
+
+    Records are {"run", "seq", "state", ...} with state intent (plus src, dst, pid), done,
+    failed or undone; the last record of a (run, seq) is its current state. Undo records
+    are appended by the undoing process under the original run.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.run = f"{datetime.now().strftime('%Y%m%dT%H%M%S')}-{os.getpid()}"
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._file = open(self.path, "a", encoding="utf-8")
+        if self._file.tell() > 0:
+            with open(self.path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    # a line torn by a crash must not swallow the next record
+                    self._file.write("\n")
+                    self._file.flush()
+
+    def write(self, records: List[Dict[str, Any]], sync: bool = False) -> None:
+        data = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records)
+        with self._lock:
+            # one write per group keeps lines from concurrent processes whole (O_APPEND)
+            self._file.write(data)
+            self._file.flush()
+            if sync:
+                os.fsync(self._file.fileno())
+
+    def intents(self, moves: List[Tuple[Path, Path]]) -> List[int]:
+        """Log moves about to happen (durably); returns their sequence numbers."""
+        with self._lock:
+            seqs = list(range(self._seq + 1, self._seq + 1 + len(moves)))
+            self._seq += len(moves)
+        self.write([{"run": self.run, "seq": seq, "state": "intent", "src": str(src), "dst": str(dst), "pid": os.getpid()}
+                    for seq, (src, dst) in zip(seqs, moves)], sync=True)
+        return seqs
+
+    def sync(self) -> None:
+        with self._lock:
+            os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+def read_journal(path: Path) -> Dict[Tuple[str, int], Dict[str, Any]]:
+    """Current state of every move in the journal, keyed by (run, seq), in log order."""
+    moves: Dict[Tuple[str, int], Dict[str, Any]] = {}
+    try:
+        f = open(path, encoding="utf-8")
+    except FileNotFoundError:
+        return moves
+    with f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue  # a line torn by a crash
+            key = (rec["run"], rec["seq"])
+            if rec["state"] == "intent":
+                moves[key] = dict(rec)
+            elif key in moves:
+                moves[key]["state"] = rec["state"]
+                for field in ("dst", "error"):
+                    if field in rec:
+                        moves[key][field] = rec[field]
+    return moves
+
+
+def recover(journal: RenameJournal) -> List[Dict[str, Any]]:
+    """Settle moves left as intents by runs that are no longer running. A move whose file
+    is at its new name (or at both, mid `link` + `unlink`) is completed; otherwise it is
+    rolled back, removing an empty placeholder left at the new name. Returns the settled moves."""
+    settled = []
+    for (run, seq), move in read_journal(journal.path).items():
+        if move["state"] != "intent" or run == journal.run:
+            continue
+        pid = move.get("pid", 0)
+        # a live process may still be in the middle of this move (our own pid here means reuse)
+        if pid != os.getpid() and _pid_alive(pid):
+            continue
+        src, dst = Path(move["src"]), Path(move["dst"])
+        state = "failed"
+        if dst.exists() and not src.exists():
+            state = "done"
+        elif dst.exists() and src.exists():
+            if os.path.samefile(src, dst):
+                os.unlink(src)
+                state = "done"
+            elif dst.stat().st_size == 0:
+                os.unlink(dst)
+        journal.write([{"run": run, "seq": seq, "state": state, "error": "interrupted"} if state == "failed"
+                       else {"run": run, "seq": seq, "state": state}])
+        settled.append(dict(move, state=state))
+    if settled:
+        journal.sync()
+    return settled
+
+
+def runs(path: Path) -> List[str]:
+    """Runs in the journal with moves that can still be undone, oldest first."""
+    out: List[str] = []
+    for (run, _), move in read_journal(path).items():
+        if move["state"] == "done" and run not in out:
+            out.append(run)
+    return out
+
+
+def undo(path: Path, run: Optional[str] = None, dry_run: bool = False) -> Dict[str, Any]:
+    """Move the files renamed by `run` (default: the latest run) back, newest move first.
+    Moves whose file is gone or whose original name is taken again are reported as conflicts."""
+    path = Path(path)
+    undoable = runs(path)
+    run = run or (undoable[-1] if undoable else None)
+    report: Dict[str, Any] = {"run": run, "restored": [], "conflicts": []}
+    if run is None:
+        return report
+    moves = [(seq, m) for (r, seq), m in read_journal(path).items() if r == run and m["state"] == "done"]
+    journal = None if dry_run else RenameJournal(path)
+    try:
+        for seq, move in sorted(moves, key=lambda item: item[0], reverse=True):
+            src, dst = Path(move["src"]), Path(move["dst"])
+            if not dst.exists():
+                if src.exists() and journal is not None:
+                    # moved back by an undo that stopped before logging it
+                    journal.write([{"run": run, "seq": seq, "state": "undone"}])
+                    report["restored"].append({"file": str(dst), "restored_to": str(src)})
+                else:
+                    report["conflicts"].append({"file": str(dst), "error": "renamed file no longer exists"})
+                continue
+            if dry_run:
+                report["restored"].append({"file": str(dst), "restored_to": str(src)})
+                continue
+            if not claim(dst, src):
+                report["conflicts"].append({"file": str(dst), "error": f"original name is taken: {src.name}"})
+                continue
+            journal.write([{"run": run, "seq": seq, "state": "undone"}])
+            report["restored"].append({"file": str(dst), "restored_to": str(src)})
+    finally:
+        if journal is not None:
+            journal.sync()
+            journal.close()
+    return report
+
+
+class Renamer:
+    """Renames files to free names without overwriting, optionally journaled.
+
+    With `index` (the default) each target directory is listed once (and again after
+    changes made by others) and names are picked from memory; without it candidates are simply claimed in turn, which is cheaper for a
+    single rename into a large directory. Safe to share between threads.
+    """
+
+    def __init__(self, journal: Optional[RenameJournal] = None, index: bool = True):
+        self.journal = journal
+        self.index = index
+        self._indexes: Dict[Path, DirectoryIndex] = {}
+        self._lock = threading.Lock()
+        if journal is not None:
+            recover(journal)
+
+    def _directory(self, directory: Path) -> Optional[DirectoryIndex]:
+        if not self.index:
+            return None
+        idx = self._indexes.get(directory)
+        if idx is None:
+            idx = self._indexes[directory] = DirectoryIndex(directory)
+        return idx
+
+    def _reserve(self, src: Path, name: str, after: Optional[str] = None) -> str:
+        """A candidate for `name` not known to be taken (and not `after`, which just was)."""
+        with self._lock:
+            idx = self._directory(src.parent)
+            if idx is not None:
+                if after is not None:
+                    idx.add(after)
+                return idx.reserve(name)
+        gen = candidates(name)
+        if after is not None:
+            for candidate in gen:
+                if candidate == after:
+                    break
+        return next(gen)
+
+    def _release(self, directory: Path, name: str) -> None:
+        with self._lock:
+            idx = self._indexes.get(directory)
+            if idx is not None:
+                idx.discard(name)
+
+    def _claimed(self, directory: Path, name: str) -> None:
+        with self._lock:
+            idx = self._indexes.get(directory)
+            if idx is not None:
+                idx.claimed(name)
+
+    def _refresh(self, directories: Iterable[Path]) -> None:
+        """Catch up with changes made by others to the directories already indexed."""
+        with self._lock:
+            for directory in directories:
+                idx = self._indexes.get(directory)
+                if idx is None:
+                    continue
+                try:
+                    idx.refresh()
+                except OSError:
+                    del self._indexes[directory]
+
+    def rename(self, src: Path, new_name: str) -> Path:
+        """Move `src` to `new_name` in its directory (or the first free variant); returns the new path."""
+        outcome = self.rename_many([(src, new_name)])[0]
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    def rename_many(self, moves: List[Tuple[Path, str]]) -> List[Any]:
+        """Apply several renames with one journal sync for the group. Returns, per move,
+        the new path or the exception that prevented it."""
+        self._refresh({src.parent for src, _ in moves})
+        targets = []
+        for src, new_name in moves:
+            if src.name == new_name:
+                targets.append(src)
+            else:
+                targets.append(src.parent / self._reserve(src, new_name))
+        seqs = self.journal.intents(list(zip((m[0] for m in moves), targets))) if self.journal else [0] * len(moves)
+
+        out: List[Any] = []
+        for (src, new_name), dst, seq in zip(moves, targets, seqs):
+            try:
+                while dst != src and not claim(src, dst):
+                    # taken by another process since the directory was listed
+                    dst = src.parent / self._reserve(src, new_name, after=dst.name)
+                    if self.journal:
+                        self.journal.write([{"run": self.journal.run, "seq": seq, "state": "intent", "src": str(src), "dst": str(dst), "pid": os.getpid()}], sync=True)
+            except Exception as e:
+                if dst != src:
+                    self._release(src.parent, dst.name)
+                if self.journal:
+                    self.journal.write([{"run": self.journal.run, "seq": seq, "state": "failed", "error": str(e)}])
+                out.append(e)
+                continue
+            if dst != src:
+                self._claimed(src.parent, dst.name)
+                # a file already under its name still holds it
+                self._release(src.parent, src.name)
+            if self.journal:
+                self.journal.write([{"run": self.journal.run, "seq": seq, "state": "done", "dst": str(dst)}])
+            out.append(dst)
+        if self.journal:
+            self.journal.sync()
+        return out
+
+    def close(self) -> None:
+        if self.journal is not None:
+            self.journal.close()
+
+
+_DEFAULT: Optional[Renamer] = None
+_DEFAULT_LOCK = threading.Lock()
+
+
+def default_renamer() -> Renamer:
+    """The renamer `rename_to_suggested` uses: as set by `set_default_renamer`, else an
+    indexed renamer without a journal."""
+    global _DEFAULT
+    with _DEFAULT_LOCK:
+        if _DEFAULT is None:
+            _DEFAULT = Renamer()
+        return _DEFAULT
+
+
+def set_default_renamer(renamer: Optional[Renamer]) -> None:
+    global _DEFAULT
+    with _DEFAULT_LOCK:
+        _DEFAULT = renamer
@@ -0,0 +1,166 @@
+"""Deadlines, jittered retries and circuit breakers for LLM backends.
+
+Each image gets one latency budget ($LLM_DEADLINE seconds) for all its LLM attempts,
+across backends and retries; every request is also capped at $LLM_TIMEOUT. Failed
+requests that may succeed on a second try (timeouts, connection errors, 429 and 5xx)
+are retried up to $LLM_RETRIES times per backend after a full-jitter exponential backoff.
+
+A circuit breaker per backend opens after $LLM_BREAKER_FAILURES consecutive failures:
+requests to that backend are then refused without being sent for $LLM_BREAKER_COOLDOWN
+seconds, after which a single probe request decides whether it closes again. Breakers
+are shared by everything in the process, so one wedged server costs a batch a few failed
+requests rather than a timeout per image.
+"""
+import asyncio
+import os
+import random
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+DEFAULT_DEADLINE = 60.0
+DEFAULT_TIMEOUT = 20.0
+DEFAULT_RETRIES = 2
+DEFAULT_BREAKER_FAILURES = 3
+DEFAULT_BREAKER_COOLDOWN = 30.0
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8.0
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    deadline: float = DEFAULT_DEADLINE
+    timeout: float = DEFAULT_TIMEOUT
+    retries: int = DEFAULT_RETRIES
+
+
+def retry_policy() -> RetryPolicy:
+    """The policy configured by $LLM_DEADLINE, $LLM_TIMEOUT and $LLM_RETRIES."""
+    return RetryPolicy(
+        deadline=float(os.environ.get("LLM_DEADLINE") or DEFAULT_DEADLINE),
+        timeout=float(os.environ.get("LLM_TIMEOUT") or DEFAULT_TIMEOUT),
+        retries=int(os.environ.get("LLM_RETRIES") or DEFAULT_RETRIES),
+    )
+
+
+class Deadline:
+    """A point in time by which some work must be done."""
+
+    def __init__(self, seconds: float):
+        self.end = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.end - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.end
+
+    def timeout(self, cap: float) -> float:
+        """Seconds one step may take: `cap`, or less when the deadline is nearer."""
+        return min(cap, self.remaining())
+
+
+def backoff_delay(attempt: int, base: Optional[float] = None, cap: Optional[float] = None, rng: Optional[random.Random] = None) -> float:
+    """Full-jitter exponential backoff: uniform in [0, min(cap, base * 2**attempt)]
+    (default BACKOFF_BASE and BACKOFF_MAX)."""
+    base = BACKOFF_BASE if base is None else base
+    cap = BACKOFF_MAX if cap is None else cap
+    return (rng or random).uniform(0.0, min(cap, base * (2 ** attempt)))
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Whether another attempt may succeed: timeouts, connection errors, 408, 409, 429 and 5xx.
+    Other HTTP errors (bad request, authentication, unknown model) will fail again, and so
+    will anything else (a bad reply, a bug)."""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    if isinstance(status, int):
+        return status in (408, 409, 429) or status >= 500
+    if isinstance(error, (TimeoutError, ConnectionError, asyncio.TimeoutError)):
+        return True
+    # the SDK's and its HTTP client's own timeout and connection errors, when they are loaded
+    openai, httpx = sys.modules.get("openai"), sys.modules.get("httpx")
+    return (openai is not None and isinstance(error, openai.APIConnectionError)) \
+        or (httpx is not None and isinstance(error, httpx.TransportError))
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker: closed -> open (cool-down) -> half-open (one probe)."""
+
+    def __init__(self, name: str, failures: int = DEFAULT_BREAKER_FAILURES, cooldown: float = DEFAULT_BREAKER_COOLDOWN):
+        self.name = name
+        self.max_failures = failures
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.opened = 0
+        self.rejected = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a request may be sent now; in half-open state only one probe at a time."""
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.cooldown:
+                self.state = "half_open"
+            if self.state == "closed" or (self.state == "half_open" and not self._probing):
+                self._probing = self.state == "half_open"
+                return True
+            self.rejected += 1
+            return False
+
+    def release(self) -> None:
+        """End a request without an outcome (it was cancelled): a half-open breaker may probe again."""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == "half_open" or self.failures >= self.max_failures:
+                if self.state != "open":
+                    self.opened += 1
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"state": self.state, "failures": self.failures, "opened": self.opened, "rejected": self.rejected}
+
+
+_BREAKERS: Dict[str, CircuitBreaker] = {}
+_BREAKERS_LOCK = threading.Lock()
+
+
+def breaker_for(name: str) -> CircuitBreaker:
+    """The process-wide breaker of backend `name`, configured by $LLM_BREAKER_FAILURES and $LLM_BREAKER_COOLDOWN."""
+    with _BREAKERS_LOCK:
+        breaker = _BREAKERS.get(name)
+        if breaker is None:
+            breaker = _BREAKERS[name] = CircuitBreaker(
+                name,
+                failures=int(os.environ.get("LLM_BREAKER_FAILURES") or DEFAULT_BREAKER_FAILURES),
+                cooldown=float(os.environ.get("LLM_BREAKER_COOLDOWN") or DEFAULT_BREAKER_COOLDOWN),
+            )
+        return breaker
+
+
+def breaker_stats() -> Dict[str, Dict[str, Any]]:
+    with _BREAKERS_LOCK:
+        return {name: b.as_dict() for name, b in _BREAKERS.items()}
+
+
+def reset_breakers() -> None:
+    with _BREAKERS_LOCK:
+        _BREAKERS.clear()
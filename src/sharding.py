@@ -0,0 +1,193 @@
+"""Multi-node batch runs: deterministic sharding of the inputs and merging of shard outputs.
+
+`batch --shard i/N` keeps the inputs whose stable hash falls in shard i of N (1-based), so N
+machines given the same inputs split them without talking to each other. The hash is taken
+from the path as given, or with `--shard-by content` from the file size and first 64 KiB,
+which survive renames and moves, so a resumed run still finds renamed files in its shard.
+
+With `--jsonl` each node streams its per-file results as JSON lines as they finish, then a
+summary line; `merge` combines such outputs and shard manifests into one batch report.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+SHARD_KEYS = ("path", "content")
+# bytes read from the start of each file for content sharding
+CONTENT_PREFIX = 64 * 1024
+_SQLITE_MAGIC = b"SQLite format 3\x00"
+
+
+def parse_shard(spec: str) -> Tuple[int, int]:
+    """"i/N" -> (i, N), with 1 <= i <= N."""
+    try:
+        i, n = (int(part) for part in spec.split("/"))
+    except ValueError:
+        raise ValueError(f"invalid shard \"{spec}\", expected i/N such as 1/4") from None
+    if n < 1 or not 1 <= i <= n:
+        raise ValueError(f"invalid shard \"{spec}\", expected 1 <= i <= N")
+    return i, n
+
+
+def shard_key(path: Path, by: str = "path") -> bytes:
+    """What a file is hashed by: its path as given, or its size and first CONTENT_PREFIX bytes."""
+    if by == "path":
+        return Path(path).as_posix().encode("utf-8", errors="surrogateescape")
+    if by == "content":
+        with open(path, "rb") as f:
+            return str(os.fstat(f.fileno()).st_size).encode() + b":" + f.read(CONTENT_PREFIX)
+    raise ValueError(f"unknown shard key: {by}")
+
+
+def shard_of(path: Path, shards: int, by: str = "path") -> int:
+    """The 1-based shard of `path`; the same on every machine and Python version."""
+    digest = hashlib.blake2b(shard_key(path, by), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % shards + 1
+
+
+def select_shard(paths: Iterable[Path], index: int, shards: int, by: str = "path") -> List[Path]:
+    """The paths of shard `index` of `shards`, in their original order. Unreadable files
+    (content sharding) go by path, so exactly one shard still reports them."""
+    out = []
+    for p in paths:
+        try:
+            shard = shard_of(p, shards, by)
+        except OSError:
+            shard = shard_of(p, shards, "path")
+        if shard == index:
+            out.append(p)
+    return out
+
+
+def _final_path(entry: Dict[str, Any]) -> str:
+    """Where the file of a result is now: its new name if it was renamed."""
+    if entry.get("renamed_to"):
+        return str(Path(entry["file"]).parent / entry["renamed_to"])
+    return entry["file"]
+
+
+def read_jsonl(path: Path) -> Iterator[Dict[str, Any]]:
+    """Records of a JSON lines output, or the one record of a (pretty-printed) JSON report;
+    a line cut short by a crash is skipped."""
+    text = Path(path).read_text(encoding="utf-8")
+    try:
+        whole = json.loads(text)
+    except ValueError:
+        whole = None
+    for line in [text] if isinstance(whole, dict) else text.splitlines():
+        try:
+            record = json.loads(line) if line.strip() else None
+        except ValueError:
+            continue
+        if isinstance(record, dict):
+            yield record
+
+
+def read_manifest_results(path: Path) -> Iterator[Dict[str, Any]]:
+    """The last result of each file recorded in a manifest (see `src.manifest`), oldest
+    first. Opened read-only: merging never modifies a shard's manifest."""
+    conn = sqlite3.connect(f"{Path(path).resolve().as_uri()}?mode=ro", uri=True)
+    try:
+        rows = conn.execute("SELECT result FROM files ORDER BY updated").fetchall()
+    finally:
+        conn.close()
+    for (result,) in rows:
+        yield json.loads(result)
+
+
+def is_sqlite(path: Path) -> bool:
+    with open(path, "rb") as f:
+        return f.read(len(_SQLITE_MAGIC)) == _SQLITE_MAGIC
+
+
+def merge_outputs(paths: Iterable[Path]) -> Dict[str, Any]:
+    """Combine shard outputs (JSON lines from `batch --jsonl`, or the JSON report of a plain
+    `batch`) and manifests into one report shaped like `batch` output.
+
+    Results are keyed by where the file is now, so a file seen by several runs is reported
+    once: later inputs replace earlier ones, except that a skip never replaces a result.
+    """
+    merged: Dict[str, Dict[str, Any]] = {}
+    summaries: List[Dict[str, Any]] = []
+
+    def take(entry: Dict[str, Any]) -> None:
+        if "file" not in entry:
+            return
+        key = _final_path(entry)
+        known = merged.get(key)
+        if known is not None and "skipped" in entry and "skipped" not in known:
+            return
+        merged.pop(key, None)
+        merged[key] = entry
+
+    for path in paths:
+        path = Path(path)
+        if is_sqlite(path):
+            for entry in read_manifest_results(path):
+                take(entry)
+            continue
+        for record in read_jsonl(path):
+            if "results" in record:
+                # a whole batch report
+                for entry in record["results"]:
+                    take(entry)
+                record = {"shard": record.get("shard"), "stats": record.get("stats", {})}
+            if "stats" in record and "file" not in record:
+                summaries.append(record)
+            else:
+                take(record)
+
+    results = list(merged.values())
+    naming_paths: Dict[str, int] = {}
+    for r in results:
+        if "naming_path" in r:
+            naming_paths[r["naming_path"]] = naming_paths.get(r["naming_path"], 0) + 1
+    stats: Dict[str, Any] = {
+        "files": len(results),
+        "processed": sum(1 for r in results if "skipped" not in r),
+        "skipped": sum(1 for r in results if "skipped" in r),
+        "errors": sum(1 for r in results if "error" in r or "rename_error" in r),
+        "naming_paths": naming_paths,
+        "runs": len(summaries),
+    }
+    shards = {s["shard"] for s in summaries if s.get("shard")}
+    if shards:
+        stats["shards"] = sorted(shards, key=lambda s: parse_shard(s))
+        counts = {parse_shard(s)[1] for s in shards}
+        if len(counts) == 1:
+            n = counts.pop()
+            missing = sorted(set(range(1, n + 1)) - {parse_shard(s)[0] for s in shards})
+            if missing:
+                stats["missing_shards"] = [f"{i}/{n}" for i in missing]
+    elapsed = [s["stats"].get("elapsed_seconds") for s in summaries if s.get("stats", {}).get("elapsed_seconds") is not None]
+    if elapsed:
+        stats["elapsed_seconds"] = max(elapsed)
+    return {"results": results, "stats": stats}
+
+
+class JsonlWriter:
+    """Stream batch results to stdout as JSON lines, each flushed as soon as it is written.
+    Written results are remembered by their `file`, so `emit_missing` can add the ones
+    no stage streamed, whatever copies of the entries the stages passed around."""
+
+    def __init__(self, shard: Optional[str] = None):
+        self.shard = shard
+        self.written: Set[str] = set()
+
+    def emit(self, entry: Dict[str, Any]) -> None:
+        print(json.dumps(entry, ensure_ascii=False), flush=True)
+        self.written.add(entry["file"])
+
+    def emit_missing(self, results: Iterable[Dict[str, Any]]) -> None:
+        for entry in results:
+            if entry["file"] not in self.written:
+                self.emit(entry)
+
+    def summary(self, stats: Dict[str, Any]) -> None:
+        record: Dict[str, Any] = {"stats": stats}
+        if self.shard:
+            record["shard"] = self.shard
+        print(json.dumps(record, ensure_ascii=False), flush=True)
@@ -0,0 +1,305 @@
+"""A local OpenAI-compatible chat-completions server that stands in for Ollama or OpenAI.
+
+For tests and load tests of the LLM path without a real model: point the Ollama backend
+at it (OLLAMA_HOST=http://127.0.0.1:<port>/v1, OLLAMA_MODEL=stub). Replies follow the
+prompts: the title is made from the first OCR line of each image and the keywords from
+its longer words, one object per request or a `results` list for batched requests.
+Streamed requests get server-sent events in small pieces.
+
+Latency, failures and bad replies are injected at configurable rates:
+
+- latency: "0.2" or "fixed:0.2", "uniform:LOW,HIGH", "normal:MEAN,SD", "lognormal:MEDIAN,SIGMA"
+  or "exp:MEAN" seconds before the reply (before the first piece when streaming)
+- error rate: share of requests answered with an HTTP error picked from the error statuses
+- malformed rate: share of replies that are not the JSON object asked for (cut short,
+  prose, or a JSON array)
+
+`GET /stats` returns request counts and the peak number of requests in flight.
+
+Usage: python -m src.stub_llm_server [--port 11435] [--latency lognormal:0.3,0.5] [--error-rate 0.05] [--malformed-rate 0.05]
+"""
+import argparse
+import json
+import math
+import random
+import re
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+DEFAULT_PORT = 11435
+# characters per streamed piece
+CHUNK_CHARS = 8
+MALFORMED_KINDS = ("truncated", "prose", "array")
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """A sampler of seconds from a latency spec (see the module docstring); never negative."""
+    kind, _, args = spec.partition(":") if ":" in spec else ("fixed", "", spec)
+    try:
+        values = [float(v) for v in args.split(",")] if args else []
+    except ValueError:
+        raise ValueError(f"invalid latency \"{spec}\"") from None
+    arity = {"fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2, "exp": 1}
+    if arity.get(kind) != len(values):
+        raise ValueError(f"invalid latency \"{spec}\", expected one of fixed:S, uniform:LOW,HIGH, normal:MEAN,SD, lognormal:MEDIAN,SIGMA, exp:MEAN")
+    if kind == "fixed":
+        return lambda rng: max(0.0, values[0])
+    if kind == "uniform":
+        return lambda rng: max(0.0, rng.uniform(values[0], values[1]))
+    if kind == "normal":
+        return lambda rng: max(0.0, rng.gauss(values[0], values[1]))
+    if kind == "lognormal":
+        return lambda rng: rng.lognormvariate(math.log(values[0]), values[1]) if values[0] > 0 else 0.0
+    return lambda rng: rng.expovariate(1.0 / values[0]) if values[0] > 0 else 0.0
+
+
+@dataclass
+class StubConfig:
+    latency: str = "fixed:0.05"
+    error_rate: float = 0.0
+    error_statuses: Tuple[int, ...] = (500, 503, 429)
+    malformed_rate: float = 0.0
+    chunk_delay: float = 0.0
+    seed: Optional[int] = None
+
+
+def _title_and_keywords(ocr_text: str) -> Dict[str, Any]:
+    lines = [line.strip() for line in ocr_text.splitlines() if line.strip()]
+    words = re.findall(r"[A-Za-z0-9]+", lines[0]) if lines else []
+    keywords: List[str] = []
+    for word in re.findall(r"[A-Za-z]{4,}", ocr_text.lower()):
+        if word not in keywords:
+            keywords.append(word)
+    return {"title": " ".join(words[:8]) or "Untitled", "keywords": keywords[:5]}
+
+
+def reply_for(messages: List[Dict[str, Any]]) -> str:
+    """The JSON content a well-behaved model would return for `messages`."""
+    user = next((m.get("content") or "" for m in reversed(messages) if m.get("role") == "user"), "")
+    # the OCR text follows the instruction line, up to the trailing blank line
+    body = user.split("\n\n", 1)[1] if "\n\n" in user else user
+    items = re.split(r"^### item (\d+)\n", body, flags=re.MULTILINE)
+    if len(items) > 1:
+        results = [dict(_title_and_keywords(text), id=int(i)) for i, text in zip(items[1::2], items[2::2])]
+        return json.dumps({"results": results})
+    return json.dumps(_title_and_keywords(body))
+
+
+def malform(content: str, kind: str) -> str:
+    if kind == "truncated":
+        return content[:max(1, len(content) // 2)]
+    if kind == "prose":
+        return "Sure! This image seems to show a diagram, but I could not read it well."
+    return json.dumps(list(json.loads(content).values()))
+
+
+class StubStats:
+    """Request counters, safe to update from the server's handler threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.counts: Dict[str, int] = {}
+            self.in_flight = 0
+            self.peak_in_flight = 0
+
+    def add(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + value
+
+    def enter(self) -> None:
+        with self._lock:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def leave(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.counts, in_flight=self.in_flight, peak_in_flight=self.peak_in_flight)
+
+
+class StubLLMServer(ThreadingHTTPServer):
+    """The stub server; `start` serves from a background thread, `url` is the base URL for clients."""
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, config: Optional[StubConfig] = None, verbose: bool = False):
+        self.config = config or StubConfig()
+        self.sample_latency = parse_latency(self.config.latency)
+        self.rng = random.Random(self.config.seed)
+        self._rng_lock = threading.Lock()
+        self.stats = StubStats()
+        self.verbose = verbose
+        self._thread: Optional[threading.Thread] = None
+        super().__init__((host, port), _Handler)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def draw(self) -> Tuple[float, Optional[int], Optional[str]]:
+        """This request's latency, error status (or None) and malformation (or None)."""
+        with self._rng_lock:
+            latency = self.sample_latency(self.rng)
+            status = self.rng.choice(self.config.error_statuses) if self.rng.random() < self.config.error_rate else None
+            malformed = self.rng.choice(MALFORMED_KINDS) if self.rng.random() < self.config.malformed_rate else None
+        return latency, status, malformed
+
+    def handle_error(self, request: Any, client_address: Any) -> None:
+        # clients dropping idle keep-alive connections are not worth a traceback
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+    def start(self) -> "StubLLMServer":
+        self._thread = threading.Thread(target=self.serve_forever, name="stub-llm-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # keep-alive, as the clients' connection pools expect
+    protocol_version = "HTTP/1.1"
+    server: StubLLMServer
+
+    def log_message(self, format: str, *args: Any) -> None:
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status: int, payload: Dict[str, Any]) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        if self.path.rstrip("/") in ("/stats", "/v1/stats"):
+            self._send_json(200, self.server.stats.as_dict())
+        elif self.path.rstrip("/") in ("/models", "/v1/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "stub", "object": "model", "owned_by": "stub"}]})
+        else:
+            self._send_json(404, {"error": {"message": f"no route {self.path}", "type": "not_found"}})
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length)
+        if self.path.rstrip("/") not in ("/chat/completions", "/v1/chat/completions"):
+            self._send_json(404, {"error": {"message": f"no route {self.path}", "type": "not_found"}})
+            return
+        try:
+            request = json.loads(raw or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": {"message": "request body is not JSON", "type": "invalid_request_error"}})
+            return
+
+        stats = self.server.stats
+        stats.enter()
+        try:
+            stats.add("requests")
+            latency, status, malformed = self.server.draw()
+            time.sleep(latency)
+            if status is not None:
+                stats.add("errors")
+                self._send_json(status, {"error": {"message": f"injected error {status}", "type": "server_error"}})
+                return
+            content = reply_for(request.get("messages") or [])
+            if malformed:
+                stats.add("malformed")
+                content = malform(content, malformed)
+            if request.get("stream"):
+                stats.add("streamed")
+                self._stream(request, content)
+            else:
+                self._send_json(200, self._completion(request, content))
+        except (BrokenPipeError, ConnectionResetError):
+            # the client stopped reading, e.g. once the streamed JSON object was complete
+            stats.add("client_closed")
+        finally:
+            stats.leave()
+
+    def _completion(self, request: Dict[str, Any], content: str) -> Dict[str, Any]:
+        prompt = sum(len(m.get("content") or "") for m in request.get("messages") or []) // 4 + 1
+        return {
+            "id": f"chatcmpl-stub-{int(time.time() * 1000)}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model") or "stub",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt, "completion_tokens": len(content) // 4 + 1, "total_tokens": prompt + len(content) // 4 + 1},
+        }
+
+    def _stream(self, request: Dict[str, Any], content: str) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        base = {"id": f"chatcmpl-stub-{int(time.time() * 1000)}", "object": "chat.completion.chunk",
+                "created": int(time.time()), "model": request.get("model") or "stub"}
+        pieces = [content[i:i + CHUNK_CHARS] for i in range(0, len(content), CHUNK_CHARS)]
+        for i, piece in enumerate(pieces):
+            if i and self.server.config.chunk_delay:
+                time.sleep(self.server.config.chunk_delay)
+            delta = {"role": "assistant", "content": piece} if i == 0 else {"content": piece}
+            self._event(dict(base, choices=[{"index": 0, "delta": delta, "finish_reason": None}]))
+        self._event(dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}]))
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._write_chunk(b"")
+
+    def _event(self, payload: Dict[str, Any]) -> None:
+        self._write_chunk(f"data: {json.dumps(payload)}\n\n".encode())
+
+    def _write_chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="0 picks a free port")
+    parser.add_argument("--latency", default=StubConfig.latency, help="reply latency distribution in seconds, e.g. lognormal:0.3,0.5")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with an HTTP error")
+    parser.add_argument("--error-status", default="500,503,429", help="comma-separated statuses the errors are drawn from")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="share of replies that are not the JSON object asked for")
+    parser.add_argument("--chunk-delay", type=float, default=0.0, help="seconds between streamed pieces")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--verbose", "-v", action="store_true", help="log every request")
+    args = parser.parse_args(argv)
+    try:
+        config = StubConfig(latency=args.latency, error_rate=args.error_rate, malformed_rate=args.malformed_rate,
+                            error_statuses=tuple(int(s) for s in args.error_status.split(",")),
+                            chunk_delay=args.chunk_delay, seed=args.seed)
+        server = StubLLMServer(args.host, args.port, config, verbose=args.verbose)
+    except (ValueError, OSError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    print(f"stub LLM server at {server.url}; use OLLAMA_HOST={server.url} OLLAMA_MODEL=stub", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,288 @@
+"""Long-lived Tesseract engines, fed in memory instead of through temp files.
+
+Engines, selected by $OCR_TESSERACT_ENGINE (auto|tesserocr|pipe|pytesseract):
+
+- tesserocr: persistent TessBaseAPIs (one per concurrent caller); language models are loaded
+  once per API (the `ocr` extra: `pip install .[ocr]`)
+- pipe: the tesseract binary reading images from stdin; several images go through one process
+  as a multi-page TIFF, so process start-up and model loading are paid once per batch. A
+  single image still costs one process, so callers with several images to recognize (tiles,
+  OCR passes, a batch chunk) hand them over together when `engine_batches()`
+- pytesseract: the original per-call path (temp file plus one tesseract process per image)
+
+`auto` picks the first available in that order. Engines are created once per process by
+`get_engine`, so each OCR worker keeps its own for its whole life.
+"""
+import io
+import os
+import shutil
+import subprocess
+import queue
+import threading
+from typing import List, NamedTuple, Optional
+
+from PIL import Image
+
+ENGINES = ("tesserocr", "pipe", "pytesseract")
+
+# tesseract separates pages of a multi-page input with a form feed
+PAGE_SEPARATOR = "\f"
+
+
+class OCRWord(NamedTuple):
+    """A recognized word: its text, confidence (0-100) and pixel box (top-left origin)."""
+    text: str
+    conf: float
+    left: int
+    top: int
+    width: int
+    height: int
+
+
+def parse_tsv(tsv: str) -> List[OCRWord]:
+    """Words from tesseract's TSV output (level 5 rows with text)."""
+    return parse_tsv_pages(tsv, 1)[0]
+
+
+def parse_tsv_pages(tsv: str, pages: int) -> List[List[OCRWord]]:
+    """Words of each page of a multi-page TSV output, by its page_num column; ValueError
+    when a row belongs to none of the `pages`."""
+    out: List[List[OCRWord]] = [[] for _ in range(pages)]
+    for line in tsv.splitlines()[1:]:
+        cols = line.split("\t")
+        if len(cols) < 12 or cols[0] != "5" or not cols[11].strip():
+            continue
+        page = int(cols[1]) - 1
+        if not 0 <= page < pages:
+            raise ValueError(f"tesseract reported page {page + 1} of {pages}")
+        left, top, width, height = (int(c) for c in cols[6:10])
+        out[page].append(OCRWord(cols[11].strip(), float(cols[10]), left, top, width, height))
+    return out
+
+
+def tesseract_cmd() -> str:
+    """Path of the tesseract binary ($TESSERACT_CMD or `tesseract` on PATH)."""
+    return os.environ.get("TESSERACT_CMD") or "tesseract"
+
+
+_HAS_TESSEROCR: Optional[bool] = None
+
+
+def _has_tesserocr() -> bool:
+    global _HAS_TESSEROCR
+    if _HAS_TESSEROCR is None:
+        try:
+            import tesserocr  # noqa: F401
+            _HAS_TESSEROCR = True
+        except Exception:
+            _HAS_TESSEROCR = False
+    return _HAS_TESSEROCR
+
+
+def _has_binary() -> bool:
+    return shutil.which(tesseract_cmd()) is not None
+
+
+def _has_pytesseract() -> bool:
+    try:
+        import pytesseract  # noqa: F401
+    except Exception:
+        return False
+    return _has_binary()
+
+
+_AVAILABLE = {"tesserocr": _has_tesserocr, "pipe": _has_binary, "pytesseract": _has_pytesseract}
+
+
+def select_engine_name(requested: Optional[str] = None) -> Optional[str]:
+    """Return the engine to use, or None when no Tesseract engine is installed."""
+    requested = requested or os.environ.get("OCR_TESSERACT_ENGINE") or "auto"
+    if requested != "auto":
+        if requested not in ENGINES:
+            raise ValueError(f"unknown tesseract engine \"{requested}\", expected auto or one of {', '.join(ENGINES)}")
+        return requested if _AVAILABLE[requested]() else None
+    for name in ENGINES:
+        if _AVAILABLE[name]():
+            return name
+    return None
+
+
+class TesserocrEngine:
+    """Persistent TessBaseAPIs; images are handed over as PIL images, no files involved.
+
+    An API object is not thread safe, so each concurrent caller borrows its own; they are
+    created on demand (models loaded once per API) and kept for reuse.
+    """
+    name = "tesserocr"
+    batches = False
+
+    def __init__(self):
+        import tesserocr
+        self._tesserocr = tesserocr
+        self._idle: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._apis = [tesserocr.PyTessBaseAPI()]
+        self._idle.put(self._apis[0])
+        self._lock = threading.Lock()
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            api = self._tesserocr.PyTessBaseAPI()
+            with self._lock:
+                self._apis.append(api)
+            return api
+
+    def recognize(self, img: Image.Image) -> str:
+        api = self._acquire()
+        try:
+            api.SetImage(img.convert("L") if img.mode == "1" else img)
+            return api.GetUTF8Text()
+        finally:
+            self._idle.put(api)
+
+    def recognize_words(self, img: Image.Image, psm: Optional[int] = None) -> List[OCRWord]:
+        level = self._tesserocr.RIL.WORD
+        api = self._acquire()
+        try:
+            if psm is not None:
+                api.SetPageSegMode(psm)
+            api.SetImage(img.convert("L") if img.mode == "1" else img)
+            api.Recognize()
+            words = []
+            for r in self._tesserocr.iterate_level(api.GetIterator(), level):
+                text = (r.GetUTF8Text(level) or "").strip()
+                box = r.BoundingBox(level)
+                if text and box:
+                    x0, y0, x1, y1 = box
+                    words.append(OCRWord(text, r.Confidence(level), x0, y0, x1 - x0, y1 - y0))
+            return words
+        finally:
+            if psm is not None:
+                api.SetPageSegMode(self._tesserocr.PSM.AUTO)
+            self._idle.put(api)
+
+    def recognize_many(self, images: List[Image.Image]) -> List[str]:
+        return [self.recognize(img) for img in images]
+
+    def recognize_words_many(self, images: List[Image.Image], psm: Optional[int] = None) -> List[List[OCRWord]]:
+        return [self.recognize_words(img, psm) for img in images]
+
+    def close(self) -> None:
+        for api in self._apis:
+            api.End()
+
+
+class PipeEngine:
+    """Drive the tesseract binary through stdin/stdout, several images per process."""
+    name = "pipe"
+    batches = True
+
+    def __init__(self, timeout: float = 60.0):
+        self.cmd = tesseract_cmd()
+        self.timeout = timeout
+        self.processes = 0
+
+    def _run(self, data: bytes, pages: int, *configs: str) -> str:
+        self.processes += 1
+        proc = subprocess.run(
+            [self.cmd, "stdin", "stdout", *configs],
+            input=data,
+            capture_output=True,
+            timeout=self.timeout * pages,
+        )
+        if proc.returncode != 0:
+            raise RuntimeError(f"tesseract failed ({proc.returncode}): {proc.stderr.decode(errors='replace').strip()}")
+        return proc.stdout.decode("utf-8", errors="replace")
+
+    def recognize(self, img: Image.Image) -> str:
+        buf = io.BytesIO()
+        img.save(buf, format="PNG")
+        return self._run(buf.getvalue(), 1)
+
+    def recognize_words(self, img: Image.Image, psm: Optional[int] = None) -> List[OCRWord]:
+        buf = io.BytesIO()
+        img.save(buf, format="PNG")
+        configs = ("--psm", str(psm), "tsv") if psm is not None else ("tsv",)
+        return parse_tsv(self._run(buf.getvalue(), 1, *configs))
+
+    @staticmethod
+    def _tiff(images: List[Image.Image]) -> bytes:
+        # copies: Image.save() leaves encoder settings on an image that break a later multi-page save
+        pages = [img.copy() for img in images]
+        compression = "group4" if all(img.mode == "1" for img in pages) else "tiff_deflate"
+        buf = io.BytesIO()
+        pages[0].save(buf, format="TIFF", save_all=True, append_images=pages[1:], compression=compression)
+        return buf.getvalue()
+
+    def recognize_many(self, images: List[Image.Image]) -> List[str]:
+        """OCR all images in one tesseract process, as pages of an in-memory TIFF."""
+        if len(images) <= 1:
+            return [self.recognize(img) for img in images]
+        pages = self._run(self._tiff(images), len(images)).split(PAGE_SEPARATOR)
+        # one text per page followed by an empty tail; anything else means the split is unreliable
+        if len(pages) == len(images) + 1 and not pages[-1].strip():
+            return pages[:-1]
+        return [self.recognize(img) for img in images]
+
+    def recognize_words_many(self, images: List[Image.Image], psm: Optional[int] = None) -> List[List[OCRWord]]:
+        """Words of all images from one tesseract process, split by the TSV page numbers."""
+        if len(images) <= 1:
+            return [self.recognize_words(img, psm) for img in images]
+        configs = ("--psm", str(psm), "tsv") if psm is not None else ("tsv",)
+        try:
+            return parse_tsv_pages(self._run(self._tiff(images), len(images), *configs), len(images))
+        except ValueError:
+            return [self.recognize_words(img, psm) for img in images]
+
+    def close(self) -> None:
+        pass
+
+
+class PytesseractEngine:
+    """The original path: pytesseract writes a temp file and starts tesseract for every image."""
+    name = "pytesseract"
+    batches = False
+
+    def __init__(self):
+        import pytesseract
+        self._pytesseract = pytesseract
+
+    def recognize(self, img: Image.Image) -> str:
+        return self._pytesseract.image_to_string(img)
+
+    def recognize_words(self, img: Image.Image, psm: Optional[int] = None) -> List[OCRWord]:
+        return parse_tsv(self._pytesseract.image_to_data(img, config=f"--psm {psm}" if psm is not None else ""))
+
+    def recognize_many(self, images: List[Image.Image]) -> List[str]:
+        return [self.recognize(img) for img in images]
+
+    def recognize_words_many(self, images: List[Image.Image], psm: Optional[int] = None) -> List[List[OCRWord]]:
+        return [self.recognize_words(img, psm) for img in images]
+
+    def close(self) -> None:
+        pass
+
+
+_ENGINE_CLASSES = {"tesserocr": TesserocrEngine, "pipe": PipeEngine, "pytesseract": PytesseractEngine}
+_ENGINES = {}
+_ENGINES_LOCK = threading.Lock()
+
+
+def engine_batches(name: Optional[str] = None) -> bool:
+    """Whether the engine `select_engine_name(name)` picks is cheaper per image when given
+    several images in one call (the pipe engine); False when there is no engine."""
+    name = select_engine_name(name)
+    return name is not None and _ENGINE_CLASSES[name].batches
+
+
+def get_engine(name: Optional[str] = None):
+    """Return this process's engine (created on first use), or None if none is available."""
+    name = select_engine_name(name)
+    if name is None:
+        return None
+    with _ENGINES_LOCK:
+        engine = _ENGINES.get(name)
+        if engine is None:
+            engine = _ENGINES[name] = _ENGINE_CLASSES[name]()
+        return engine
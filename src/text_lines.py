@@ -0,0 +1,97 @@
+"""Group recognized text boxes into lines with a sweep line over x and y-buckets of open rows."""
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Sequence, Tuple
+
+# ((x, y), (w, h)) with y pointing up, as returned by Apple Vision (normalized 0..1)
+Box = Tuple[Tuple[float, float], Tuple[float, float]]
+
+
+@dataclass
+class TextLine:
+    """A line of text, its bounding box (same convention as the input boxes) and its fragments."""
+    text: str
+    box: Box
+    parts: List[Tuple[str, Box]] = field(default_factory=list)
+
+    def as_dict(self) -> Dict[str, Any]:
+        (x, y), (w, h) = self.box
+        return {"text": self.text, "box": [x, y, w, h]}
+
+
+@dataclass
+class _Row:
+    parts: List[Tuple[str, Box]]
+    first_y: float
+    last_y: float
+    right: float
+    bucket: int
+
+
+def _union(boxes: Sequence[Box]) -> Box:
+    x0 = min(b[0][0] for b in boxes)
+    y0 = min(b[0][1] for b in boxes)
+    x1 = max(b[0][0] + b[1][0] for b in boxes)
+    y1 = max(b[0][1] + b[1][1] for b in boxes)
+    return (x0, y0), (x1 - x0, y1 - y0)
+
+
+def group_text_lines(results, y_tolerance: float = 0.02, max_dist: float = 0.05) -> List[TextLine]:
+    """Group (text, box) fragments into lines, top line first.
+
+    A fragment joins the open row whose last fragment is vertically within `y_tolerance`
+    and horizontally no more than `max_dist` to the left of it; when several rows
+    qualify (interleaved columns, tightly spaced lines) the vertically closest wins.
+    Fragments are swept left to right and open rows are kept in buckets of height
+    `y_tolerance`, so each fragment only looks at rows in three neighbouring buckets,
+    and rows that ended more than `max_dist` to the left of the sweep are retired.
+    That keeps grouping close to O(n log n) even for thousands of fragments.
+    """
+    frags = []
+    for text, box in results:
+        (bx, by), (bw, bh) = box
+        frags.append((text, ((bx, by), (bw, bh))))
+    frags.sort(key=lambda f: f[1][0][0])  # sort by x
+
+    bucket_size = y_tolerance if y_tolerance > 0 else 1.0
+    buckets: Dict[int, List[_Row]] = {}
+    rows: List[_Row] = []
+
+    for text, box in frags:
+        (bx, by), (bw, bh) = box
+        key = int(by // bucket_size)
+
+        best = None
+        best_dy = None
+        for k in (key - 1, key, key + 1):
+            open_rows = buckets.get(k)
+            if not open_rows:
+                continue
+            # retire rows that can no longer accept anything: x only grows from here on
+            alive = [r for r in open_rows if bx - r.right < max_dist]
+            if len(alive) != len(open_rows):
+                buckets[k] = open_rows = alive
+            for r in open_rows:
+                dy = abs(by - r.last_y)
+                if dy < y_tolerance and (best_dy is None or dy < best_dy):
+                    best, best_dy = r, dy
+
+        if best is None:
+            row = _Row(parts=[(text, box)], first_y=by, last_y=by, right=bx + bw, bucket=key)
+            rows.append(row)
+            buckets.setdefault(key, []).append(row)
+            continue
+
+        best.parts.append((text, box))
+        best.last_y = by
+        best.right = max(best.right, bx + bw)
+        if best.bucket != key:
+            buckets[best.bucket].remove(best)
+            buckets.setdefault(key, []).append(best)
+            best.bucket = key
+
+    # sort by y-coordinate of the first fragment, 0 is bottom
+    rows.sort(key=lambda r: r.first_y, reverse=True)
+    return [
+        TextLine(text=" ".join(t for t, _ in r.parts), box=_union([b for _, b in r.parts]), parts=r.parts)
+        for r in rows
+    ]
@@ -0,0 +1,223 @@
+"""Tiled OCR for very large or very tall images (posters, scroll captures).
+
+The normal Tesseract path scales images down to 2000px wide, which loses small text on
+large posters and leaves a tall scroll capture as one huge bitmap OCR'd on a single core.
+Here the scale is chosen from the estimated text height instead (small text is kept
+readable, never upscaled), the binarized image is split into overlapping tiles sized from
+the image and text dimensions, and the tiles are OCR'd concurrently. Words from the
+overlaps are de-duplicated and the rest is stitched back into lines in reading order.
+
+Tiling is used only when `plan_tiling` decides the image needs it; $OCR_TILING=off
+disables it and $OCR_TILE_WORKERS caps the concurrent tiles (default: one per CPU core).
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+# text line height (px) Tesseract reads best, and below which small text gets lost
+TARGET_TEXT_HEIGHT = 28
+MIN_TEXT_HEIGHT = 14
+# images up to this size (after scaling) go through the normal single-image path
+MAX_SINGLE_WIDTH = 2400
+MAX_SINGLE_HEIGHT = 4000
+# tiles are about this many text lines tall, within these bounds (px)
+LINES_PER_TILE = 40
+MIN_TILE = 800
+MAX_TILE = 2400
+# side of the crops sampled to estimate the text height
+_SAMPLE = 1024
+
+# (left, top, right, bottom) in pixels of the scaled image
+TileBox = Tuple[int, int, int, int]
+
+
+@dataclass
+class TilingPlan:
+    scale: float
+    text_height: Optional[float]
+    tile_width: int
+    tile_height: int
+    overlap: int
+    overlap_x: int
+
+
+def tiling_mode() -> str:
+    """$OCR_TILING: auto (default) or off."""
+    return (os.environ.get("OCR_TILING") or "auto").lower()
+
+
+def might_need_tiling(size: Tuple[int, int], max_width: int = 2000) -> bool:
+    """Cheap check on the image header: only large or tall images are worth a closer look."""
+    w, h = size
+    scaled_h = h * min(1.0, max_width / w) if w else h
+    return w > max_width * 1.5 or scaled_h > MAX_SINGLE_HEIGHT
+
+
+def estimate_text_height(img: Image.Image) -> Optional[float]:
+    """Median height (px) of text lines, from the row profile of a few sampled crops.
+
+    The foreground is whichever side of the mean luminance is the minority (dark text on
+    light backgrounds and light text on dark themes); runs of rows holding foreground are
+    taken as text lines. Returns None when no plausible lines are found.
+    """
+    w, h = img.size
+    xs = sorted({max(0, min(w - _SAMPLE, int(w * f) - _SAMPLE // 2)) for f in (0.25, 0.5, 0.75)})
+    ys = sorted({max(0, min(h - _SAMPLE, int(h * f) - _SAMPLE // 2)) for f in (0.2, 0.5, 0.8)})
+    runs: List[int] = []
+    for x in xs:
+        for y in ys:
+            arr = np.asarray(img.crop((x, y, min(w, x + _SAMPLE), min(h, y + _SAMPLE))).convert("L"), dtype=np.uint8)
+            if arr.size == 0:
+                continue
+            fg = arr < arr.mean()
+            if fg.mean() > 0.5:
+                fg = ~fg
+            rows = fg.mean(axis=1) > 0.005
+            # lengths of the runs of True in `rows`
+            edges = np.diff(np.concatenate(([0], rows.astype(np.int8), [0])))
+            starts, ends = np.nonzero(edges == 1)[0], np.nonzero(edges == -1)[0]
+            runs.extend(int(e - s) for s, e in zip(starts, ends) if 4 <= e - s <= 300)
+    if len(runs) < 3:
+        return None
+    return float(np.median(runs))
+
+
+def plan_tiling(size: Tuple[int, int], text_height: Optional[float], max_width: int = 2000) -> Optional[TilingPlan]:
+    """Return how to tile an image of `size`, or None when the normal path handles it well.
+
+    The scale keeps text at about TARGET_TEXT_HEIGHT (never upscaling); without a text
+    height estimate it falls back to the normal path's width cap.
+    """
+    w, h = size
+    normal_scale = min(1.0, max_width / w)
+    if text_height and text_height * normal_scale < MIN_TEXT_HEIGHT:
+        scale = min(1.0, TARGET_TEXT_HEIGHT / text_height)
+    else:
+        scale = normal_scale
+    sw, sh = round(w * scale), round(h * scale)
+    if sw <= MAX_SINGLE_WIDTH and sh <= MAX_SINGLE_HEIGHT:
+        return None
+    line = (text_height or TARGET_TEXT_HEIGHT) * scale
+    tile = int(min(MAX_TILE, max(MIN_TILE, line * LINES_PER_TILE)))
+    # cutting lines is worse than cutting columns: keep full-width tiles where possible
+    tile_width = sw if sw <= MAX_SINGLE_WIDTH else tile
+    # a line cut at one tile's border is whole in the neighbour's overlap; side by side
+    # tiles overlap by about a long word
+    overlap = int(min(tile // 4, max(40, 2 * line + 8)))
+    overlap_x = int(min(tile_width // 3, max(overlap, 12 * line)))
+    return TilingPlan(scale=scale, text_height=text_height, tile_width=tile_width, tile_height=tile,
+                      overlap=overlap, overlap_x=overlap_x)
+
+
+def _positions(length: int, tile: int, overlap: int) -> List[int]:
+    if length <= tile:
+        return [0]
+    step = tile - overlap
+    out = list(range(0, length - tile, step))
+    out.append(length - tile)
+    return out
+
+
+def tile_boxes(size: Tuple[int, int], tile_width: int, tile_height: int, overlap: int, overlap_x: Optional[int] = None) -> List[TileBox]:
+    """Overlapping tiles covering an image of `size`, row by row."""
+    w, h = size
+    return [
+        (x, y, min(w, x + tile_width), min(h, y + tile_height))
+        for y in _positions(h, tile_height, overlap)
+        for x in _positions(w, tile_width, overlap if overlap_x is None else overlap_x)
+    ]
+
+
+def _seams(starts_ends: List[Tuple[int, int]]) -> dict:
+    """Per tile start along one axis: where its share begins, halfway into the overlap
+    with the previous tile (the last tile is flush with the edge, so overlaps differ)."""
+    spans = sorted(set(starts_ends))
+    seams = {spans[0][0]: spans[0][0]}
+    for (_, prev_end), (start, _) in zip(spans, spans[1:]):
+        seams[start] = (start + prev_end) / 2
+    return seams
+
+
+def _overlaps(a, b) -> bool:
+    return a.left < b.left + b.width and b.left < a.left + a.width and a.top < b.top + b.height and b.top < a.top + a.height
+
+
+def dedupe_tile_words(tiles: List[Tuple[TileBox, list]], size: Tuple[int, int], edge: int = 2) -> list:
+    """Keep each word once. Words are owned by the tile whose core holds their centre;
+    words touching a tile border inside the image are probably cut and whole in the
+    neighbour, so they are only kept when no other word covers that spot (a word wider
+    than the overlap is cut in both tiles; the larger piece wins).
+    Word boxes are given in tile coordinates and returned in image coordinates."""
+    x_seams = _seams([(b[0], b[2]) for b, _ in tiles])
+    y_seams = _seams([(b[1], b[3]) for b, _ in tiles])
+    x_ends = dict((b[0], b[2]) for b, _ in tiles)
+    y_ends = dict((b[1], b[3]) for b, _ in tiles)
+    next_x = {a: b for a, b in zip(sorted(x_seams), sorted(x_seams)[1:])}
+    next_y = {a: b for a, b in zip(sorted(y_seams), sorted(y_seams)[1:])}
+    kept = []
+    cut = []
+    for box, words in tiles:
+        left, top, right, bottom = box
+        # the part of the tile that owns the words centred in it
+        core = (
+            x_seams[left],
+            y_seams[top],
+            x_seams[next_x[left]] if left in next_x else x_ends[left],
+            y_seams[next_y[top]] if top in next_y else y_ends[top],
+        )
+        for word in words:
+            x0, y0 = left + word.left, top + word.top
+            x1, y1 = x0 + word.width, y0 + word.height
+            placed = word._replace(left=x0, top=y0)
+            if (left > 0 and x0 - left < edge) or (top > 0 and y0 - top < edge) \
+                    or (right < size[0] and right - x1 < edge) or (bottom < size[1] and bottom - y1 < edge):
+                cut.append(placed)
+                continue
+            cx, cy = (x0 + x1) / 2, (y0 + y1) / 2
+            if core[0] <= cx < core[2] and core[1] <= cy < core[3]:
+                kept.append(placed)
+    rescued = []
+    for word in sorted(cut, key=lambda w: w.width * w.height, reverse=True):
+        if not any(_overlaps(word, other) for other in kept) and not any(_overlaps(word, other) for other in rescued):
+            rescued.append(word)
+    return kept + rescued
+
+
+def stitch_words(words: list, size: Tuple[int, int]) -> str:
+    """Group words into lines (see `group_text_lines`) and join them top to bottom."""
+    from src.text_lines import group_text_lines
+
+    if not words:
+        return ""
+    w, h = size
+    line = float(np.median([word.height for word in words]))
+    # group_text_lines takes normalized boxes with the origin at the bottom left
+    boxes = [(word.text, ((word.left / w, 1 - (word.top + word.height) / h), (word.width / w, word.height / h)))
+             for word in words]
+    lines = group_text_lines(boxes, y_tolerance=0.5 * line / h, max_dist=3 * line / w)
+    return "\n".join(l.text for l in lines)
+
+
+def ocr_tiled(img: Image.Image, plan: TilingPlan, engine, max_workers: Optional[int] = None) -> Tuple[str, int]:
+    """Scale and binarize `img` per `plan`, OCR its tiles concurrently with `engine`
+    (`recognize_words`, or all in one call when the engine batches) and return the
+    stitched text and the number of tiles."""
+    from src.image_handler import preprocess_for_ocr
+
+    if plan.scale < 1.0:
+        img = img.resize((max(1, round(img.width * plan.scale)), max(1, round(img.height * plan.scale))), Image.LANCZOS)
+    # binarize once: the fixed threshold uses global statistics, which tiles would not share
+    img = preprocess_for_ocr(img)
+    boxes = tile_boxes(img.size, plan.tile_width, plan.tile_height, plan.overlap, plan.overlap_x)
+    if getattr(engine, "batches", False):
+        results = engine.recognize_words_many([img.crop(box) for box in boxes])
+    else:
+        workers = max(1, min(len(boxes), max_workers or os.cpu_count() or 1))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(lambda box: engine.recognize_words(img.crop(box)), boxes))
+    words = dedupe_tile_words(list(zip(boxes, results)), img.size)
+    return stitch_words(words, img.size), len(boxes)
@@ -4,3 +4,14 @@ import os
 def setup_logging():
     level = os.environ.get("LOG_LEVEL", "INFO")
     logging.basicConfig(level=level)
+
+
+def percentile(values, q: float) -> float:
+    """Return the q-th percentile (0-100) of `values` using linear interpolation; 0.0 when empty."""
+    data = sorted(values)
+    if not data:
+        return 0.0
+    pos = (len(data) - 1) * q / 100.0
+    lo = int(pos)
+    hi = min(lo + 1, len(data) - 1)
+    return data[lo] + (data[hi] - data[lo]) * (pos - lo)
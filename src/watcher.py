@@ -0,0 +1,353 @@
+"""Watch a folder and hand newly written images to a warm OCR/LLM worker setup.
+
+Uses Linux inotify (through ctypes, no extra dependency) and falls back to polling
+directory listings elsewhere. New files are debounced until their size and mtime stop
+changing, so partially written screenshots and downloads are never processed.
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from src.batch import IMAGE_EXTENSIONS, _ocr_worker, warm_up_worker
+from src.instrumentation import Profiler, Trace, tracing
+
+# inotify constants from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_EVENT_HEADER = struct.Struct("iIII")
+
+# suffixes used by browsers and tools for files still being written
+_TEMP_SUFFIXES = {".part", ".crdownload", ".download", ".tmp", ".partial"}
+
+# entries of handled files are checked for vanished files once there are this many
+_DONE_PRUNE_AT = 1024
+
+
+def is_candidate(path: Path) -> bool:
+    """True for image files that are not hidden or temporary."""
+    name = path.name
+    if name.startswith(".") or name.startswith("~"):
+        return False
+    if path.suffix.lower() in _TEMP_SUFFIXES:
+        return False
+    return path.suffix.lower() in IMAGE_EXTENSIONS
+
+
+class PollingWatcher:
+    """Portable fallback: compare directory listings every `interval` seconds."""
+
+    def __init__(self, directory: Path, recursive: bool = False, interval: float = 2.0):
+        self.directory = directory
+        self.recursive = recursive
+        self.interval = interval
+        self._known = self._snapshot()
+        self._next_scan = time.monotonic() + interval
+
+    def _snapshot(self) -> Dict[str, Tuple[int, int]]:
+        entries = self.directory.rglob("*") if self.recursive else self.directory.iterdir()
+        snap = {}
+        for p in entries:
+            try:
+                st = p.stat()
+            except OSError:
+                continue
+            if p.is_file():
+                snap[str(p)] = (st.st_size, st.st_mtime_ns)
+        return snap
+
+    def poll(self, timeout: float) -> List[Path]:
+        """Wait up to `timeout` seconds and return files that appeared or changed."""
+        delay = self._next_scan - time.monotonic()
+        if delay > 0:
+            time.sleep(min(delay, timeout))
+            if delay > timeout:
+                return []
+        self._next_scan = time.monotonic() + self.interval
+        snap = self._snapshot()
+        changed = [Path(p) for p, sig in snap.items() if self._known.get(p) != sig]
+        self._known = snap
+        return changed
+
+    def close(self) -> None:
+        pass
+
+
+class InotifyWatcher:
+    """Linux inotify watcher; blocks in select() so an idle watch costs no CPU."""
+
+    def __init__(self, directory: Path, recursive: bool = False):
+        libc_name = ctypes.util.find_library("c") or "libc.so.6"
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.recursive = recursive
+        self._dirs: Dict[int, Path] = {}
+        self._add_watch(directory)
+        if recursive:
+            for sub in directory.rglob("*"):
+                if sub.is_dir():
+                    self._add_watch(sub)
+
+    def _add_watch(self, directory: Path) -> None:
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(str(directory)), mask)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {directory}")
+        self._dirs[wd] = directory
+
+    def poll(self, timeout: float) -> List[Path]:
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        out = []
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            parent = self._dirs.get(wd)
+            if parent is None or not name:
+                continue
+            path = parent / os.fsdecode(name)
+            if mask & IN_ISDIR:
+                if self.recursive and mask & (IN_CREATE | IN_MOVED_TO):
+                    self._add_watch(path)
+                continue
+            out.append(path)
+        return out
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+def open_watcher(directory: Path, recursive: bool = False, polling: bool = False, poll_interval: float = 2.0):
+    """Return an inotify watcher when available (Linux), else a polling watcher."""
+    if not polling and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(directory, recursive=recursive)
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher(directory, recursive=recursive, interval=poll_interval)
+
+
+class Debouncer:
+    """Hold paths until their size and mtime have been stable for `settle` seconds."""
+
+    def __init__(self, settle: float = 2.0):
+        self.settle = settle
+        self._pending: Dict[Path, Tuple[Tuple[int, int], float]] = {}
+
+    def touch(self, paths: Iterable[Path]) -> None:
+        now = time.monotonic()
+        for p in paths:
+            self._pending[p] = ((-1, -1), now)
+
+    def ready(self) -> List[Path]:
+        """Return (and forget) the paths that stopped changing; vanished files are dropped."""
+        now = time.monotonic()
+        out = []
+        for p, (sig, since) in list(self._pending.items()):
+            try:
+                st = p.stat()
+            except OSError:
+                del self._pending[p]
+                continue
+            current = (st.st_size, st.st_mtime_ns)
+            if current != sig:
+                self._pending[p] = (current, now)
+            elif st.st_size > 0 and now - since >= self.settle:
+                del self._pending[p]
+                out.append(p)
+        return out
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+
+class FolderWatcher:
+    """Long-running loop: watch -> debounce -> OCR on a warm process pool -> name -> rename.
+
+    The process pool, the result cache and the LLM clients are created once and reused
+    for every file, so a new image only pays for its own OCR and LLM call.
+    """
+
+    def __init__(
+            self,
+            directory: Path,
+            rename: bool = False,
+            workers: int = 2,
+            settle: float = 2.0,
+            poll_interval: float = 2.0,
+            polling: bool = False,
+            recursive: bool = False,
+            force_tesseract: bool = False,
+            cache=None,
+            verbose: bool = False,
+            on_result: Optional[Callable[[Dict[str, Any]], None]] = None,
+            profiler: Optional[Profiler] = None,
+            similar=None,
+            ):
+        self.directory = directory
+        self.rename = rename
+        self.workers = max(1, workers)
+        self.poll_interval = poll_interval
+        self.polling = polling
+        self.recursive = recursive
+        self.force_tesseract = force_tesseract
+        self.cache = cache
+        self.verbose = verbose
+        self.on_result = on_result
+        self.profiler = profiler or Profiler()
+        self.similar = similar
+        self.debouncer = Debouncer(settle)
+        self.processed = 0
+        # (size, mtime) of files already handled, so repeated events do not redo the work
+        self._done: Dict[Path, Tuple[int, int]] = {}
+        self._prune_at = _DONE_PRUNE_AT
+        self._inflight: Dict[Future, Path] = {}
+
+    def _log(self, message: str) -> None:
+        if self.verbose:
+            print(f"[VERBOSE] {message}", file=sys.stderr)
+
+    def wants(self, path: Path) -> bool:
+        """True when `path` should be (re)processed: a finished-looking image not yet in the target format."""
+        from src.naming_engine import is_filename_in_desired_format
+
+        if not is_candidate(path) or is_filename_in_desired_format(path.name):
+            return False
+        if path in self._inflight.values():
+            return False
+        try:
+            st = path.stat()
+        except OSError:
+            return False
+        return self._done.get(path) != (st.st_size, st.st_mtime_ns)
+
+    def scan_existing(self) -> None:
+        """Queue images already in the folder (the watch itself only sees new files)."""
+        entries = self.directory.rglob("*") if self.recursive else self.directory.iterdir()
+        self.debouncer.touch(p for p in entries if p.is_file() and self.wants(p))
+
+    def run(self, stop: Optional[threading.Event] = None, scan_existing: bool = False) -> None:
+        """Process new images until `stop` is set (or forever)."""
+        from src.llm_integration import warm_up_clients
+
+        stop = stop or threading.Event()
+        watcher = open_watcher(self.directory, self.recursive, self.polling, self.poll_interval)
+        self._log(f"Watching {self.directory} with {type(watcher).__name__}, {self.workers} OCR workers")
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            # start the workers and import the OCR backend now rather than on the first screenshot
+            for _ in range(self.workers):
+                pool.submit(warm_up_worker, self.force_tesseract)
+            self._log(f"{warm_up_clients()} LLM client(s) ready")
+            if scan_existing:
+                self.scan_existing()
+            try:
+                while not stop.is_set():
+                    busy = len(self.debouncer) or self._inflight
+                    # block in the watcher while idle, tick quickly while files settle or run
+                    events = watcher.poll(0.2 if busy else 1.0)
+                    self.debouncer.touch(p for p in events if self.wants(p))
+                    for path in self.debouncer.ready():
+                        if self.wants(path):
+                            self._submit(pool, path)
+                    self._collect()
+            finally:
+                watcher.close()
+                for fut in list(self._inflight):
+                    fut.cancel()
+
+    def _submit(self, pool: ProcessPoolExecutor, path: Path) -> None:
+        from src.image_handler import has_ocr_backend
+        from src.naming_engine import lookup_similar, ocr_cache_key
+
+        try:
+            st = path.stat()
+            cached_key = ocr_cache_key(str(path), self.force_tesseract) \
+                if self.cache is not None and has_ocr_backend(self.force_tesseract) else None
+        except OSError as e:
+            # moved or deleted since it settled
+            self._log(f"Dropping {path}: {e}")
+            return
+        self._done[path] = (st.st_size, st.st_mtime_ns)
+        if len(self._done) >= self._prune_at:
+            self._prune_done()
+        if self.similar is not None:
+            with tracing() as trace:
+                reused = lookup_similar(str(path), self.similar, self.verbose)
+            if reused is not None:
+                self._finish(str(path), "", 0.0, None, trace.stages, reused=reused)
+                return
+        if cached_key is not None:
+            text = self.cache.get("ocr", cached_key)
+            if text is not None:
+                self._finish(str(path), text, 0.0, None, {"cache.ocr": {"hits": 1}})
+                return
+        self._log(f"New image {path}")
+        self._inflight[pool.submit(_ocr_worker, (str(path), self.force_tesseract))] = path
+
+    def _prune_done(self) -> None:
+        """Forget handled files that no longer exist, so a long watch without renaming
+        does not keep one entry per file it has ever seen."""
+        self._done = {p: sig for p, sig in self._done.items() if p.exists()}
+        self._prune_at = max(_DONE_PRUNE_AT, 2 * len(self._done))
+
+    def _collect(self) -> None:
+        from src.image_handler import has_ocr_backend
+        from src.naming_engine import ocr_cache_key
+
+        for fut in [f for f in self._inflight if f.done()]:
+            del self._inflight[fut]
+            image_path, text, secs, error, stages = fut.result()
+            if not error and self.cache is not None and has_ocr_backend(self.force_tesseract):
+                try:
+                    self.cache.put("ocr", ocr_cache_key(image_path, self.force_tesseract), text)
+                except OSError as e:
+                    # moved or deleted during OCR: the text is still good for naming, not for the cache
+                    self._log(f"Not caching OCR of {image_path}: {e}")
+            self._finish(image_path, text, secs, error, stages)
+
+    def _finish(self, image_path: str, ocr_text: str, ocr_seconds: float, error: Optional[str], stages: Dict[str, Any],
+                reused: Optional[Dict[str, Any]] = None) -> None:
+        from src.naming_engine import name_from_ocr_text, rename_to_suggested
+
+        entry: Dict[str, Any] = {"file": image_path}
+        trace = Trace()
+        trace.merge(stages)
+        if error:
+            entry["error"] = error
+        else:
+            with tracing(trace):
+                if reused is not None:
+                    entry.update(reused)
+                else:
+                    entry["ocr_seconds"] = round(ocr_seconds, 3)
+                    entry.update(name_from_ocr_text(image_path, ocr_text, verbose=self.verbose, cache=self.cache))
+                if self.rename and rename_to_suggested(Path(image_path), entry):
+                    self._done.pop(Path(image_path), None)
+            if self.similar is not None and reused is None:
+                self.similar.add(image_path, entry)
+        self.processed += 1
+        self.profiler.file_done(entry, trace)
+        self._log(f"{image_path} -> {entry.get('renamed_to') or entry.get('title')}")
+        if self.on_result is not None:
+            self.on_result(entry)
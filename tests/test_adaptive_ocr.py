@@ -0,0 +1,75 @@
+import numpy as np
+from PIL import Image, ImageDraw
+
+from src.adaptive_ocr import OCRPass, ocr_adaptive, pass_score
+from src.image_handler import preprocess_for_ocr
+from src.tesseract_pool import OCRWord
+
+_WORDS = ["Payment", "Service", "Overview"]
+
+
+class FakeEngine:
+    """Reads the words surely off a light background, barely off a dark one; `good_psm`
+    makes every other page segmentation mode unsure too."""
+
+    def __init__(self, good_psm=None):
+        self.good_psm = good_psm
+        self.calls = []
+
+    def recognize_words(self, img, psm=None):
+        self.calls.append(psm)
+        light = np.asarray(img.convert("L")).mean() > 128
+        conf = 93 if light and (self.good_psm is None or psm == self.good_psm) else 25
+        return [OCRWord(t, conf, 20 + 120 * i, 20, 100, 30) for i, t in enumerate(_WORDS)]
+
+
+def _diagram(dark=False):
+    img = Image.new("L", (600, 300), 30 if dark else 240)
+    d = ImageDraw.Draw(img)
+    for y in range(40, 300, 60):
+        d.rectangle((40, y, 500, y + 20), fill=230 if dark else 20)
+    return img
+
+
+def _binarize(img, p):
+    return preprocess_for_ocr(img, method=p.method, threshold=p.threshold)
+
+
+_FIRST = OCRPass("fixed", "fixed", threshold=180)
+
+
+def test_clean_image_takes_a_single_pass():
+    engine = FakeEngine()
+    text, passes, best = ocr_adaptive(_diagram(), engine, _binarize, _FIRST)
+    assert text == "Payment Service Overview"
+    assert passes == ["fixed"] and best == "fixed" and engine.calls == [None]
+
+
+def test_dark_theme_is_read_from_an_inverted_pass():
+    engine = FakeEngine()
+    text, passes, best = ocr_adaptive(_diagram(dark=True), engine, _binarize, _FIRST)
+    assert "inverted" in passes and best in ("sauvola", "inverted")
+    assert text == "Payment Service Overview"
+
+
+def test_best_page_segmentation_mode_wins():
+    engine = FakeEngine(good_psm=11)
+    _, passes, best = ocr_adaptive(_diagram(), engine, _binarize, _FIRST, max_workers=2)
+    assert best == "psm 11" and "inverted" not in passes
+    assert sorted(engine.calls, key=str) == sorted([None, None, None, None, 11, 6], key=str)
+    assert pass_score([OCRWord("ab", 90, 0, 0, 1, 1)]) > pass_score([OCRWord("ab", 30, 0, 0, 1, 1)] * 3)
+
+
+class BatchingEngine(FakeEngine):
+    batches = True
+
+    def recognize_words_many(self, imgs, psm=None):
+        self.calls.append(("many", len(imgs), psm))
+        return [FakeEngine.recognize_words(self, img, psm) for img in imgs]
+
+
+def test_batching_engine_gets_the_passes_of_each_segmentation_mode_together():
+    engine = BatchingEngine(good_psm=11)
+    _, passes, best = ocr_adaptive(_diagram(), engine, _binarize, _FIRST)
+    assert best == "psm 11" and passes[0] == "fixed"
+    assert [c for c in engine.calls if isinstance(c, tuple)] == [("many", 3, None), ("many", 1, 11), ("many", 1, 6)]
@@ -0,0 +1,37 @@
+from pathlib import Path
+from PIL import Image
+
+from src.batch import collect_images, run_ocr_pool
+
+
+def _touch_image(path: Path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    Image.new("RGB", (20, 20), color=(255, 255, 255)).save(path)
+
+
+def test_collect_images_dirs_globs_and_file_list(tmp_path):
+    _touch_image(tmp_path / "a.png")
+    _touch_image(tmp_path / "sub" / "b.jpg")
+    (tmp_path / "notes.txt").write_text("not an image")
+
+    flat = collect_images([str(tmp_path)])
+    assert [p.name for p in flat] == ["a.png"]
+
+    deep = collect_images([str(tmp_path)], recursive=True)
+    assert sorted(p.name for p in deep) == ["a.png", "b.jpg"]
+
+    globbed = collect_images([str(tmp_path / "**" / "*.jpg")])
+    assert [p.name for p in globbed] == ["b.jpg"]
+
+    listing = tmp_path / "list.txt"
+    listing.write_text(f"# comment\n{tmp_path / 'a.png'}\n\n{tmp_path / 'a.png'}\n")
+    assert [p.name for p in collect_images([], file_list=listing)] == ["a.png"]
+
+
+def test_run_ocr_pool_returns_one_result_per_file(tmp_path):
+    paths = [tmp_path / f"img{i}.png" for i in range(3)]
+    for p in paths:
+        _touch_image(p)
+    results = list(run_ocr_pool(paths, workers=2))
+    assert sorted(r[0] for r in results) == sorted(str(p) for p in paths)
+    assert all(r[3] is None for r in results)
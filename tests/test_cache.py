@@ -0,0 +1,41 @@
+import time
+
+from src.cache import ResultCache, file_digest, make_key
+
+
+def test_cache_roundtrip_and_counters(tmp_path):
+    cache = ResultCache(tmp_path / "c.sqlite3")
+    key = make_key("llm", "Service Mesh", {"model": "m"})
+    assert cache.get("llm", key) is None
+    cache.put("llm", key, {"title": "Service Mesh", "keywords": ["mesh"]})
+    assert cache.get("llm", key) == {"title": "Service Mesh", "keywords": ["mesh"]}
+    assert cache.stats["llm_hits"] == 1 and cache.stats["llm_misses"] == 1
+
+    # the cache is persistent across instances
+    cache.close()
+    assert ResultCache(tmp_path / "c.sqlite3").get("llm", key)["title"] == "Service Mesh"
+
+
+def test_content_hash_ignores_file_name(tmp_path):
+    a = tmp_path / "a.bin"
+    b = tmp_path / "copy of a.bin"
+    a.write_bytes(b"same bytes")
+    b.write_bytes(b"same bytes")
+    assert file_digest(str(a)) == file_digest(str(b))
+
+
+def test_eviction_by_size_and_age(tmp_path):
+    cache = ResultCache(tmp_path / "c.sqlite3", max_bytes=0, max_age_days=0)
+    for i in range(5):
+        cache.put("ocr", str(i), "x" * 100)
+        time.sleep(0.001)
+
+    cache.max_bytes = 250
+    assert cache.evict() == 3
+    # least recently used entries go first
+    assert cache.get("ocr", "0") is None and cache.get("ocr", "4") is not None
+
+    cache.max_age = 1e-9
+    time.sleep(0.01)
+    cache.evict()
+    assert cache.size_bytes() == 0
@@ -0,0 +1,30 @@
+from PIL import Image
+
+from src.image_handler import decode_for_ocr, load_image
+
+
+def test_reduced_decode_jpeg_goes_straight_to_grayscale(tmp_path):
+    p = tmp_path / "photo.jpg"
+    Image.new("RGB", (4000, 3000), color=(200, 120, 40)).save(p, quality=85)
+
+    img = load_image(str(p), max_width=1000, mode="L")
+    assert img.mode == "L"
+    # DCT scaling never goes below the requested size
+    assert 1000 <= img.width < 4000
+
+    img, stats = decode_for_ocr(str(p), max_width=1000)
+    assert img.mode == "L" and img.width == 1000 and img.height == 750
+    assert stats["source_size"] == [4000, 3000]
+    assert stats["memory_saved_bytes"] > 0
+
+
+def test_reduced_decode_png_and_small_images(tmp_path):
+    big = tmp_path / "big.png"
+    Image.new("RGB", (3000, 1000), color=(255, 255, 255)).save(big)
+    img, stats = decode_for_ocr(str(big), max_width=1000)
+    assert img.width == 1000 and abs(img.height - 333) <= 1
+
+    small = tmp_path / "small.png"
+    Image.new("RGB", (400, 200), color=(255, 255, 255)).save(small)
+    assert load_image(str(small)).size == (400, 200)
+    assert decode_for_ocr(str(small))[0].size == (400, 200)
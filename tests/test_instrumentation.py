@@ -0,0 +1,46 @@
+from PIL import Image
+
+from src.batch import _ocr_worker
+from src.instrumentation import PrometheusTextfileSink, Profiler, Trace, TraceSinks, count, stage, tracing
+
+
+def test_stages_aggregate_per_trace_and_are_noops_without_one():
+    with stage("ocr.decode") as span:  # no active trace
+        span.set(bytes_read=10)
+
+    with tracing() as trace:
+        for n in (100, 200):
+            with stage("ocr.decode", engine="pipe") as span:
+                span.set(bytes_read=n)
+                count("retries")
+        count("heuristic_names")
+    decode = trace.as_dict()["ocr.decode"]
+    assert decode["calls"] == 2 and decode["bytes_read"] == 300 and decode["retries"] == 2
+    assert decode["engine"] == "pipe" and decode["wall_ms"] >= 0 and "cpu_ms" in decode
+    assert trace.stages["counters"] == {"heuristic_names": 1}
+
+
+def test_ocr_worker_returns_its_stages(tmp_path):
+    path = tmp_path / "img.png"
+    Image.new("RGB", (20, 20), color=(255, 255, 255)).save(path)
+    *_, stages = _ocr_worker((str(path), True))
+    assert stages["ocr.cleanup"]["calls"] == 1
+
+
+def test_profiler_embeds_and_feeds_sinks(tmp_path):
+    trace_file, metrics_file = tmp_path / "trace.jsonl", tmp_path / "metrics.prom"
+    profiler = Profiler(embed=True, sinks=TraceSinks(trace_file, metrics_file))
+    for _ in range(2):
+        trace = Trace()
+        trace.merge({"llm.request": {"calls": 1, "wall_seconds": 0.5, "prompt_tokens": 120}})
+        result = {"file": "a.png"}
+        profiler.file_done(result, trace)
+        assert result["profile"]["llm.request"]["wall_ms"] == 500.0
+    profiler.close()
+
+    assert len(trace_file.read_text().splitlines()) == 2
+    metrics = metrics_file.read_text()
+    assert "dpr_files_total 2" in metrics
+    assert 'dpr_stage_prompt_tokens_total{stage="llm.request"} 240' in metrics
+    assert 'dpr_stage_wall_seconds_total{stage="llm.request"} 1' in metrics
+    assert isinstance(profiler.sinks.sinks[1], PrometheusTextfileSink)
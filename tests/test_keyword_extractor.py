@@ -0,0 +1,57 @@
+from src import llm_integration
+from src.cache import ResultCache
+from src.keyword_extractor import CorpusStats, extract_local, rake_scores
+from src.naming_engine import heuristic_name, name_from_ocr_text
+
+_CORPUS = [
+    "Kubernetes Cluster Architecture\nControl plane API server etcd scheduler\nWorker node kubelet pods",
+    "Order Flow Sequence Diagram\nClient sends order to API gateway\nOrder service validates payment",
+    "Network Topology\nRouter firewall DMZ web servers\nDatabase cluster replication",
+]
+_MESH = "Service Mesh Architecture\nIstio sidecar proxy envoy\nTraffic routing mTLS telemetry"
+
+
+def _corpus(cache=None, copies=8):
+    corpus = CorpusStats(cache)
+    for i in range(copies):
+        for text in _CORPUS:
+            corpus.add(f"{text}\nrevision {i}")
+    return corpus
+
+
+def test_title_and_keywords_from_ocr_text():
+    corpus = _corpus()
+    local = extract_local(_MESH, corpus)
+    assert local.title == "Service Mesh Architecture"
+    # terms seen in every earlier diagram rank below the distinctive ones
+    assert "architecture" not in local.keywords and {"istio", "envoy"} <= set(local.keywords)
+    assert local.confidence > extract_local(_MESH).confidence > 0.5
+    assert extract_local("x7 |||| ;;\nqwrtz bbbbb").confidence == 0.0
+    assert rake_scores(["service mesh for traffic"])["mesh"] == 2.0
+
+
+def test_corpus_statistics_persist_and_count_documents_once(tmp_path):
+    cache = ResultCache(tmp_path / "c.sqlite3")
+    corpus = _corpus(cache, copies=2)
+    assert not corpus.add(f"{_CORPUS[0]}\nrevision 0")
+    reloaded = CorpusStats(cache)
+    assert reloaded.docs == corpus.docs == 6
+    assert reloaded.df["api"] == 4 and reloaded.idf("api") < reloaded.idf("istio")
+
+
+def test_confident_local_result_skips_the_llm(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(llm_integration, "analyze_with_llm", lambda *a, **k: calls.append(a) or None)
+    cache = ResultCache(tmp_path / "c.sqlite3")
+    _corpus(cache)
+
+    monkeypatch.setenv("DPR_LOCAL_THRESHOLD", "0.6")
+    named = name_from_ocr_text("a.png", _MESH, cache=cache)
+    assert named["title"] == "Service Mesh Architecture" and named["local_confidence"] >= 0.6
+    assert calls == []
+
+    # unsure: ask the LLM, then fall back to the extractor's keywords
+    named = name_from_ocr_text("b.png", "LOGIN\nsee data", cache=cache)
+    assert len(calls) == 1 and "local_confidence" not in named
+    assert isinstance(named["keywords"], list) and "login" in named["keywords"]
+    assert heuristic_name("c.png", "")["keywords"] == ["png"]
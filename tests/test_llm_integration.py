@@ -0,0 +1,176 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+from src import llm_integration
+from src.llm_integration import BATCH_SYSTEM_PROMPT, AsyncLLMPool, LLMCallInfo, analyze_batch_with_llm, parse_llm_json, plan_batches
+
+
+def _response(content: str):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+class _FakeAsyncClient:
+    def __init__(self, pool):
+        self.pool = pool
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, **kwargs):
+        await asyncio.sleep(0.01)
+        return _response(json.dumps({"title": "Service Mesh", "keywords": ["mesh"]}))
+
+
+def test_parse_llm_json():
+    assert parse_llm_json('{"title": "A"}') == {"title": "A"}
+    assert parse_llm_json("not json") is None
+    assert parse_llm_json("") is None
+    assert parse_llm_json("[1, 2]") is None
+
+
+def test_async_pool_bounds_in_flight_requests(monkeypatch):
+    monkeypatch.setenv("OLLAMA_MODEL", "test-model")
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    monkeypatch.setattr(llm_integration, "_HAS_OPENAI", True)
+
+    async def run():
+        pool = AsyncLLMPool(max_in_flight=3)
+        fake = _FakeAsyncClient(pool)
+        pool._client = lambda backend: fake
+        results = await asyncio.gather(*(pool.analyze(f"text {i}") for i in range(10)))
+        return pool, results
+
+    pool, results = asyncio.run(run())
+    assert all(r["title"] == "Service Mesh" for r, _ in results)
+    assert all(info.backend == "ollama" and info.latency_seconds > 0 for _, info in results)
+    assert pool.peak_in_flight == 3
+    assert pool.stats()["requests"] == 10
+
+
+def test_plan_batches_respects_token_budget():
+    texts = ["x" * 400] * 10  # ~100 tokens each
+    batches = plan_batches(texts, token_budget=1200, max_items=16)
+    assert [i for b in batches for i in b] == list(range(10))
+    assert all(1 < len(b) < 10 for b in batches)
+    # an oversized item still gets a batch of its own
+    assert plan_batches(["x" * 100000, "short"], token_budget=1000) == [[0], [1]]
+
+
+def test_batch_reply_validation_and_individual_retry(monkeypatch):
+    monkeypatch.setenv("OLLAMA_MODEL", "test-model")
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    monkeypatch.setattr(llm_integration, "_HAS_OPENAI", True)
+    calls = []
+
+    def create(**kwargs):
+        calls.append(kwargs["messages"][0]["content"])
+        if kwargs["messages"][0]["content"] == BATCH_SYSTEM_PROMPT:
+            # item 1 is missing its title, item 2 is missing entirely
+            return _response(json.dumps({"results": [
+                {"id": 0, "title": "First", "keywords": "a, b"},
+                {"id": 1, "keywords": ["x"]},
+            ]}))
+        return _response(json.dumps({"title": "Retried", "keywords": ["r"]}))
+
+    fake = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    monkeypatch.setattr(llm_integration, "get_client", lambda backend: fake)
+
+    stats = {}
+    results = analyze_batch_with_llm(["one", "two", "three"], stats=stats)
+    assert results[0] == {"title": "First", "keywords": ["a", "b"]}
+    assert results[1]["title"] == "Retried" and results[2]["title"] == "Retried"
+    assert len(calls) == 3 and stats["retried_items"] == 2
+
+
+class _StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def test_batched_requests_are_retried_and_item_fallbacks_recorded(monkeypatch):
+    from src import resilience
+    from src.naming_engine import name_many_from_ocr_texts
+
+    monkeypatch.setenv("OLLAMA_MODEL", "test-model")
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    monkeypatch.delenv("DPR_LOCAL_THRESHOLD", raising=False)
+    monkeypatch.setattr(llm_integration, "_HAS_OPENAI", True)
+    monkeypatch.setattr(resilience, "BACKOFF_BASE", 0.001)
+    monkeypatch.setenv("LLM_BREAKER_FAILURES", "100")
+    calls = []
+
+    def create(**kwargs):
+        batched = kwargs["messages"][0]["content"] == BATCH_SYSTEM_PROMPT
+        calls.append("batch" if batched else "single")
+        if batched and calls.count("batch") == 1:
+            raise _StatusError(503)
+        if batched:
+            return _response(json.dumps({"results": [{"id": 0, "title": "First", "keywords": []}]}))
+        raise _StatusError(400)
+
+    fake = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    monkeypatch.setattr(llm_integration, "get_client", lambda backend: fake)
+
+    resilience.reset_breakers()
+    stats, infos = {}, [LLMCallInfo(), LLMCallInfo()]
+    results = analyze_batch_with_llm(["one", "two"], stats=stats, infos=infos)
+    # the 503 is retried like a single request; the missing item is asked for on its own, which fails for good
+    assert calls == ["batch", "batch", "single"]
+    assert results[0]["title"] == "First" and results[1] is None
+    assert infos[0].fallback is None and infos[0].attempts == 2 and infos[1].fallback == "error"
+
+    named = name_many_from_ocr_texts([("a.png", "one"), ("b.png", "two")])
+    resilience.reset_breakers()
+    assert named[0]["naming_path"] == "llm" and "llm_fallback" not in named[0]
+    assert named[1]["naming_path"] == "heuristic" and named[1]["llm_fallback"] == "error"
+
+
+def test_trim_ocr_text_keeps_title_and_informative_lines():
+    lines = ["Payment Platform Architecture", "v2"] + [f"{i} | 0.{i}" for i in range(200)] + ["Ledger service writes to Postgres"]
+    text = "\n".join(lines)
+    trimmed = llm_integration.trim_ocr_text(text, token_budget=40)
+    assert llm_integration.estimate_tokens(trimmed) <= 40 + len(trimmed.splitlines())
+    out = trimmed.splitlines()
+    assert out[0] == "Payment Platform Architecture"
+    assert "Ledger service writes to Postgres" in out
+    assert llm_integration.trim_ocr_text("short text", token_budget=40) == "short text"
+
+
+def _chunk(text):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+
+
+class _FakeStream:
+    def __init__(self, pieces):
+        self.pieces = pieces
+        self.read = 0
+        self.closed = False
+
+    def __iter__(self):
+        for piece in self.pieces:
+            self.read += 1
+            yield _chunk(piece)
+
+    def close(self):
+        self.closed = True
+
+
+def test_streamed_reply_stops_at_complete_json(monkeypatch):
+    monkeypatch.setenv("OLLAMA_MODEL", "test-model")
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    monkeypatch.delenv("LLM_STREAM", raising=False)
+    monkeypatch.setattr(llm_integration, "_HAS_OPENAI", True)
+    # the server keeps emitting whitespace after the object until max_tokens
+    stream = _FakeStream(['{"title": "Auth {', 'Flow}", "keywo', 'rds": ["oauth"]}', "\n"] + ["\n"] * 50)
+    requests = []
+
+    def create(**kwargs):
+        requests.append(kwargs)
+        return stream
+
+    fake = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    monkeypatch.setattr(llm_integration, "get_client", lambda backend: fake)
+    result = llm_integration.analyze_with_llm("x.png", "Auth Flow")
+    assert result == {"title": "Auth {Flow}", "keywords": ["oauth"]}
+    assert requests[0]["stream"] is True and requests[0]["max_tokens"] == llm_integration.DEFAULT_MAX_TOKENS
+    assert stream.read == 3 and stream.closed
@@ -0,0 +1,11 @@
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def test_cli_import_does_not_load_backends():
+    code = "import sys, src.main; print(sorted(m for m in ('openai', 'PIL', 'numpy', 'pytesseract', 'dotenv') if m in sys.modules))"
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True).stdout
+    assert out.strip() == "[]"
@@ -0,0 +1,81 @@
+import os
+
+from src.manifest import Manifest
+
+
+def _touch(path, mtime_ns):
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_diff_is_stat_based_and_follows_renames(tmp_path):
+    manifest = Manifest(tmp_path / "m.sqlite3")
+    a = tmp_path / "a.png"
+    b = tmp_path / "b.png"
+    failed = tmp_path / "failed.png"
+    for p in (a, b, failed):
+        p.write_bytes(p.name.encode() * 10)
+    manifest.record({"file": str(a), "title": "Service Mesh", "keywords": ["mesh"], "ocr_seconds": 0.4})
+    manifest.record({"file": str(b), "title": "Auth Flow", "keywords": ["auth"]})
+    manifest.record({"file": str(failed), "error": "tesseract failed"})
+
+    new = tmp_path / "new.png"
+    new.write_bytes(b"new")
+    diff = manifest.diff([a, b, failed, new])
+    assert diff.pending == [failed, new]
+    assert [p for p, _ in diff.unchanged] == [a, b]
+    assert diff.unchanged[0][1]["title"] == "Service Mesh"
+    assert "ocr_seconds" not in diff.unchanged[0][1]
+
+    # a rename keeps the inode, so the renamed file is still known, with its history
+    renamed = tmp_path / "Service Mesh [mesh] - 20240101120000.png"
+    a.rename(renamed)
+    manifest.record({"file": str(a), "title": "Service Mesh", "keywords": ["mesh"], "renamed_to": renamed.name})
+    record = manifest.lookup(renamed)
+    assert record["path"] == str(renamed)
+    assert record["renames"][0]["from"] == str(a)
+    assert manifest.diff([renamed]).unchanged
+
+    # named but never renamed: only the rename is left when renaming
+    diff = manifest.diff([b], rename=True)
+    assert [p for p, _ in diff.rename_only] == [b]
+
+
+def test_touched_files_are_hashed_and_modified_files_dispatched(tmp_path):
+    manifest = Manifest(tmp_path / "m.sqlite3")
+    a = tmp_path / "a.png"
+    b = tmp_path / "b.png"
+    a.write_bytes(b"aaaa")
+    b.write_bytes(b"bbbb")
+    for p in (a, b):
+        manifest.record({"file": str(p), "title": p.stem})
+
+    _touch(a, 1_000_000_000_000_000_000)  # same content, new mtime
+    b.write_bytes(b"cccc")  # same size, new content
+    _touch(b, 1_000_000_000_000_000_000)
+    diff = manifest.diff([a, b])
+    assert [p for p, _ in diff.unchanged] == [a]
+    assert diff.pending == [b]
+    # the new mtime of the touched file is remembered, so the next run is stat-only again
+    assert manifest.lookup(a)["mtime_ns"] == 1_000_000_000_000_000_000
+
+    manifest.close()
+    assert len(Manifest(tmp_path / "m.sqlite3")) == 2
+
+
+def test_heuristic_fallback_names_are_dispatched_again(tmp_path):
+    manifest = Manifest(tmp_path / "m.sqlite3")
+    outage = tmp_path / "outage 20261017.png"
+    named = tmp_path / "named.png"
+    for p in (outage, named):
+        p.write_bytes(p.name.encode())
+    manifest.record({"file": str(outage), "title": "outage 20261017", "naming_path": "heuristic", "llm_fallback": "deadline"})
+    manifest.record({"file": str(named), "title": "Order Flow", "naming_path": "llm"})
+    assert manifest.lookup(outage)["status"] == "fallback"
+
+    diff = manifest.diff([outage, named])
+    assert diff.pending == [outage] and diff.fallback == [outage]
+    assert [p for p, _ in diff.unchanged] == [named]
+
+    # once the LLM names it, it is done
+    manifest.record({"file": str(outage), "title": "Order Flow", "naming_path": "llm"})
+    assert manifest.diff([outage]).pending == []
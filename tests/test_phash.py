@@ -0,0 +1,107 @@
+import random
+
+from PIL import Image, ImageDraw
+
+from src.cache import ResultCache
+from src.phash import BKTree, NearDuplicateIndex, dhash, hamming, phash, reusable
+
+
+def _diagram(seed, size=(800, 500)):
+    rng = random.Random(seed)
+    img = Image.new("RGB", size, (250, 250, 250))
+    d = ImageDraw.Draw(img)
+    for _ in range(8):
+        x, y = rng.randint(0, size[0] - 200), rng.randint(0, size[1] - 100)
+        d.rectangle((x, y, x + rng.randint(80, 200), y + rng.randint(40, 100)), fill=(rng.randint(0, 200),) * 3)
+    return img
+
+
+def test_hashes_survive_resaves_and_tell_diagrams_apart(tmp_path):
+    img = _diagram(1)
+    img.save(tmp_path / "a.png")
+    img.save(tmp_path / "a.jpg", quality=70)
+    img.resize((640, 400)).save(tmp_path / "a_small.png")
+    img.crop((4, 4, 796, 496)).save(tmp_path / "a_crop.png")
+    other = _diagram(2)
+
+    ref = Image.open(tmp_path / "a.png")
+    for name in ("a.jpg", "a_small.png", "a_crop.png"):
+        near = Image.open(tmp_path / name)
+        assert hamming(phash(ref), phash(near)) <= 6, name
+        assert hamming(dhash(ref), dhash(near)) <= 12, name
+    assert hamming(phash(ref), phash(other)) > 12
+
+
+def test_bk_tree_matches_linear_scan():
+    rng = random.Random(0)
+    keys = [rng.getrandbits(64) for _ in range(500)]
+    tree = BKTree()
+    for i, k in enumerate(keys):
+        tree.add(k, i)
+    probe = keys[17] ^ 0b1011
+    expected = sorted((hamming(probe, k), i) for i, k in enumerate(keys) if hamming(probe, k) <= 10)
+    assert sorted(tree.search(probe, 10)) == expected
+    assert len(tree) == 500
+
+
+def test_index_reuses_results_across_runs_and_groups_batches(tmp_path):
+    img = _diagram(3)
+    img.save(tmp_path / "first.png")
+    img.save(tmp_path / "again.jpg", quality=80)
+    img.save(tmp_path / "third.png")
+    _diagram(4).save(tmp_path / "different.png")
+
+    cache = ResultCache(tmp_path / "c.sqlite3")
+    index = NearDuplicateIndex(cache)
+    assert index.lookup(str(tmp_path / "first.png")) is None
+    index.add(str(tmp_path / "first.png"), {"title": "Order Flow", "keywords": ["orders"], "renamed_to": "Order Flow.png", "naming_path": "llm"})
+
+    # a later run only sees the cache
+    later = NearDuplicateIndex(cache)
+    hit = later.lookup(str(tmp_path / "again.jpg"))
+    assert hit["title"] == "Order Flow" and hit["similar_to"] == "Order Flow.png"
+    assert later.lookup(str(tmp_path / "different.png")) is None
+
+    fresh = NearDuplicateIndex()
+    paths = [str(tmp_path / n) for n in ("first.png", "different.png", "third.png")]
+    fresh.prefetch(paths)
+    assert fresh.group(paths) == {paths[2]: (paths[0], 0)}
+
+
+def test_heuristic_fallback_names_are_never_reused(tmp_path):
+    img = _diagram(5)
+    img.save(tmp_path / "outage.png")
+    img.save(tmp_path / "later.png")
+    cache = ResultCache(tmp_path / "c.sqlite3")
+    index = NearDuplicateIndex(cache)
+    index.add(str(tmp_path / "outage.png"), {"title": "outage 20261017", "keywords": ["png"], "naming_path": "heuristic", "llm_fallback": "deadline"})
+    index.add(str(tmp_path / "outage.png"), {"title": "Order Flow", "keywords": [], "naming_path": "local", "llm_fallback": "error"})
+    index.add(str(tmp_path / "outage.png"), {"title": "Order Flow", "keywords": []})
+    assert index.lookup(str(tmp_path / "later.png")) is None
+    assert NearDuplicateIndex(cache).lookup(str(tmp_path / "later.png")) is None
+
+    assert reusable({"title": "Order Flow", "keywords": [], "naming_path": "llm_cache"})
+
+
+def test_batch_followers_do_not_copy_a_heuristic_leader(tmp_path, monkeypatch):
+    from src import batch, naming_engine
+    from src.main import _run_batch_sequential_naming
+
+    img = _diagram(6)
+    paths = [tmp_path / f"copy{i}.png" for i in range(3)]
+    for p in paths:
+        img.save(p)
+    monkeypatch.setattr(batch, "run_ocr_pool", lambda paths, **kw: ((str(p), "Order Flow", 0.1, None, {}) for p in paths))
+    named = []
+
+    def name(image_path, ocr_text, **kw):
+        named.append(image_path)
+        if len(named) == 1:
+            return {"title": "copy0", "keywords": [], "naming_path": "heuristic", "llm_fallback": "circuit_open"}
+        return {"title": "Order Flow", "keywords": [], "naming_path": "llm"}
+
+    monkeypatch.setattr(naming_engine, "name_from_ocr_text", name)
+    results = _run_batch_sequential_naming(paths, 1, False, False, None, False, similar=NearDuplicateIndex())
+    # the leader fell back, so its near-duplicates are named on their own
+    assert sorted(named) == sorted(str(p) for p in paths)
+    assert not any("similar_to" in r for r in results)
@@ -0,0 +1,24 @@
+from PIL import Image
+
+from src.pipeline import Pipeline
+
+
+def test_pipeline_renames_every_file_and_reports_stages(tmp_path, monkeypatch):
+    monkeypatch.delenv("OLLAMA_MODEL", raising=False)
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    paths = []
+    for i in range(4):
+        p = tmp_path / f"IMG_{i}.png"
+        Image.new("RGB", (40, 20), color=(255, 255, 255)).save(p)
+        paths.append(p)
+
+    seen = []
+    outcome = Pipeline(ocr_workers=2, llm_concurrency=2, queue_size=1, rename=True, on_result=seen.append).run(paths)
+
+    assert len(outcome["results"]) == 4 and len(seen) == 4
+    assert all("renamed_to" in r for r in outcome["results"])
+    assert len({r["renamed_to"] for r in outcome["results"]}) == 4
+    assert not any(p.exists() for p in paths)
+    for stage in ("ocr", "llm", "rename"):
+        assert outcome["stages"][stage]["items"] == 4
+        assert 0.0 <= outcome["stages"][stage]["utilization"] <= 1.0
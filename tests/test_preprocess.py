@@ -0,0 +1,41 @@
+import numpy as np
+from PIL import Image, ImageDraw, ImageEnhance, ImageOps
+
+from src.preprocess import adaptive_threshold, preprocess
+
+
+def _legacy(img):
+    proc_img = ImageEnhance.Contrast(img.convert("L")).enhance(2.0)
+    proc_img = ImageOps.autocontrast(proc_img)
+    return proc_img.point(lambda x: 255 if x > 180 else 0, mode='1')
+
+
+def _diagram(background, foreground):
+    img = Image.new("RGB", (300, 120), color=background)
+    d = ImageDraw.Draw(img)
+    d.rectangle((0, 0, 150, 120), fill=tuple(min(255, c + 40) for c in background))
+    d.text((20, 50), "Service Mesh Diagram", fill=foreground)
+    return img
+
+
+def test_fixed_matches_legacy_pil_chain():
+    for img in (_diagram((230, 230, 230), (20, 20, 20)), _diagram((30, 40, 50), (200, 200, 200))):
+        assert np.array_equal(np.asarray(preprocess(img, method="fixed")), np.asarray(_legacy(img)))
+
+
+def test_adaptive_threshold_matches_per_pixel_definition():
+    rng = np.random.default_rng(0)
+    gray = rng.integers(0, 256, size=(40, 50)).astype(np.uint8)
+    window = 7  # small window -> one-pixel blocks, so the result is exact
+    binary = adaptive_threshold(gray, method="niblack", window=window, k=-0.2)
+    padded = np.pad(gray.astype(np.float64), window // 2, mode="edge")
+    for y, x in [(0, 0), (20, 25), (39, 49)]:
+        patch = padded[y:y + window, x:x + window]
+        assert binary[y, x] == (gray[y, x] > patch.mean() - 0.2 * patch.std())
+
+
+def test_sauvola_renders_dark_theme_text_dark_on_light():
+    img = _diagram((25, 25, 35), (220, 220, 220))
+    out = np.asarray(preprocess(img, method="sauvola"))
+    # background ends up white, and some (text) pixels are black
+    assert out.mean() > 0.9 and not out.all()
@@ -0,0 +1,70 @@
+from PIL import Image, ImageDraw
+
+from src.progressive import find_band_cut, ocr_progressive, ocr_progressive_many
+from src.tesseract_pool import OCRWord
+
+
+class FakeEngine:
+    def __init__(self, conf):
+        self.conf = conf
+        self.calls = []
+
+    def recognize_words(self, img):
+        self.calls.append(("words", img.size))
+        return [OCRWord(t, self.conf, 20 + 120 * i, 20, 100, 30) for i, t in enumerate(["Payment", "Service", "Overview"])]
+
+    def recognize(self, img):
+        self.calls.append(("text", img.size))
+        return "Gateway Ledger\n"
+
+
+def _slide():
+    img = Image.new("1", (1000, 1000), 1)
+    d = ImageDraw.Draw(img)
+    # text lines every 40px, leaving blank rows between them
+    for y in range(20, 1000, 40):
+        d.rectangle((50, y, 900, y + 24), fill=0)
+    return img
+
+
+def test_band_is_cut_between_lines():
+    img = _slide()
+    cut = find_band_cut(img, 0.25)
+    assert cut >= 250
+    assert (cut - 20) % 40 >= 25  # not inside a text line
+
+
+def test_confident_band_skips_the_rest():
+    engine = FakeEngine(conf=92)
+    text, early_exit, band = ocr_progressive(_slide(), engine)
+    assert early_exit and text == "Payment Service Overview"
+    assert engine.calls == [("words", (1000, band))]
+
+
+def test_unsure_band_extends_to_the_rest_of_the_image():
+    engine = FakeEngine(conf=30)
+    text, early_exit, band = ocr_progressive(_slide(), engine)
+    assert not early_exit
+    assert text.splitlines() == ["Payment Service Overview", "Gateway Ledger"]
+    assert engine.calls[1] == ("text", (1000, 1000 - band))
+
+
+class BatchingEngine(FakeEngine):
+    batches = True
+
+    def recognize_words_many(self, imgs):
+        self.calls.append(("words_many", len(imgs)))
+        return [self.recognize_words(img) for img in imgs]
+
+    def recognize_many(self, imgs):
+        self.calls.append(("text_many", len(imgs)))
+        return [self.recognize(img) for img in imgs]
+
+
+def test_bands_and_remainders_of_several_images_share_engine_calls():
+    engine = BatchingEngine(conf=30)
+    short = Image.new("1", (300, 100), 1)
+    outcomes = ocr_progressive_many([_slide(), short, _slide()], engine)
+    assert [c for c in engine.calls if c[0].endswith("_many")] == [("words_many", 2), ("text_many", 3)]
+    assert outcomes[0] == ocr_progressive(_slide(), FakeEngine(conf=30))
+    assert outcomes[1] == ("Gateway Ledger\n", False, 100)
@@ -0,0 +1,68 @@
+import json
+import os
+
+from src import renamer
+from src.renamer import RenameJournal, Renamer, read_journal, recover, undo
+
+
+def _files(directory, *names):
+    for name in names:
+        (directory / name).write_bytes(name.encode())
+    return [directory / name for name in names]
+
+
+def test_concurrent_renamers_never_overwrite(tmp_path):
+    a, b, c = _files(tmp_path, "a.png", "b.png", "c.png")
+    # both index the directory before either renames, as two processes would
+    first, second = Renamer(), Renamer()
+    first._directory(tmp_path), second._directory(tmp_path)
+    assert first.rename(a, "Diagram.png").name == "Diagram.png"
+    assert second.rename(b, "Diagram.png").name == "Diagram_1.png"
+    assert first.rename_many([(c, "Diagram.png")])[0].name == "Diagram_2.png"
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["Diagram.png", "Diagram_1.png", "Diagram_2.png"]
+    assert (tmp_path / "Diagram_1.png").read_bytes() == b"b.png"
+
+
+def test_recovery_settles_moves_interrupted_by_a_crash(tmp_path, monkeypatch):
+    a, b, c = _files(tmp_path, "a.png", "b.png", "c.png")
+    os.link(a, tmp_path / "A.png")  # crashed between link and unlink
+    (tmp_path / "C.png").touch()  # placeholder left behind
+    journal_path = tmp_path / "renames.jsonl"
+    with open(journal_path, "w") as f:
+        for seq, (src, dst) in enumerate([(a, "A.png"), (b, "B.png"), (c, "C.png")], 1):
+            f.write(json.dumps({"run": "old", "seq": seq, "state": "intent", "src": str(src), "dst": str(tmp_path / dst), "pid": 1}) + "\n")
+        f.write('{"run": "old", "seq": 3, "sta')  # torn last line
+
+    monkeypatch.setattr(renamer, "_pid_alive", lambda pid: False)
+    settled = recover(RenameJournal(journal_path))
+    assert [m["state"] for m in settled] == ["done", "failed", "failed"]
+    assert sorted(p.name for p in tmp_path.iterdir() if p.suffix == ".png") == ["A.png", "b.png", "c.png"]
+    assert [m["state"] for m in read_journal(journal_path).values()] == ["done", "failed", "failed"]
+
+
+def test_undo_restores_the_latest_run(tmp_path):
+    a, b = _files(tmp_path, "a.png", "b.png")
+    journal_path = tmp_path / "renames.jsonl"
+    engine = Renamer(RenameJournal(journal_path))
+    engine.rename_many([(a, "Flow.png"), (b, "Flow.png")])
+    engine.close()
+    (tmp_path / "b.png").write_bytes(b"new")  # the original name of one file is taken again
+
+    assert undo(journal_path, dry_run=True)["restored"][0]["restored_to"] == str(b)
+    report = undo(journal_path)
+    assert [r["restored_to"] for r in report["restored"]] == [str(a)]
+    assert report["conflicts"][0]["file"] == str(tmp_path / "Flow_1.png")
+    assert a.read_bytes() == b"a.png" and (tmp_path / "Flow_1.png").exists()
+
+
+def test_file_already_named_keeps_its_name_reserved(tmp_path, monkeypatch):
+    flow, a, b = _files(tmp_path, "Flow.png", "a.png", "b.png")
+    engine = Renamer()
+    engine.rename(a, "Ledger.png")  # lists the directory
+    claims = []
+    real_claim = renamer.claim
+    monkeypatch.setattr(renamer, "claim", lambda src, dst: claims.append(dst.name) or real_claim(src, dst))
+    assert engine.rename(flow, "Flow.png") == flow
+    # the index still knows Flow.png is taken: no failed claim and retry
+    assert engine.rename(b, "Flow.png").name == "Flow_1.png"
+    assert claims == ["Flow_1.png"]
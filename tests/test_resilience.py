@@ -0,0 +1,150 @@
+import asyncio
+import json
+import random
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from src import llm_integration
+from src.llm_integration import AsyncLLMPool, LLMCallInfo, analyze_with_llm
+from src.naming_engine import name_from_ocr_text
+from src.resilience import CircuitBreaker, backoff_delay, breaker_stats, is_retryable, reset_breakers
+
+
+@pytest.fixture(autouse=True)
+def backends(monkeypatch):
+    monkeypatch.setenv("OLLAMA_MODEL", "local-model")
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    monkeypatch.setenv("OPENAI_MODEL", "remote-model")
+    monkeypatch.setenv("LLM_STREAM", "0")
+    monkeypatch.setenv("LLM_BREAKER_FAILURES", "2")
+    monkeypatch.setattr(llm_integration, "_HAS_OPENAI", True)
+    monkeypatch.setattr("src.resilience.BACKOFF_BASE", 0.001)
+    reset_breakers()
+    yield
+    reset_breakers()
+
+
+def _reply(title):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=json.dumps({"title": title, "keywords": []})))])
+
+
+class _Status(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def test_breaker_opens_cools_down_and_probes_once():
+    breaker = CircuitBreaker("b", failures=2, cooldown=0.05)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow() and not breaker.allow()  # a single probe while half-open
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+    assert all(0 <= backoff_delay(a, 0.5, 4.0, random.Random(a)) <= min(4.0, 0.5 * 2 ** a) for a in range(8))
+    assert is_retryable(TimeoutError()) and is_retryable(_Status(503)) and not is_retryable(_Status(401))
+    assert is_retryable(ConnectionResetError()) and is_retryable(asyncio.TimeoutError())
+    assert not is_retryable(TypeError("bad argument")) and not is_retryable(json.JSONDecodeError("bad", "", 0))
+
+
+def test_wedged_backend_is_retried_then_skipped(monkeypatch):
+    sent = []
+
+    def client(backend):
+        def create(**kwargs):
+            sent.append((backend.name, kwargs["timeout"]))
+            if backend.name == "ollama":
+                raise ConnectionError("connection refused")
+            return _reply("Service Mesh")
+        return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+    monkeypatch.setattr(llm_integration, "get_client", client)
+    info = LLMCallInfo()
+    assert analyze_with_llm("a.png", "Service Mesh", info=info)["title"] == "Service Mesh"
+    # two failures open the ollama breaker before its last retry, then openai answers
+    assert [name for name, _ in sent] == ["ollama", "ollama", "openai"]
+    assert info.backend == "openai" and info.attempts == 3 and info.fallback is None
+    assert all(0 < timeout <= 20 for _, timeout in sent)
+
+    sent.clear()
+    assert analyze_with_llm("b.png", "Service Mesh")["title"] == "Service Mesh"
+    assert [name for name, _ in sent] == ["openai"]
+    assert breaker_stats()["ollama"]["state"] == "open"
+
+
+def test_deadline_degrades_to_heuristic_naming(monkeypatch):
+    monkeypatch.setenv("LLM_DEADLINE", "0.3")
+    monkeypatch.setenv("LLM_BREAKER_FAILURES", "100")
+
+    def create(**kwargs):
+        time.sleep(kwargs["timeout"])
+        raise TimeoutError("read timed out")
+
+    monkeypatch.setattr(llm_integration, "get_client", lambda backend: SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create))))
+    start = time.monotonic()
+    named = name_from_ocr_text("c.png", "Payment Gateway\nLedger")
+    assert time.monotonic() - start < 1.0
+    assert named["naming_path"] == "heuristic" and named["llm_fallback"] == "deadline"
+    assert named["title"].startswith("Payment Gateway")
+
+    class Slow:
+        chat = SimpleNamespace(completions=SimpleNamespace(create=None))
+
+        async def create(self, **kwargs):
+            await asyncio.sleep(5)
+
+    async def run():
+        pool = AsyncLLMPool(max_in_flight=1)
+        slow = Slow()
+        slow.chat = SimpleNamespace(completions=SimpleNamespace(create=slow.create))
+        pool._client = lambda backend: slow
+        return await asyncio.gather(*(pool.analyze("text") for _ in range(3)))
+
+    start = time.monotonic()
+    outcomes = asyncio.run(run())
+    assert time.monotonic() - start < 1.0
+    assert [info.fallback for _, info in outcomes] == ["deadline"] * 3
+
+
+def test_cancelled_probe_does_not_wedge_a_half_open_breaker(monkeypatch):
+    monkeypatch.setenv("LLM_BREAKER_COOLDOWN", "0")
+    monkeypatch.setenv("OPENAI_API_KEY", "")
+    from src.resilience import breaker_for
+
+    class Client:
+        def __init__(self):
+            self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+            self.hang = True
+
+        async def create(self, **kwargs):
+            if self.hang:
+                await asyncio.sleep(5)
+            return _reply("Service Mesh")
+
+    async def run():
+        breaker = breaker_for("ollama")
+        breaker.record_failure()
+        breaker.record_failure()
+        pool = AsyncLLMPool(max_in_flight=2)
+        client = Client()
+        pool._client = lambda backend: client
+        # the half-open probe is cancelled while waiting for its reply
+        probe = asyncio.ensure_future(pool.analyze("text"))
+        await asyncio.sleep(0.05)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        client.hang = False
+        result, info = await pool.analyze("text")
+        return breaker, result, info, pool
+
+    breaker, result, info, pool = asyncio.run(run())
+    assert result["title"] == "Service Mesh" and info.fallback is None
+    assert breaker.state == "closed"
+    pool.latencies.extend([0.1] * (llm_integration.LATENCY_SAMPLES + 10))
+    assert len(pool.latencies) == llm_integration.LATENCY_SAMPLES
@@ -0,0 +1,65 @@
+import json
+
+import pytest
+
+from src.manifest import Manifest
+from src.sharding import JsonlWriter, merge_outputs, parse_shard, select_shard
+
+
+def test_shards_partition_the_inputs_stably(tmp_path):
+    paths = []
+    for i in range(40):
+        paths.append(tmp_path / f"img{i}.png")
+        paths[-1].write_bytes(b"image %d" % i)
+    for by in ("path", "content"):
+        shards = [select_shard(paths, i, 4, by=by) for i in range(1, 5)]
+        assert sorted(p for shard in shards for p in shard) == sorted(paths)
+        assert shards[0] == select_shard(paths, 1, 4, by=by)
+    assert all(select_shard(paths, i, 4, by="content") for i in range(1, 5))
+    # content shards follow a file through a rename
+    before = [i for i in range(1, 5) if select_shard(paths[:1], i, 4, by="content")]
+    moved = tmp_path / "Renamed.png"
+    paths[0].rename(moved)
+    assert [i for i in range(1, 5) if select_shard([moved], i, 4, by="content")] == before
+    assert parse_shard("2/4") == (2, 4)
+    with pytest.raises(ValueError):
+        parse_shard("0/4")
+
+
+def test_merge_combines_shard_outputs_and_manifests(tmp_path):
+    a, b = tmp_path / "a.png", tmp_path / "b.png"
+    a.write_bytes(b"a")
+    b.write_bytes(b"b")
+    first = tmp_path / "shard1.jsonl"
+    with open(first, "w") as f:
+        f.write(json.dumps({"file": str(a), "title": "Flow", "renamed_to": "Flow.png", "naming_path": "llm"}) + "\n")
+        f.write(json.dumps({"stats": {"files": 1, "elapsed_seconds": 2.0}, "shard": "1/3"}) + "\n")
+        # the resumed run skips the renamed file
+        f.write(json.dumps({"file": str(tmp_path / "Flow.png"), "skipped": "filename already matches the target format"}) + "\n")
+        f.write('{"file": "/cut/sho')
+    manifest = Manifest(tmp_path / "m2.sqlite3")
+    manifest.record({"file": str(b), "title": "Ledger", "naming_path": "local"})
+    manifest.close()
+    third = tmp_path / "shard3.json"
+    third.write_text(json.dumps({"results": [{"file": str(tmp_path / "c.png"), "error": "broken"}],
+                                 "stats": {"elapsed_seconds": 3.0}, "shard": "3/3"}, indent=2))
+
+    report = merge_outputs([first, tmp_path / "m2.sqlite3", third])
+    assert [r.get("title") for r in report["results"]] == ["Flow", "Ledger", None]
+    stats = report["stats"]
+    assert stats["files"] == 3 and stats["errors"] == 1 and stats["skipped"] == 0
+    assert stats["naming_paths"] == {"llm": 1, "local": 1}
+    assert stats["shards"] == ["1/3", "3/3"] and stats["missing_shards"] == ["2/3"]
+    assert stats["elapsed_seconds"] == 3.0
+
+
+def test_jsonl_writer_streams_each_file_once(capsys):
+    writer = JsonlWriter("2/4")
+    results = [{"file": "a.png", "title": "Flow"}, {"file": "b.png", "skipped": "unchanged"}]
+    # a stage streamed a copy of the first result, not the dict that landed in `results`
+    writer.emit(dict(results[0], naming_path="similar"))
+    writer.emit_missing(results)
+    writer.summary({"files": 2})
+    lines = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [line.get("file") for line in lines] == ["a.png", "b.png", None]
+    assert lines[-1] == {"stats": {"files": 2}, "shard": "2/4"}
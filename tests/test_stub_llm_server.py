@@ -0,0 +1,87 @@
+import json
+import random
+import urllib.error
+import urllib.request
+
+import pytest
+
+from src.llm_integration import JsonObjectScanner, build_batch_messages, build_messages, parse_batch_reply, parse_llm_json
+from src.stub_llm_server import StubConfig, StubLLMServer, parse_latency
+
+
+@pytest.fixture
+def serve():
+    servers = []
+
+    def start(**config):
+        servers.append(StubLLMServer(config=StubConfig(latency="0", seed=1, **config)).start())
+        return servers[-1]
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+def _post(server, messages, stream=False):
+    body = json.dumps({"model": "stub", "messages": messages, "stream": stream}).encode()
+    req = urllib.request.Request(f"{server.url}/chat/completions", data=body, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(req, timeout=5) as resp:
+        return resp.read().decode()
+
+
+def test_replies_follow_the_prompt(serve):
+    server = serve()
+    reply = json.loads(_post(server, build_messages("Payment Gateway Overview\nledger settlement")))
+    assert parse_llm_json(reply["choices"][0]["message"]["content"]) == {
+        "title": "Payment Gateway Overview", "keywords": ["payment", "gateway", "overview", "ledger", "settlement"]}
+
+    batch = json.loads(_post(server, build_batch_messages(["Service Mesh\nenvoy", "Order Flow"])))
+    items = parse_batch_reply(batch["choices"][0]["message"]["content"], 2)
+    assert [item["title"] for item in items] == ["Service Mesh", "Order Flow"]
+
+    # streamed as server-sent events in small pieces
+    scanner, obj = JsonObjectScanner(), None
+    for line in _post(server, build_messages("Order Flow"), stream=True).splitlines():
+        if line.startswith("data: {"):
+            obj = scanner.feed(json.loads(line[6:])["choices"][0]["delta"].get("content") or "") or obj
+    assert json.loads(obj)["title"] == "Order Flow"
+    assert server.stats.as_dict()["requests"] == 3
+
+
+def test_injected_errors_and_malformed_replies(serve):
+    failing = serve(error_rate=1.0, error_statuses=(503,))
+    with pytest.raises(urllib.error.HTTPError) as e:
+        _post(failing, build_messages("Order Flow"))
+    assert e.value.code == 503
+
+    garbled = serve(malformed_rate=1.0)
+    replies = [json.loads(_post(garbled, build_messages("Order Flow")))["choices"][0]["message"]["content"] for _ in range(6)]
+    assert all(parse_llm_json(content) is None for content in replies)
+    assert garbled.stats.as_dict()["malformed"] == 6
+
+    rng = random.Random(0)
+    assert all(0.1 <= parse_latency("uniform:0.1,0.2")(rng) <= 0.2 for _ in range(20))
+    assert parse_latency("0.25")(rng) == 0.25
+    with pytest.raises(ValueError):
+        parse_latency("gamma:1,2")
+
+
+def test_naming_through_the_stub_server(serve, monkeypatch):
+    pytest.importorskip("openai")
+    from src import resilience
+    from src.naming_engine import name_from_ocr_text
+
+    server = serve(error_rate=0.2, error_statuses=(503,))
+    monkeypatch.setenv("OLLAMA_HOST", server.url)
+    monkeypatch.setenv("OLLAMA_MODEL", "stub")
+    monkeypatch.setenv("LLM_BREAKER_FAILURES", "100")
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    monkeypatch.setattr(resilience, "BACKOFF_BASE", 0.001)
+    resilience.reset_breakers()
+    named = [name_from_ocr_text(f"{i}.png", f"Order Flow {i}\nledger") for i in range(10)]
+    resilience.reset_breakers()
+    # injected 503s are retried, streamed replies are read up to the end of the JSON object
+    assert [n["title"] for n in named] == [f"Order Flow {i}" for i in range(10)]
+    assert all(n["naming_path"] == "llm" for n in named)
+    stats = server.stats.as_dict()
+    assert stats["errors"] > 0 and stats["streamed"] == 10
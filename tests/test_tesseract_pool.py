@@ -0,0 +1,84 @@
+import sys
+
+from PIL import Image
+
+from src import image_handler, tesseract_pool
+from src.batch import run_ocr_pool
+from src.tesseract_pool import OCRWord, PipeEngine, engine_batches, parse_tsv, select_engine_name
+
+# stands in for the tesseract binary: reads the image from stdin, prints one text (or TSV word) per page
+FAKE_TESSERACT = '''#!{python}
+import io, sys
+from PIL import Image, ImageSequence
+assert sys.argv[1:3] == ["stdin", "stdout"], sys.argv
+with open({log!r}, "a") as f:
+    f.write("run\\n")
+img = Image.open(io.BytesIO(sys.stdin.buffer.read()))
+if sys.argv[-1] == "tsv":
+    sys.stdout.write("level\\tpage_num\\tblock_num\\tpar_num\\tline_num\\tword_num\\tleft\\ttop\\twidth\\theight\\tconf\\ttext\\n")
+    for n, page in enumerate(ImageSequence.Iterator(img), 1):
+        sys.stdout.write(f"5\\t{{n}}\\t1\\t1\\t1\\t1\\t0\\t0\\t10\\t10\\t90\\tW{{page.size[0]}}\\n")
+    sys.exit(0)
+for page in ImageSequence.Iterator(img):
+    sys.stdout.write(f"Page {{page.size[0]}} wide\\n\\f")
+'''
+
+
+def _fake_tesseract(tmp_path, monkeypatch):
+    log = tmp_path / "runs.log"
+    script = tmp_path / "tesseract"
+    script.write_text(FAKE_TESSERACT.format(python=sys.executable, log=str(log)))
+    script.chmod(0o755)
+    monkeypatch.setenv("TESSERACT_CMD", str(script))
+    monkeypatch.setenv("OCR_TESSERACT_ENGINE", "pipe")
+    monkeypatch.setattr(tesseract_pool, "_ENGINES", {})
+    return log
+
+
+def test_pipe_engine_sends_many_images_through_one_process(tmp_path, monkeypatch):
+    log = _fake_tesseract(tmp_path, monkeypatch)
+    engine = PipeEngine()
+    images = [Image.new("1", (w, 20), 1) for w in (30, 40, 50)]
+    assert [t.strip() for t in engine.recognize_many(images)] == ["Page 30 wide", "Page 40 wide", "Page 50 wide"]
+    assert engine.recognize(images[0]).strip() == "Page 30 wide"
+    assert engine.processes == 2 and log.read_text().count("run") == 2
+
+    # words too: pages are told apart by the TSV page numbers
+    words = engine.recognize_words_many(images + [Image.new("L", (60, 20), 255)], psm=11)
+    assert [[w.text for w in page] for page in words] == [["W30"], ["W40"], ["W50"], ["W60"]]
+    assert engine.processes == 3
+
+
+def test_engine_selection(monkeypatch):
+    monkeypatch.setenv("TESSERACT_CMD", "/nonexistent/tesseract")
+    monkeypatch.setattr(tesseract_pool, "_HAS_TESSEROCR", False)
+    assert select_engine_name("auto") is None
+    monkeypatch.setattr(tesseract_pool, "_HAS_TESSEROCR", True)
+    assert select_engine_name("auto") == "tesserocr"
+    assert select_engine_name("pipe") is None
+    assert engine_batches("auto") is False  # tesserocr keeps its models loaded instead
+
+
+def test_run_ocr_pool_batches_images_per_tesseract_process(tmp_path, monkeypatch):
+    log = _fake_tesseract(tmp_path, monkeypatch)
+    monkeypatch.setattr(image_handler, "_HAS_TESSERACT", None)
+    paths = [tmp_path / f"img{i}.png" for i in range(5)]
+    for p in paths:
+        Image.new("RGB", (60, 20), color=(255, 255, 255)).save(p)
+    results = list(run_ocr_pool(paths, workers=1, force_tesseract=True, chunk_size=5))
+    assert [r[1] for r in results] == ["Page 60 wide"] * 5
+    assert log.read_text().count("run") == 1
+
+    # progressive OCR batches its bands and remainders across the chunk as well
+    monkeypatch.setenv("OCR_PROGRESSIVE", "1")
+    results = list(run_ocr_pool(paths, workers=1, force_tesseract=True, chunk_size=5))
+    assert [r[1] for r in results] == ["Page 60 wide"] * 5
+    assert log.read_text().count("run") == 2
+
+
+def test_parse_tsv_keeps_words_only():
+    tsv = "level\tpage_num\tblock_num\tpar_num\tline_num\tword_num\tleft\ttop\twidth\theight\tconf\ttext\n" \
+          "4\t1\t1\t1\t1\t0\t10\t10\t200\t20\t-1\t\n" \
+          "5\t1\t1\t1\t1\t1\t10\t10\t80\t20\t91.5\tGateway\n" \
+          "5\t1\t1\t1\t1\t2\t95\t10\t60\t20\t88\t \n"
+    assert parse_tsv(tsv) == [OCRWord("Gateway", 91.5, 10, 10, 80, 20)]
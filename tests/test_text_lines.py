@@ -0,0 +1,41 @@
+from src.image_handler import merge_text_boxes
+from src.text_lines import group_text_lines
+
+
+def _box(x, y, w=0.08, h=0.01):
+    return ((x, y), (w, h))
+
+
+def test_groups_fragments_into_lines_top_first():
+    results = [
+        ("Mesh", _box(0.20, 0.50)),
+        ("Title", _box(0.10, 0.90)),
+        ("Service", _box(0.10, 0.505)),
+        ("Diagram", _box(0.20, 0.895)),
+    ]
+    lines = group_text_lines(results)
+    assert [l.text for l in lines] == ["Title Diagram", "Service Mesh"]
+    (x, y), (w, h) = lines[1].box
+    assert (x, y) == (0.10, 0.50) and abs(x + w - 0.28) < 1e-9 and abs(y + h - 0.515) < 1e-9
+    assert merge_text_boxes(results) == ["Title Diagram", "Service Mesh"]
+
+
+def test_closest_row_wins_for_tightly_spaced_lines():
+    results = [
+        ("lower", _box(0.10, 0.50)),
+        ("upper", _box(0.10, 0.52)),
+        ("right", _box(0.20, 0.515)),
+    ]
+    assert [l.text for l in group_text_lines(results)] == ["upper right", "lower"]
+
+
+def test_separate_columns_stay_separate():
+    results = [("Left", _box(0.05, 0.5)), ("Right", _box(0.60, 0.5))]
+    assert sorted(l.text for l in group_text_lines(results)) == ["Left", "Right"]
+
+
+def test_large_box_set():
+    results = [(f"w{i}", _box((i % 10) * 0.09, 1.0 - (i // 10) * 0.001, w=0.085, h=0.0005)) for i in range(20000)]
+    lines = group_text_lines(results, y_tolerance=0.0004, max_dist=0.01)
+    assert len(lines) == 2000
+    assert lines[0].text.split() == [f"w{i}" for i in range(10)]
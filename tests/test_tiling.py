@@ -0,0 +1,54 @@
+from PIL import Image, ImageDraw
+
+from src.tesseract_pool import OCRWord
+from src.tiling import dedupe_tile_words, estimate_text_height, plan_tiling, stitch_words, tile_boxes
+
+
+def _words_seen_by_tile(words, box):
+    """What an OCR engine would see in one tile: the words inside it, clipped at its borders."""
+    left, top, right, bottom = box
+    seen = []
+    for w in words:
+        x0, y0 = max(w.left, left), max(w.top, top)
+        x1, y1 = min(w.left + w.width, right), min(w.top + w.height, bottom)
+        if x1 > x0 and y1 > y0:
+            seen.append(w._replace(left=x0 - left, top=y0 - top, width=x1 - x0, height=y1 - y0))
+    return seen
+
+
+def test_tiles_cover_the_image_with_overlap():
+    boxes = tile_boxes((1000, 5000), 1000, 1200, 100)
+    assert boxes[0] == (0, 0, 1000, 1200) and boxes[-1][3] == 5000
+    for a, b in zip(boxes, boxes[1:]):
+        assert a[3] - b[1] >= 100
+
+
+def test_overlap_words_are_kept_once_in_reading_order():
+    size = (3000, 6000)
+    words = []
+    for row in range(0, 6000 - 40, 70):
+        for col in range(0, 3000 - 150, 180):
+            words.append(OCRWord(f"w{row}_{col}", 90.0, col + 10, row + 10, 150, 28))
+    plan = plan_tiling(size, text_height=18)
+    assert plan is not None and plan.scale == 1.0
+    boxes = tile_boxes(size, plan.tile_width, plan.tile_height, plan.overlap, plan.overlap_x)
+    assert len(boxes) > 4
+    kept = dedupe_tile_words([(b, _words_seen_by_tile(words, b)) for b in boxes], size)
+    assert sorted(w.text for w in kept) == sorted(w.text for w in words)
+
+    lines = stitch_words(kept, size).splitlines()
+    assert len(lines) == len(range(0, 6000 - 40, 70))
+    assert lines[0].split() == [w.text for w in words if w.top == 10]
+
+
+def test_small_text_on_large_images_is_not_scaled_away():
+    img = Image.new("L", (6000, 3000), 255)
+    d = ImageDraw.Draw(img)
+    for y in range(50, 3000, 40):
+        d.rectangle((100, y, 5800, y + 12), fill=0)
+    height = estimate_text_height(img)
+    assert 11 <= height <= 15
+    plan = plan_tiling(img.size, height)
+    # the normal path would scale to 2000px wide and shrink the text to ~4px
+    assert plan is not None and plan.scale == 1.0
+    assert plan_tiling((1600, 1000), 12) is None
@@ -0,0 +1,137 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from PIL import Image
+
+from src import naming_engine
+from src.watcher import Debouncer, FolderWatcher, InotifyWatcher, PollingWatcher, is_candidate
+
+
+def _wait_for(predicate, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def test_debouncer_waits_for_stable_size(tmp_path):
+    path = tmp_path / "shot.png"
+    path.write_bytes(b"x" * 10)
+    deb = Debouncer(settle=0.2)
+    deb.touch([path])
+    assert deb.ready() == []  # first look only records size and mtime
+    time.sleep(0.1)
+    with open(path, "ab") as f:  # still being written
+        f.write(b"y" * 10)
+    assert deb.ready() == []
+    assert _wait_for(lambda: deb.ready() == [path], timeout=2.0)
+    assert len(deb) == 0
+
+
+def test_is_candidate_skips_hidden_and_temporary_files(tmp_path):
+    assert is_candidate(tmp_path / "Screenshot 1.png")
+    assert not is_candidate(tmp_path / ".Screenshot 1.png")
+    assert not is_candidate(tmp_path / "download.png.crdownload")
+    assert not is_candidate(tmp_path / "notes.txt")
+
+
+def test_watchers_report_new_files(tmp_path):
+    for watcher in (InotifyWatcher(tmp_path), PollingWatcher(tmp_path, interval=0.1)):
+        path = tmp_path / f"{type(watcher).__name__}.png"
+        path.write_bytes(b"data")
+        seen = []
+        assert _wait_for(lambda: seen.extend(watcher.poll(0.2)) or path in seen, timeout=3.0)
+        watcher.close()
+
+
+def test_folder_watcher_renames_new_images_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(naming_engine, "name_from_ocr_text", lambda image_path, ocr_text, **kw: {
+        "title": "Service Mesh", "keywords": ["mesh"], "filename": image_path})
+    results = []
+    watcher = FolderWatcher(tmp_path, rename=True, workers=1, settle=0.2, on_result=results.append)
+    stop = threading.Event()
+    thread = threading.Thread(target=watcher.run, kwargs={"stop": stop})
+    thread.start()
+    try:
+        time.sleep(0.3)
+        Image.new("RGB", (20, 20), color=(255, 255, 255)).save(tmp_path / "Screenshot 1.png")
+        assert _wait_for(lambda: results)
+        time.sleep(0.5)  # the renamed file must not be picked up again
+    finally:
+        stop.set()
+        thread.join()
+    assert len(results) == 1
+    assert results[0]["renamed_to"].startswith("Service Mesh [mesh] - ")
+    assert not (tmp_path / "Screenshot 1.png").exists()
+
+
+def test_files_vanishing_before_or_during_ocr_are_dropped(tmp_path, monkeypatch):
+    from src import image_handler, watcher as watcher_module
+    from src.cache import ResultCache
+
+    monkeypatch.setattr(naming_engine, "name_from_ocr_text", lambda image_path, ocr_text, **kw: {"title": ocr_text, "keywords": []})
+    monkeypatch.setattr(image_handler, "has_ocr_backend", lambda *a: True)
+    monkeypatch.setattr(watcher_module, "_DONE_PRUNE_AT", 2)
+
+    def ocr_then_vanish(args):
+        path, _ = args
+        Path(path).unlink()  # moved away while its OCR runs
+        return path, "Service Mesh", 0.1, None, {}
+
+    monkeypatch.setattr(watcher_module, "_ocr_worker", ocr_then_vanish)
+    results = []
+    watcher = FolderWatcher(tmp_path, workers=1, cache=ResultCache(tmp_path / "c.sqlite3"), on_result=results.append)
+    first, second = tmp_path / "Screenshot 1.png", tmp_path / "Screenshot 2.png"
+    first.write_bytes(b"data")
+    second.write_bytes(b"more data")
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        watcher._submit(pool, tmp_path / "vanished.png")
+        watcher._submit(pool, first)
+        assert list(watcher._inflight.values()) == [first]
+        assert _wait_for(lambda: all(f.done() for f in watcher._inflight))
+        watcher._collect()
+        assert results == [{"file": str(first), "ocr_seconds": 0.1, "title": "Service Mesh", "keywords": []}]
+        # the second handled file brings the index to the pruning size: the vanished first goes
+        watcher._submit(pool, second)
+    assert list(watcher._done) == [second]
+
+
+def test_renames_follow_files_changed_by_others_while_watching(tmp_path, monkeypatch):
+    from src import renamer
+
+    monkeypatch.setattr(naming_engine, "name_from_ocr_text", lambda image_path, ocr_text, **kw: {"title": "Service Mesh", "keywords": []})
+    # hidden names: neither the renamed files nor the ones made by hand are picked up again
+    monkeypatch.setattr(naming_engine, "build_final_filename", lambda title, keywords, suffix: f".{title}{suffix}")
+    monkeypatch.setattr(renamer, "_DEFAULT", renamer.Renamer())
+    claims = []
+    real_claim = renamer.claim
+    monkeypatch.setattr(renamer, "claim", lambda src, dst: claims.append(dst.name) or real_claim(src, dst))
+    results = []
+    watcher = FolderWatcher(tmp_path, rename=True, workers=1, settle=0.2, on_result=results.append)
+    stop = threading.Event()
+    thread = threading.Thread(target=watcher.run, kwargs={"stop": stop})
+    thread.start()
+
+    def drop(name):
+        Image.new("RGB", (20, 20), color=(255, 255, 255)).save(tmp_path / name)
+        count = len(results) + 1
+        assert _wait_for(lambda: len(results) == count)
+        return results[-1]["renamed_to"]
+
+    try:
+        time.sleep(0.3)
+        assert drop("Screenshot 1.png") == ".Service Mesh.png"
+        # someone takes the next suggested name by hand: it is skipped without a failed claim
+        (tmp_path / ".Service Mesh_1.png").write_bytes(b"by hand")
+        assert drop("Screenshot 2.png") == ".Service Mesh_2.png"
+        # and a name freed by someone else is used again
+        (tmp_path / ".Service Mesh.png").unlink()
+        assert drop("Screenshot 3.png") == ".Service Mesh.png"
+    finally:
+        stop.set()
+        thread.join()
+    assert claims == [".Service Mesh.png", ".Service Mesh_2.png", ".Service Mesh.png"]